@@ -0,0 +1,92 @@
+"""
+Benchmark of a backtest parameter sweep on synthetic closes, run in a single process and
+across the process pool, and check of the engine against a day by day loop.
+
+    python -m benchmarks.backtest_sweep --years 10 --tickers 50 --sweep 1000
+"""
+from argparse import ArgumentParser
+from asyncio import run
+from datetime import date, timedelta
+from itertools import cycle, islice
+from time import perf_counter
+import numpy as np
+from src.analytics.backtest import Parameters, PriceMatrix, period_starts, run_backtest, run_sweep, shutdown_pool, sweep
+from src.analytics.risk import business_days
+from src.analytics.schemas import StrategyEnum
+from src.schemas import FrequencyEnum
+
+
+def synthetic_matrix(years: int, tickers: int) -> PriceMatrix:
+    rng = np.random.default_rng(0)
+    end = date(2025, 1, 1)
+    dates = business_days(end - timedelta(days=365 * years), end)
+    prices = 100 * np.exp(rng.normal(0.0002, 0.015, (len(dates), tickers)).cumsum(axis=0))
+    # a quarter of the tickers are listed later
+    listed = rng.integers(0, len(dates) // 2, tickers // 4)
+    for column, row in enumerate(listed):
+        prices[:row, column] = np.nan
+    return PriceMatrix([f"T{i:04d}" for i in range(tickers)], ["USD"] * tickers, dates, prices)
+
+
+def parameter_grid(count: int) -> list[Parameters]:
+    grid = [
+        Parameters(StrategyEnum.periodic, freq, 0.05, cost)
+        for freq in FrequencyEnum for cost in np.linspace(0, 50, 40)
+    ] + [
+        Parameters(StrategyEnum.threshold, FrequencyEnum.monthly, threshold, cost)
+        for threshold in np.linspace(0.005, 0.2, 40) for cost in np.linspace(0, 50, 20)
+    ]
+    return list(islice(cycle(grid), count))
+
+
+def naive_backtest(matrix: PriceMatrix, parameters: Parameters, capital: float) -> np.ndarray:
+    schedule = set(period_starts(matrix.dates, parameters.freq).tolist())
+    holdings, cash, started, target_weight = {}, capital, False, 0.0
+    equity = []
+    for row, closes in enumerate(matrix.prices):
+        value = cash + sum(quantity * closes[column] for column, quantity in holdings.items())
+        available = [column for column in range(len(closes)) if not np.isnan(closes[column])]
+        if parameters.strategy == StrategyEnum.threshold:
+            rebalance = not started or any(abs(quantity * closes[column] / value - target_weight) > parameters.threshold for column, quantity in holdings.items())
+        else:
+            rebalance = not started or row in schedule
+        if available and rebalance:
+            target = {column: value / len(available) / closes[column] for column in available}
+            traded = sum(abs(target[column] - holdings.get(column, 0)) * closes[column] for column in available)
+            cost = traded * parameters.cost_bps / 10_000
+            holdings = {column: quantity * (value - cost) / value for column, quantity in target.items()}
+            cash = value - cost - sum(quantity * closes[column] for column, quantity in holdings.items())
+            value = cash + sum(quantity * closes[column] for column, quantity in holdings.items())
+            started, target_weight = True, 1 / len(available)
+        equity.append(value)
+    return np.array(equity)
+
+
+async def main(years: int, tickers: int, count: int):
+    matrix = synthetic_matrix(years, tickers)
+    parameters = parameter_grid(count)
+    capital = 100_000.0
+    for item in [parameters[0], parameters[-1], Parameters(StrategyEnum.threshold, FrequencyEnum.monthly, 0.02, 10.0)]:
+        difference = np.abs(run_backtest(matrix.dates, matrix.prices, item, capital).equity - naive_backtest(matrix, item, capital)).max()
+        print(f"{item.strategy.value} {item.freq.name} threshold={item.threshold:.3f} cost={item.cost_bps:.1f}bps: max difference {difference:.2e}")
+    started = perf_counter()
+    serial = run_sweep(matrix.dates, matrix.prices, parameters, capital)
+    single = perf_counter() - started
+    # the first sweep also starts the workers
+    await sweep(matrix, parameters[:1], capital)
+    started = perf_counter()
+    parallel = await sweep(matrix, parameters, capital)
+    pooled = perf_counter() - started
+    shutdown_pool()
+    assert sorted(summary["final_equity"] for summary in serial) == sorted(summary["final_equity"] for summary in parallel)
+    print(f"{len(parameters)} backtests of {len(matrix.dates)} days x {tickers} tickers")
+    print(f"single process {single:.2f} s, process pool {pooled:.2f} s")
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--years", type=int, default=10)
+    parser.add_argument("--tickers", type=int, default=50)
+    parser.add_argument("--sweep", type=int, default=1000)
+    args = parser.parse_args()
+    run(main(args.years, args.tickers, args.sweep))
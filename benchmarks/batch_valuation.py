@@ -0,0 +1,95 @@
+"""
+Benchmark of the valuation of every portfolio from the grouped values of synthetic holdings,
+converted to a base currency and paged by market value, and check against a per portfolio loop.
+
+    python -m benchmarks.batch_valuation --portfolios 10000 --holdings 20
+"""
+from argparse import ArgumentParser
+from datetime import date, timedelta
+from time import perf_counter
+import numpy as np
+from pandas import DataFrame
+from src.fx.rates import RateMatrix
+from src.portfolios.schemas import PortfolioSummaryValuationSchema
+from src.portfolios.valuation import batch_valuation, page_by_value, to_records
+from src.prices.models import CurrencyEnum
+
+
+def synthetic_values(portfolios: int, holdings: int) -> tuple[DataFrame, DataFrame, RateMatrix]:
+    rng = np.random.default_rng(0)
+    latest, previous = date(2025, 1, 3), date(2025, 1, 2)
+    names = DataFrame({"portfolio_id": np.arange(1, portfolios + 1), "name": [f"Portfolio {i}" for i in range(portfolios)]})
+    # the holdings of each portfolio grouped by currency, a tenth of the portfolios are empty,
+    # the CHF holdings have no rate
+    rows = portfolios * 3
+    values = DataFrame({
+        "portfolio_id": rng.integers(1, portfolios * 9 // 10 + 1, rows),
+        "currency": rng.choice(np.array(["USD", "EUR", "GBP", "CHF"], dtype=object), rows, p=[0.4, 0.3, 0.25, 0.05]),
+        "market_date": [latest] * rows,
+        "previous_date": [previous] * rows,
+        "holdings": rng.integers(1, holdings, rows),
+        "market_value": rng.uniform(1_000, 1_000_000, rows)
+    })
+    values["previous_value"] = values["market_value"] * rng.normal(1, 0.01, rows)
+    rates = RateMatrix(DataFrame({
+        "currency": ["EUR", "GBP", "EUR", "GBP"],
+        "market_date": [previous, previous, latest, latest],
+        "usd_rate": [1.04, 1.25, 1.03, 1.24]
+    }))
+    return names, values, rates
+
+
+def naive_valuation(names: DataFrame, values: DataFrame, rates: RateMatrix, base: CurrencyEnum) -> dict[int, tuple[float, int]]:
+    """
+    Day change and unconverted holdings of each portfolio, one portfolio at a time.
+    """
+    factor = {
+        (currency, day): rates.factors([currency], [day], base)[0]
+        for currency in values["currency"].unique() for day in set(values["market_date"]) | set(values["previous_date"])
+    }
+    changes = {}
+    for portfolio_id in names["portfolio_id"]:
+        market_value = previous_value = 0.0
+        unconverted = 0
+        for row in values[values["portfolio_id"] == portfolio_id].itertuples():
+            market_factor, previous_factor = factor[row.currency, row.market_date], factor[row.currency, row.previous_date]
+            if np.isnan(market_factor) or np.isnan(previous_factor):
+                unconverted += row.holdings
+                continue
+            market_value += row.market_value * market_factor
+            previous_value += row.previous_value * previous_factor
+        changes[portfolio_id] = (market_value - previous_value, unconverted)
+    return changes
+
+
+def main(portfolios: int, holdings: int, limit: int):
+    names, values, rates = synthetic_values(portfolios, holdings)
+    base = CurrencyEnum.EUR
+    started = perf_counter()
+    valuation = batch_valuation(names, values, rates, base)
+    page, last = page_by_value(valuation, True, None, limit)
+    records = [PortfolioSummaryValuationSchema.model_validate(record) for record in to_records(page)]
+    elapsed = perf_counter() - started
+    seen, after = [], None
+    while True:
+        page, after = page_by_value(valuation, True, after, limit)
+        seen += page["portfolio_id"].tolist()
+        if after is None:
+            break
+    assert seen == valuation.sort_values(["market_value", "portfolio_id"], ascending=[False, True])["portfolio_id"].tolist()
+    sample = names.sample(min(200, portfolios), random_state=0)
+    naive = naive_valuation(sample, values[values["portfolio_id"].isin(sample["portfolio_id"])], rates, base)
+    indexed = valuation.set_index("portfolio_id")
+    difference = max(abs(indexed["day_change"][portfolio_id] - change) for portfolio_id, (change, _) in naive.items())
+    assert all(indexed["unconverted_holdings"][portfolio_id] == unconverted for portfolio_id, (_, unconverted) in naive.items())
+    print(f"{portfolios} portfolios, first page of {len(records)}: {elapsed * 1000:.1f} ms")
+    print(f"{len(seen)} portfolios paged, max day change difference with the loop {difference:.2e}")
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--portfolios", type=int, default=10000)
+    parser.add_argument("--holdings", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=100)
+    args = parser.parse_args()
+    main(args.portfolios, args.holdings, args.limit)
@@ -0,0 +1,61 @@
+"""
+Benchmark of the serialization of a list of positions: ORM objects validated through the
+response model and encoded by FastAPI, against tuples encoded directly with orjson.
+
+    python -m benchmarks.json_serialization --rows 1000 10000 100000
+"""
+from argparse import ArgumentParser
+from asyncio import run
+from datetime import date, timedelta
+from time import perf_counter
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+from src.positions.models import Position, TypeEnum
+from src.positions.schemas import PositionSchema
+from src.prices.models import CurrencyEnum
+from src.util import schema_columns, dump_rows
+import src.companies.models
+import src.portfolios.models
+
+
+def synthetic_rows(count: int) -> list[tuple]:
+    start = date(2000, 1, 1)
+    return [
+        (i % 10 + 1, f"T{i % 500:04d}", float(i % 100 + 1), start + timedelta(days=i % 9000), 10.0 + i % 50, CurrencyEnum.USD, TypeEnum.buy)
+        for i in range(count)
+    ]
+
+
+async def model_path(rows: list[tuple]) -> bytes:
+    field = create_model_field("Response", list[PositionSchema], mode="serialization")
+    columns = [column.key for column in schema_columns(Position, PositionSchema)]
+    positions = [Position(**dict(zip(columns, row))) for row in rows]
+    content = await serialize_response(field=field, response_content=positions)
+    return JSONResponse(content).body
+
+
+async def fast_path(rows: list[tuple]) -> bytes:
+    return dump_rows(rows, schema_columns(Position, PositionSchema))
+
+
+async def main(counts: list[int]):
+    print(f"{'rows':>8} {'model':>9} {'orjson':>9} {'speedup':>8}")
+    for count in counts:
+        rows = synthetic_rows(count)
+        timings = []
+        for path in (model_path, fast_path):
+            started = perf_counter()
+            await path(rows)
+            timings.append(perf_counter() - started)
+        print(f"{count:>8} {timings[0]:>8.3f}s {timings[1]:>8.3f}s {timings[0] / timings[1]:>7.1f}x")
+    # both paths produce the same document
+    rows = synthetic_rows(100)
+    assert (await model_path(rows)).replace(b" ", b"") == await fast_path(rows)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Serialization of a list of positions")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 100000])
+    args = parser.parse_args()
+    run(main(args.rows))
@@ -0,0 +1,90 @@
+"""
+Benchmark of the lot matching of synthetic transactions with every method, of the incremental
+recomputation after an edit, and check of the results against a naive per lot implementation.
+
+    python -m benchmarks.lot_matching --transactions 1000000 --tickers 500
+"""
+from argparse import ArgumentParser
+from collections import deque
+from datetime import date
+from time import perf_counter
+import numpy as np
+from pandas import DataFrame, bdate_range
+from src.holdings.lots import match_lots, realized_by_ticker, realized_by_year
+from src.holdings.schemas import LotMethodEnum
+from src.positions.models import TypeEnum
+
+
+def synthetic_transactions(count: int, tickers: int) -> DataFrame:
+    rng = np.random.default_rng(0)
+    market_dates = bdate_range(date(2005, 1, 1), date(2025, 1, 1))
+    transactions = DataFrame({
+        "company_ticker": rng.choice(np.array([f"T{i:04d}" for i in range(tickers)]), count),
+        "date": rng.choice(market_dates.values, count),
+        "type": rng.choice(np.array([TypeEnum.buy, TypeEnum.buy, TypeEnum.sell], dtype=object), count),
+        "quantity": rng.integers(1, 100, count).astype(float),
+        "price": np.round(rng.uniform(10, 100, count), 2)
+    })
+    return transactions.sort_values(["company_ticker", "date"], kind="stable", ignore_index=True)
+
+
+def naive_realized(transactions: DataFrame, method: LotMethodEnum) -> dict[str, float]:
+    realized, lots, averages = {}, {}, {}
+    for ticker, _, type, quantity, price in transactions.itertuples(index=False):
+        realized.setdefault(ticker, 0.0)
+        if method == LotMethodEnum.average:
+            held, cost = averages.get(ticker, (0.0, 0.0))
+            if type == TypeEnum.buy:
+                averages[ticker] = (held + quantity, cost + quantity * price)
+            else:
+                average_cost = cost / held if held > 0 else price
+                realized[ticker] += quantity * (price - average_cost)
+                averages[ticker] = (held - quantity, cost - quantity * average_cost)
+            continue
+        queue = lots.setdefault(ticker, deque())
+        if type == TypeEnum.buy:
+            queue.append([quantity, price])
+            continue
+        while quantity > 1e-9 and queue:
+            lot = queue[0] if method == LotMethodEnum.fifo else queue[-1]
+            taken = min(quantity, lot[0])
+            realized[ticker] += taken * (price - lot[1])
+            lot[0] -= taken
+            quantity -= taken
+            if lot[0] <= 1e-9:
+                queue.popleft() if method == LotMethodEnum.fifo else queue.pop()
+    return realized
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--transactions", type=int, default=1_000_000)
+    parser.add_argument("--tickers", type=int, default=500)
+    parser.add_argument("--check", type=int, default=100_000, help="transactions checked against the naive implementation")
+    args = parser.parse_args()
+
+    transactions = synthetic_transactions(args.transactions, args.tickers)
+    sample = transactions[transactions["company_ticker"].isin(transactions["company_ticker"].unique()[:max(1, args.tickers * args.check // args.transactions)])]
+    # an edit of the last transactions of one ticker
+    edited = transactions.copy()
+    last_ticker = edited["company_ticker"].iloc[-1]
+    edited_rows = edited.index[edited["company_ticker"] == last_ticker][-len(edited) // args.tickers // 10:]
+    edited.loc[edited_rows, "price"] += 1.0
+
+    print(f"{'method':>8} {'full':>8} {'by year':>8} {'edit':>8} {'max diff':>9}")
+    for method in LotMethodEnum:
+        started = perf_counter()
+        ledgers = match_lots(transactions, method)
+        full = perf_counter() - started
+        started = perf_counter()
+        realized_by_year(ledgers)
+        by_year = perf_counter() - started
+        started = perf_counter()
+        match_lots(edited, method, ledgers)
+        edit = perf_counter() - started
+        recomputed = realized_by_ticker(match_lots(edited, method)).set_index("company_ticker")["realized_pnl"]
+        assert np.allclose(realized_by_ticker(ledgers).set_index("company_ticker")["realized_pnl"], recomputed)
+        expected = naive_realized(sample, method)
+        computed = realized_by_ticker(match_lots(sample, method)).set_index("company_ticker")["realized_pnl"]
+        difference = max(abs(computed[ticker] - value) for ticker, value in expected.items())
+        print(f"{method.value:>8} {full:>8.3f} {by_year:>8.3f} {edit:>8.4f} {difference:>9.2e}")
@@ -0,0 +1,35 @@
+"""
+Offline throughput benchmark of the market data gateway using the fake provider.
+
+    python -m benchmarks.market_data_gateway --requests 2000 --tickers 500 --latency 0.05
+"""
+from argparse import ArgumentParser
+from asyncio import gather, run
+from random import Random
+from time import perf_counter
+from src.market_data.gateway import MarketDataGateway
+from src.market_data.providers import FakeProvider
+
+
+async def bench(requests: int, tickers: int, latency: float, workers: int, rate: int):
+    provider = FakeProvider(latency=latency)
+    gateway = MarketDataGateway(provider, max_workers=workers, rate=rate, period=1.0)
+    rng = Random(0)
+    symbols = [f"T{rng.randrange(tickers):05d}" for _ in range(requests)]
+    start = perf_counter()
+    await gather(*(gateway.get_info(symbol) for symbol in symbols))
+    elapsed = perf_counter() - start
+    print(f"{requests} requests over {tickers} tickers in {elapsed:.2f}s ({requests / elapsed:.0f} req/s)")
+    print(gateway.stats())
+    print(f"sequential blocking calls would take ~{requests * latency:.2f}s")
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--tickers", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--rate", type=int, default=1000)
+    args = parser.parse_args()
+    run(bench(args.requests, args.tickers, args.latency, args.workers, args.rate))
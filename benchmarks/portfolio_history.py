@@ -0,0 +1,75 @@
+"""
+Benchmark of the vectorized portfolio value series against a per day, per position loop,
+on synthetic trades and daily closes.
+
+    python -m benchmarks.portfolio_history --years 10 --tickers 500 --trades 50000
+"""
+from argparse import ArgumentParser
+from datetime import date, timedelta
+from time import perf_counter
+import numpy as np
+from pandas import DataFrame, bdate_range
+from src.portfolios.valuation import history
+from src.schemas import FrequencyEnum
+
+
+def synthetic_data(years: int, tickers: int, trades: int) -> tuple[DataFrame, DataFrame, date, date]:
+    rng = np.random.default_rng(0)
+    end = date(2025, 1, 1)
+    start = end - timedelta(days=365 * years)
+    market_dates = bdate_range(start, end)
+    symbols = np.array([f"T{i:04d}" for i in range(tickers)])
+    closes = DataFrame({
+        "market_date": np.tile(market_dates.date, tickers),
+        "company_ticker": np.repeat(symbols, len(market_dates)),
+        "close": np.exp(rng.normal(0, 0.01, tickers * len(market_dates)).cumsum())
+    })
+    trades = DataFrame({
+        "date": rng.choice(market_dates.date, trades),
+        "company_ticker": rng.choice(symbols, trades),
+        "quantity": rng.integers(1, 100, trades) * rng.choice([1, 1, -1], trades)
+    })
+    return trades, closes, start, end
+
+
+def naive_history(trades: DataFrame, closes: DataFrame, start: date, end: date) -> list[float]:
+    close_by_day = {}
+    for market_date, ticker, close in closes.itertuples(index=False):
+        close_by_day[(market_date, ticker)] = close
+    values = []
+    holdings, last_close = {}, {}
+    trades_by_day = {}
+    for trade_date, ticker, quantity in trades.itertuples(index=False):
+        trades_by_day.setdefault(trade_date, []).append((ticker, quantity))
+    day = start
+    while day <= end:
+        for ticker, quantity in trades_by_day.get(day, []):
+            holdings[ticker] = holdings.get(ticker, 0) + quantity
+        value = 0.0
+        for ticker, quantity in holdings.items():
+            if (day, ticker) in close_by_day:
+                last_close[ticker] = close_by_day[(day, ticker)]
+            value += quantity * last_close.get(ticker, 0)
+        values.append(value)
+        day += timedelta(days=1)
+    return values
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--years", type=int, default=10)
+    parser.add_argument("--tickers", type=int, default=500)
+    parser.add_argument("--trades", type=int, default=50000)
+    parser.add_argument("--naive", action="store_true", help="also time the per day, per position loop")
+    args = parser.parse_args()
+
+    trades, closes, start, end = synthetic_data(args.years, args.tickers, args.trades)
+    print(f"{len(trades)} trades, {len(closes)} closes, {args.tickers} tickers, {(end - start).days} days")
+    started = perf_counter()
+    values = history(trades, closes, start, end, FrequencyEnum.daily)
+    print(f"vectorized: {perf_counter() - started:.3f}s")
+    if args.naive:
+        started = perf_counter()
+        expected = naive_history(trades, closes, start, end)
+        print(f"naive loop: {perf_counter() - started:.3f}s")
+        print(f"max abs difference: {np.abs(values.to_numpy() - np.array(expected)).max():.6f}")
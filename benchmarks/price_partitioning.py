@@ -0,0 +1,128 @@
+"""
+Bulk ingest and range query timings of the prices layout before and after the yearly
+partitioning: a heap table with single column B-tree indexes against a table partitioned by
+year with a BRIN index on market_date. Runs against the configured database in a scratch
+schema that is dropped at the end.
+
+    python -m benchmarks.price_partitioning --years 20 --tickers 2000
+"""
+from argparse import ArgumentParser
+from asyncio import run
+from datetime import date, timedelta
+from time import perf_counter
+import numpy as np
+from pandas import bdate_range
+from sqlalchemy import text
+from src.database import engine
+
+SCHEMA = "bench_partitioning"
+COLUMNS = "company_ticker varchar(20) NOT NULL, market_date date NOT NULL, close float8 NOT NULL, currency text NOT NULL"
+
+
+def layouts(first_year: int, last_year: int) -> dict[str, list[str]]:
+    partitions = [
+        f"CREATE TABLE {SCHEMA}.partitioned_{year} PARTITION OF {SCHEMA}.partitioned "
+        f"FOR VALUES FROM ('{date(year, 1, 1)}') TO ('{date(year + 1, 1, 1)}')"
+        for year in range(first_year, last_year + 1)
+    ]
+    return {
+        "heap": [
+            f"CREATE TABLE {SCHEMA}.heap ({COLUMNS}, PRIMARY KEY (company_ticker, market_date))",
+            f"CREATE INDEX ON {SCHEMA}.heap (company_ticker)",
+            f"CREATE INDEX ON {SCHEMA}.heap (market_date)"
+        ],
+        "partitioned": [
+            f"CREATE TABLE {SCHEMA}.partitioned ({COLUMNS}, PRIMARY KEY (company_ticker, market_date)) PARTITION BY RANGE (market_date)",
+            f"CREATE INDEX ON {SCHEMA}.partitioned USING brin (market_date)",
+            *partitions
+        ]
+    }
+
+
+def queries(table: str, ticker: str, end: date) -> dict[str, tuple[str, dict]]:
+    return {
+        "ticker, 1 year": (
+            f"SELECT market_date, close FROM {SCHEMA}.{table} WHERE company_ticker = :ticker AND market_date BETWEEN :start AND :end",
+            {"ticker": ticker, "start": end - timedelta(days=365), "end": end}
+        ),
+        "ticker, all": (f"SELECT market_date, close FROM {SCHEMA}.{table} WHERE company_ticker = :ticker", {"ticker": ticker}),
+        "all, 1 month": (
+            f"SELECT company_ticker, close FROM {SCHEMA}.{table} WHERE market_date BETWEEN :start AND :end",
+            {"start": end - timedelta(days=30), "end": end}
+        ),
+        "all, latest": (
+            f"SELECT DISTINCT ON (company_ticker) company_ticker, close FROM {SCHEMA}.{table} "
+            "WHERE market_date >= :start ORDER BY company_ticker, market_date DESC",
+            {"start": end - timedelta(days=7)}
+        )
+    }
+
+
+async def ingest(table: str, market_dates: list[date], tickers: list[str]) -> float:
+    """
+    COPY the closes one year at a time, as the history ingestion writes them.
+    """
+    rng = np.random.default_rng(0)
+    elapsed = 0.0
+    async with engine.connect() as connection:
+        raw_connection = await connection.get_raw_connection()
+        for year in sorted({market_date.year for market_date in market_dates}):
+            days = [market_date for market_date in market_dates if market_date.year == year]
+            closes = rng.uniform(10, 100, len(days) * len(tickers)).tolist()
+            records = [(ticker, day, closes[i * len(days) + j], "USD") for i, ticker in enumerate(tickers) for j, day in enumerate(days)]
+            started = perf_counter()
+            await raw_connection.driver_connection.copy_records_to_table(table, schema_name=SCHEMA, records=records)
+            elapsed += perf_counter() - started
+        await connection.commit()
+        await connection.execute(text(f"ANALYZE {SCHEMA}.{table}"))
+        await connection.commit()
+    return elapsed
+
+
+async def time_query(statement: str, parameters: dict, repeat: int) -> float:
+    async with engine.connect() as connection:
+        await connection.execute(text(statement), parameters)
+        started = perf_counter()
+        for _ in range(repeat):
+            await connection.execute(text(statement), parameters)
+        return (perf_counter() - started) / repeat
+
+
+async def main(years: int, tickers: int, repeat: int):
+    end = date(2025, 1, 1)
+    market_dates = list(bdate_range(end - timedelta(days=365 * years), end).date)
+    symbols = [f"T{i:05d}" for i in range(tickers)]
+    async with engine.begin() as connection:
+        await connection.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        await connection.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        for statements in layouts(market_dates[0].year, market_dates[-1].year).values():
+            for statement in statements:
+                await connection.execute(text(statement))
+    try:
+        print(f"{len(market_dates) * tickers} rows")
+        print(f"{'':>16} {'heap':>10} {'partitioned':>12}")
+        ingests = [await ingest(table, market_dates, symbols) for table in ["heap", "partitioned"]]
+        print(f"{'bulk ingest (s)':>16} {ingests[0]:>10.2f} {ingests[1]:>12.2f}")
+        heap, partitioned = queries("heap", symbols[tickers // 2], end), queries("partitioned", symbols[tickers // 2], end)
+        for name in heap:
+            timings = [await time_query(*query[name], repeat) * 1000 for query in (heap, partitioned)]
+            print(f"{name + ' (ms)':>16} {timings[0]:>10.2f} {timings[1]:>12.2f}")
+        async with engine.connect() as connection:
+            sizes = [
+                await connection.scalar(text(f"SELECT pg_size_pretty(sum(pg_indexes_size(c.oid))) FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace WHERE n.nspname = :schema AND c.relname LIKE :table AND c.relkind = 'r'"), {"schema": SCHEMA, "table": f"{table}%"})
+                for table in ["heap", "partitioned"]
+            ]
+        print(f"{'index size':>16} {sizes[0]:>10} {sizes[1]:>12}")
+    finally:
+        async with engine.begin() as connection:
+            await connection.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+        await engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Prices layout benchmark")
+    parser.add_argument("--years", type=int, default=20)
+    parser.add_argument("--tickers", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    run(main(args.years, args.tickers, args.repeat))
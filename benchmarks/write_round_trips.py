@@ -0,0 +1,97 @@
+"""
+Database round trips of a bulk position insert with the former commit then refresh pattern
+and with a single INSERT ... RETURNING. Runs against the configured database, the rows are
+written in a scratch portfolio that is deleted at the end.
+
+    python -m benchmarks.write_round_trips --rows 1 100 10000
+"""
+from argparse import ArgumentParser
+from asyncio import run
+from datetime import date, timedelta
+from time import perf_counter
+from sqlalchemy import event, insert, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.database import engine, async_session_maker
+from src.companies.models import Company
+from src.portfolios.models import Portfolio
+from src.positions.models import Position, TypeEnum
+from src.prices.models import CurrencyEnum
+
+TICKER = "BENCH.RT"
+
+
+class RoundTrips:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args):
+        self.count += 1
+
+
+def rows(portfolio_id: int, count: int) -> list[dict]:
+    start = date(2020, 1, 1)
+    return [
+        {
+            "portfolio_id": portfolio_id, "company_ticker": TICKER, "quantity": 1.0, "date": start + timedelta(days=i),
+            "price": 10.0, "currency": CurrencyEnum.USD, "type": TypeEnum.buy
+        }
+        for i in range(count)
+    ]
+
+
+async def refresh_pattern(session: AsyncSession, values: list[dict]):
+    positions = [Position(**value) for value in values]
+    session.add_all(positions)
+    await session.commit()
+    for position in positions:
+        await session.refresh(position)
+
+
+async def returning_pattern(session: AsyncSession, values: list[dict]):
+    result = await session.scalars(insert(Position).returning(Position, sort_by_parameter_order=True), values)
+    result.all()
+    await session.commit()
+
+
+async def measure(pattern, portfolio_id: int, count: int) -> tuple[int, float]:
+    round_trips = RoundTrips()
+    values = rows(portfolio_id, count)
+    async with async_session_maker() as session:
+        event.listen(engine.sync_engine, "before_cursor_execute", round_trips)
+        event.listen(engine.sync_engine, "commit", round_trips)
+        started = perf_counter()
+        try:
+            await pattern(session, values)
+        finally:
+            elapsed = perf_counter() - started
+            event.remove(engine.sync_engine, "before_cursor_execute", round_trips)
+            event.remove(engine.sync_engine, "commit", round_trips)
+        await session.execute(delete(Position).where(Position.portfolio_id == portfolio_id))
+        await session.commit()
+    return round_trips.count, elapsed
+
+
+async def main(counts: list[int]):
+    async with async_session_maker() as session:
+        await session.execute(insert(Company).values(ticker=TICKER, name="Round trip benchmark"))
+        portfolio_id = await session.scalar(insert(Portfolio).values(name="round trip benchmark").returning(Portfolio.id))
+        await session.commit()
+    try:
+        print(f"{'rows':>8} {'pattern':>10} {'round trips':>12} {'seconds':>8}")
+        for count in counts:
+            for name, pattern in [("refresh", refresh_pattern), ("returning", returning_pattern)]:
+                round_trips, elapsed = await measure(pattern, portfolio_id, count)
+                print(f"{count:>8} {name:>10} {round_trips:>12} {elapsed:>8.3f}")
+    finally:
+        async with async_session_maker() as session:
+            await session.execute(delete(Company).where(Company.ticker == TICKER))
+            await session.execute(delete(Portfolio).where(Portfolio.id == portfolio_id))
+            await session.commit()
+        await engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Round trips of a bulk position insert")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1, 100, 10000])
+    args = parser.parse_args()
+    run(main(args.rows))
@@ -12,6 +12,10 @@ import src.portfolios.models
 import src.positions.models
 import src.companies.models
 import src.prices.models
+import src.holdings.models
+import src.jobs.models
+import src.fx.models
+import src.response_cache
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
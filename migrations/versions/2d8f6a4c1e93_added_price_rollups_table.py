@@ -0,0 +1,54 @@
+"""added price rollups table
+
+Revision ID: 2d8f6a4c1e93
+Revises: 9c3b5e1d2a47
+Create Date: 2026-10-18 11:27:43.561092
+
+The weekly and monthly rollups of the existing prices are computed here, the price writes
+keep them up to date afterwards.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2d8f6a4c1e93'
+down_revision: Union[str, None] = '9c3b5e1d2a47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('price_rollups',
+    sa.Column('company_ticker', sa.String(length=20), nullable=False),
+    sa.Column('freq', sa.Enum('daily', 'weekly', 'monthly', name='frequencyenum'), nullable=False),
+    sa.Column('period_start', sa.Date(), nullable=False),
+    sa.Column('last_date', sa.Date(), nullable=False),
+    sa.Column('open', sa.Float(), nullable=False),
+    sa.Column('high', sa.Float(), nullable=False),
+    sa.Column('low', sa.Float(), nullable=False),
+    sa.Column('close', sa.Float(), nullable=False),
+    sa.Column('mean', sa.Float(), nullable=False),
+    sa.Column('days', sa.Integer(), nullable=False),
+    sa.Column('currency', postgresql.ENUM('USD', 'EUR', 'JPY', 'GBP', 'AUD', 'CAD', 'CHF', 'CNY', 'HKD', 'NZD', 'SEK', 'SGD', 'NOK', name='currencyenum', create_type=False), nullable=False),
+    sa.ForeignKeyConstraint(['company_ticker'], ['companies.ticker'], onupdate='CASCADE', ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('company_ticker', 'freq', 'period_start')
+    )
+    for freq, unit in [('weekly', 'week'), ('monthly', 'month')]:
+        op.execute(
+            "INSERT INTO price_rollups (company_ticker, freq, period_start, last_date, open, high, low, close, mean, days, currency) "
+            f"SELECT company_ticker, '{freq}'::frequencyenum, date_trunc('{unit}', market_date)::date AS period_start, max(market_date), "
+            "(array_agg(close ORDER BY market_date))[1], max(close), min(close), (array_agg(close ORDER BY market_date DESC))[1], "
+            "avg(close), count(*), (array_agg(currency ORDER BY market_date DESC))[1] "
+            "FROM prices GROUP BY company_ticker, period_start"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('price_rollups')
+    sa.Enum(name='frequencyenum').drop(op.get_bind(), checkfirst=False)
@@ -0,0 +1,32 @@
+"""added job owners
+
+Revision ID: 5a7c3e9b1f26
+Revises: 2d8f6a4c1e93
+Create Date: 2026-10-18 14:05:12.384620
+
+The jobs left queued or running before the upgrade have no owner and are failed by the
+first process that starts.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5a7c3e9b1f26'
+down_revision: Union[str, None] = '2d8f6a4c1e93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('jobs', sa.Column('owner', sa.String(length=100), nullable=True))
+    op.add_column('jobs', sa.Column('heartbeat_at', sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('jobs', 'heartbeat_at')
+    op.drop_column('jobs', 'owner')
@@ -0,0 +1,78 @@
+"""partitioned prices by year
+
+Revision ID: 9c3b5e1d2a47
+Revises: 4e1f0c9a7d52
+Create Date: 2026-10-18 10:41:05.218734
+
+The prices are copied into a table partitioned by year on market_date, with one partition per
+year of the existing prices up to the next year and a default partition. The single column
+indexes are replaced by a BRIN index on market_date, the primary key serves the ticker lookups.
+Later years are created by src.prices.partitions.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c3b5e1d2a47'
+down_revision: Union[str, None] = '4e1f0c9a7d52'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+CURRENCY = postgresql.ENUM('USD', 'EUR', 'JPY', 'GBP', 'AUD', 'CAD', 'CHF', 'CNY', 'HKD', 'NZD', 'SEK', 'SGD', 'NOK', name='currencyenum', create_type=False)
+
+
+def price_columns() -> list:
+    return [
+        sa.Column('company_ticker', sa.String(length=20), nullable=False),
+        sa.Column('market_date', sa.Date(), nullable=False),
+        sa.Column('close', sa.Float(), nullable=False),
+        sa.Column('currency', CURRENCY, nullable=False),
+        sa.ForeignKeyConstraint(['company_ticker'], ['companies.ticker'], onupdate='CASCADE', ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('company_ticker', 'market_date')
+    ]
+
+
+def rename_old_table(name: str):
+    op.rename_table('prices', name)
+    op.execute(f"ALTER TABLE {name} RENAME CONSTRAINT prices_pkey TO {name}_pkey")
+    op.execute(f"ALTER TABLE {name} RENAME CONSTRAINT prices_company_ticker_fkey TO {name}_company_ticker_fkey")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    rename_old_table('prices_heap')
+    op.create_table('prices', *price_columns(), postgresql_partition_by='RANGE (market_date)')
+    op.create_index('ix_prices_market_date_brin', 'prices', ['market_date'], unique=False, postgresql_using='brin')
+    op.execute("CREATE TABLE prices_default PARTITION OF prices DEFAULT")
+    op.execute("""
+        DO $$
+        DECLARE
+            first_year int := COALESCE((SELECT extract(year FROM min(market_date))::int FROM prices_heap), extract(year FROM current_date)::int);
+            last_year int := extract(year FROM current_date)::int + 1;
+        BEGIN
+            FOR y IN first_year..last_year LOOP
+                EXECUTE format(
+                    'CREATE TABLE prices_%s PARTITION OF prices FOR VALUES FROM (%L) TO (%L)',
+                    y, make_date(y, 1, 1), make_date(y + 1, 1, 1)
+                );
+            END LOOP;
+        END $$
+    """)
+    op.execute("INSERT INTO prices (company_ticker, market_date, close, currency) SELECT company_ticker, market_date, close, currency FROM prices_heap ORDER BY market_date")
+    op.drop_table('prices_heap')
+    op.execute("ANALYZE prices")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    rename_old_table('prices_partitioned')
+    op.create_table('prices', *price_columns())
+    op.create_index(op.f('ix_prices_company_ticker'), 'prices', ['company_ticker'], unique=False)
+    op.create_index(op.f('ix_prices_market_date'), 'prices', ['market_date'], unique=False)
+    op.execute("INSERT INTO prices (company_ticker, market_date, close, currency) SELECT company_ticker, market_date, close, currency FROM prices_partitioned")
+    # the partitions are dropped with their parent
+    op.drop_table('prices_partitioned')
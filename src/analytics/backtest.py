@@ -0,0 +1,231 @@
+"""
+Backtests of equal weight rebalancing strategies over the date x ticker matrix of the closes of
+the tickers of a portfolio. The holdings only change on the rebalance days, so the equity of
+the days between two rebalances is computed at once as a matrix product. Parameter sweeps
+are split across a process pool.
+"""
+import os
+from asyncio import gather, get_running_loop
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from multiprocessing import get_context
+from typing import NamedTuple, Optional
+import numpy as np
+from fastapi import HTTPException
+from pandas import DataFrame
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.analytics import metrics
+from src.analytics.risk import business_days, read_closes
+from src.analytics.schemas import StrategyEnum
+from src.config import settings
+from src.fx.rates import fx_rates
+from src.portfolios.valuation import convert_closes, require_single_currency, flows_and_prices
+from src.positions.models import Position, TypeEnum
+from src.prices.models import CurrencyEnum
+from src.schemas import FrequencyEnum
+
+# days of drift checked at once by the threshold strategy
+DRIFT_BLOCK = 64
+EPSILON = 1e-9
+
+
+class Parameters(NamedTuple):
+    strategy: StrategyEnum
+    freq: FrequencyEnum
+    threshold: float
+    cost_bps: float
+
+
+class PriceMatrix(NamedTuple):
+    tickers: list[str]
+    currencies: list[Optional[str]]
+    dates: np.ndarray
+    prices: np.ndarray
+
+
+class Backtest(NamedTuple):
+    equity: np.ndarray
+    # row of every rebalance and the signed quantity traded of every ticker
+    rebalances: list[tuple[int, np.ndarray]]
+    turnover: float
+    costs: float
+
+
+def period_starts(dates: np.ndarray, freq: FrequencyEnum) -> np.ndarray:
+    """
+    Rows of the first day of every period of the sorted datetime64[D] dates.
+    """
+    days = dates.astype(np.int64)
+    if freq == FrequencyEnum.weekly:
+        # 1970-01-01 is a Thursday, the weeks start on Monday
+        keys = (days + 3) // 7
+    elif freq == FrequencyEnum.monthly:
+        keys = dates.astype("datetime64[M]").astype(np.int64)
+    else:
+        keys = days
+    return np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+
+
+def next_drift(prices: np.ndarray, row: int, holdings: np.ndarray, cash: float, threshold: float) -> int:
+    """
+    First row after row where the weight of a holding is more than threshold away from equal weight.
+    """
+    held = np.flatnonzero(holdings)
+    if not held.size:
+        return len(prices)
+    quantities, target = holdings[held], 1 / held.size
+    for start in range(row + 1, len(prices), DRIFT_BLOCK):
+        values = prices[start:start + DRIFT_BLOCK, held] * quantities
+        weights = values / (values.sum(axis=1, keepdims=True) + cash)
+        drifted = np.flatnonzero(np.abs(weights - target).max(axis=1) > threshold)
+        if drifted.size:
+            return start + int(drifted[0])
+    return len(prices)
+
+
+def run_backtest(dates: np.ndarray, prices: np.ndarray, parameters: Parameters, capital: float) -> Backtest:
+    """
+    Equal weight the tickers with a close on every rebalance day, starting on the first day with
+    a close. The costs, in basis points of the value traded, are paid from the equity before buying.
+    """
+    equity = np.full(len(dates), float(capital))
+    available = ~np.isnan(prices)
+    started = np.flatnonzero(available.any(axis=1))
+    if not started.size:
+        return Backtest(equity, [], 0.0, 0.0)
+    schedule = period_starts(dates, parameters.freq)
+    holdings, cash = np.zeros(prices.shape[1]), float(capital)
+    rebalances, turnover, costs = [], 0.0, 0.0
+    row = int(started[0])
+    while row < len(dates):
+        columns = np.flatnonzero(available[row])
+        closes = prices[row, columns]
+        value = cash + closes @ holdings[columns]
+        target = np.zeros_like(holdings)
+        target[columns] = value / columns.size / closes
+        traded = float(np.abs(target[columns] - holdings[columns]) @ closes)
+        # the cost of the trades to the full target, slightly above the cost of the trades made
+        cost = traded * parameters.cost_bps / 10_000
+        target[columns] *= (value - cost) / value
+        rebalances.append((row, target - holdings))
+        turnover, costs = turnover + traded, costs + cost
+        holdings, cash = target, value - cost - target[columns] @ closes
+        if parameters.strategy == StrategyEnum.threshold:
+            following = next_drift(prices, row, holdings, cash, parameters.threshold)
+        else:
+            index = np.searchsorted(schedule, row, side="right")
+            following = int(schedule[index]) if index < len(schedule) else len(dates)
+        held = np.flatnonzero(holdings)
+        equity[row:following] = cash + prices[row:following, held] @ holdings[held]
+        row = following
+    return Backtest(equity, rebalances, turnover, costs)
+
+
+def summarize(backtest: Backtest, parameters: Parameters, capital: float) -> dict:
+    returns = metrics.log_returns(backtest.equity)
+    return {
+        "parameters": parameters._asdict(),
+        "final_equity": float(backtest.equity[-1]) if len(backtest.equity) else capital,
+        "total_return": float(backtest.equity[-1] / capital - 1) if len(backtest.equity) else 0.0,
+        "annualized_return": metrics.annualized_return(returns),
+        "annualized_volatility": metrics.annualized_volatility(returns),
+        "max_drawdown": metrics.max_drawdown(returns),
+        "sharpe": metrics.sharpe_ratio(returns, settings.risk_free_rate),
+        "rebalances": len(backtest.rebalances),
+        "turnover": backtest.turnover,
+        "costs": backtest.costs
+    }
+
+
+def trade_list(backtest: Backtest, matrix: PriceMatrix, portfolio_id: int) -> list[dict]:
+    """
+    Trades of the rebalances as positions of the portfolio.
+    """
+    trades = []
+    for row, delta in backtest.rebalances:
+        market_date = matrix.dates[row].item()
+        for column in np.flatnonzero(np.abs(delta) > EPSILON):
+            trades.append({
+                "portfolio_id": portfolio_id,
+                "company_ticker": matrix.tickers[column],
+                "quantity": float(abs(delta[column])),
+                "date": market_date,
+                "price": float(matrix.prices[row, column]),
+                "currency": matrix.currencies[column],
+                "type": TypeEnum.buy if delta[column] > 0 else TypeEnum.sell
+            })
+    return trades
+
+
+def run_sweep(dates: np.ndarray, prices: np.ndarray, parameters: list[Parameters], capital: float) -> list[dict]:
+    return [summarize(run_backtest(dates, prices, item, capital), item, capital) for item in parameters]
+
+
+pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global pool
+    if pool is None:
+        # spawned workers do not inherit the event loop and the connections of the app
+        pool = ProcessPoolExecutor(settings.backtest_workers, mp_context=get_context("spawn"))
+    return pool
+
+
+def shutdown_pool():
+    global pool
+    if pool is not None:
+        pool.shutdown(cancel_futures=True)
+        pool = None
+
+
+async def backtest_in_pool(matrix: PriceMatrix, parameters: Parameters, capital: float) -> Backtest:
+    """
+    Run a single backtest in the process pool, off the event loop.
+    """
+    return await get_running_loop().run_in_executor(get_pool(), run_backtest, matrix.dates, matrix.prices, parameters, capital)
+
+
+async def sweep(matrix: PriceMatrix, parameters: list[Parameters], capital: float) -> list[dict]:
+    """
+    Run the backtests of every parameter set, split in chunks across the process pool,
+    sorted by decreasing Sharpe ratio.
+    """
+    executor = get_pool()
+    workers = settings.backtest_workers or os.cpu_count() or 1
+    chunks = np.array_split(np.arange(len(parameters)), min(len(parameters), workers * 4))
+    loop = get_running_loop()
+    results = await gather(*(
+        loop.run_in_executor(executor, run_sweep, matrix.dates, matrix.prices, [parameters[i] for i in chunk], capital)
+        for chunk in chunks
+    ))
+    summaries = [summary for result in results for summary in result]
+    return sorted(summaries, key=lambda summary: (summary["sharpe"] is None, -(summary["sharpe"] or 0)))
+
+
+async def load_matrix(session: AsyncSession, portfolio_id: int, start: Optional[date], end: Optional[date], base: Optional[CurrencyEnum]) -> PriceMatrix:
+    """
+    Forward filled closes of the tickers of a portfolio on the business days between start and end,
+    by default over the last backtest_lookback_days days. Closes in more than one currency need a base.
+    """
+    end = end or date.today()
+    start = start or end - timedelta(days=settings.backtest_lookback_days)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    tickers = (await session.scalars(select(Position.company_ticker).where(Position.portfolio_id == portfolio_id).distinct())).all()
+    if not tickers:
+        raise HTTPException(status_code=404, detail="Positions not found for the given portfolio ID")
+    closes = await read_closes(session, list(tickers), start, end)
+    if base is not None:
+        closes = convert_closes(closes, await fx_rates.get(session), base)
+        closes["currency"] = base
+    else:
+        require_single_currency(closes)
+    dates = business_days(start, end)
+    if not len(dates):
+        raise HTTPException(status_code=400, detail="No business day between start and end")
+    no_trades = DataFrame({"date": [], "company_ticker": [], "quantity": []})
+    columns, _, prices = flows_and_prices(no_trades, closes, dates)
+    currencies = closes.groupby("company_ticker")["currency"].last()
+    return PriceMatrix(columns.tolist(), [getattr(currencies.get(ticker), "value", currencies.get(ticker)) for ticker in columns], dates, prices)
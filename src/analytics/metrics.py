@@ -0,0 +1,113 @@
+"""
+Risk metrics computed on whole arrays of daily returns, without loops over the days.
+"""
+from typing import Optional
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+TRADING_DAYS = 252
+
+
+def log_returns(closes: np.ndarray) -> np.ndarray:
+    """
+    Daily log returns of the columns of an array of closes, NaN where a close is missing or not positive.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        logs = np.log(np.where(closes > 0, closes, np.nan))
+    return np.diff(logs, axis=0)
+
+
+def flow_adjusted_returns(values: np.ndarray, flows: np.ndarray) -> np.ndarray:
+    """
+    Daily log returns of a portfolio, net of the value bought or sold on each day, so that
+    deposits are not counted as performance. NaN while the portfolio is empty.
+    """
+    previous = values[:-1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        simple = np.where(previous > 0, (values[1:] - flows[1:]) / previous - 1, np.nan)
+        return np.log1p(np.where(simple > -1, simple, np.nan))
+
+
+def annualized_return(returns: np.ndarray) -> Optional[float]:
+    return finite(np.nanmean(returns) * TRADING_DAYS) if count(returns) else None
+
+
+def annualized_volatility(returns: np.ndarray) -> Optional[float]:
+    return finite(np.nanstd(returns, ddof=1) * np.sqrt(TRADING_DAYS)) if count(returns) > 1 else None
+
+
+def rolling_volatility(returns: np.ndarray, window: int) -> np.ndarray:
+    """
+    Annualized volatility of each window of returns, aligned with the last day of the window.
+    """
+    if len(returns) < window:
+        return np.empty(0)
+    windows = sliding_window_view(returns, window)
+    valid = np.sum(~np.isnan(windows), axis=1)
+    with np.errstate(invalid="ignore"):
+        deviations = np.nanstd(windows, axis=1, ddof=1)
+    return np.where(valid > 1, deviations, np.nan) * np.sqrt(TRADING_DAYS)
+
+
+def max_drawdown(returns: np.ndarray) -> Optional[float]:
+    """
+    Largest fall from a peak of the wealth index built from the log returns, as a negative fraction.
+    """
+    if not count(returns):
+        return None
+    wealth = np.exp(np.cumsum(np.nan_to_num(returns)))
+    peaks = np.maximum.accumulate(np.r_[1.0, wealth])[1:]
+    return finite(np.min(np.minimum(wealth / peaks - 1, 0)))
+
+
+def sharpe_ratio(returns: np.ndarray, risk_free_rate: float) -> Optional[float]:
+    excess = returns - risk_free_rate / TRADING_DAYS
+    if count(excess) < 2:
+        return None
+    return finite(np.nanmean(excess) / np.nanstd(excess, ddof=1) * np.sqrt(TRADING_DAYS))
+
+
+def sortino_ratio(returns: np.ndarray, risk_free_rate: float) -> Optional[float]:
+    excess = returns - risk_free_rate / TRADING_DAYS
+    if count(excess) < 2:
+        return None
+    downside = np.sqrt(np.nanmean(np.minimum(excess, 0) ** 2))
+    return finite(np.nanmean(excess) / downside * np.sqrt(TRADING_DAYS))
+
+
+def beta(returns: np.ndarray, benchmark_returns: np.ndarray) -> Optional[float]:
+    """
+    Slope of the returns against the benchmark returns, on the days both are known.
+    """
+    both = ~np.isnan(returns) & ~np.isnan(benchmark_returns)
+    if both.sum() < 2:
+        return None
+    covariance = np.cov(returns[both], benchmark_returns[both], ddof=1)
+    return finite(covariance[0, 1] / covariance[1, 1])
+
+
+def correlation_matrix(returns: np.ndarray, min_periods: int = 20) -> np.ndarray:
+    """
+    Pairwise correlation of the columns of the returns, each pair on the days both are known.
+    NaN for the pairs with fewer than min_periods common days.
+    """
+    known = (~np.isnan(returns)).astype(float)
+    values = np.nan_to_num(returns)
+    # sums over the common days of every pair, as matrix products
+    n = known.T @ known
+    sum_x = values.T @ known
+    sum_xx = (values ** 2).T @ known
+    sum_xy = values.T @ values
+    with np.errstate(divide="ignore", invalid="ignore"):
+        covariance = sum_xy - sum_x * sum_x.T / n
+        correlation = covariance / np.sqrt((sum_xx - sum_x ** 2 / n) * (sum_xx - sum_x ** 2 / n).T)
+    correlation[n < min_periods] = np.nan
+    return np.clip(correlation, -1, 1)
+
+
+def count(values: np.ndarray) -> int:
+    return int(np.sum(~np.isnan(values)))
+
+
+def finite(value: float) -> Optional[float]:
+    return float(value) if np.isfinite(value) else None
@@ -0,0 +1,129 @@
+"""
+Risk metrics of companies and portfolios, built from the prices table on business days
+(a holiday carries the previous close). The closes are read from the local price store once
+it is synced, from the database before. The results are cached until prices are written
+again and, for portfolios, until a position changes.
+"""
+from datetime import date, timedelta
+from typing import Hashable, Optional
+import numpy as np
+from fastapi import HTTPException
+from pandas import DataFrame, bdate_range
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.analytics import metrics
+from src.config import settings
+from src.fx.rates import fx_rates
+from src.portfolios.valuation import load_trades, load_closes, convert_closes, require_single_currency, flows_and_prices
+from src.prices.models import CurrencyEnum
+from src.prices.store import price_store
+from src.response_cache import MemoryBackend, response_cache
+
+risk_cache = MemoryBackend(settings.risk_cache_size)
+
+
+def business_days(start: date, end: date) -> np.ndarray:
+    return bdate_range(start, end).values.astype("datetime64[D]")
+
+
+def to_list(values: np.ndarray) -> list[Optional[float]]:
+    return np.where(np.isnan(values), None, values).tolist()
+
+
+def risk_metrics(dates: np.ndarray, returns: np.ndarray, benchmark_returns: Optional[np.ndarray], window: int) -> dict:
+    """
+    Metrics of the daily log returns, returns[i] being the return from dates[i] to dates[i + 1].
+    """
+    rolling = metrics.rolling_volatility(returns, window)
+    return_dates = dates[1:]
+    return {
+        "start": dates[0].item(),
+        "end": dates[-1].item(),
+        "observations": metrics.count(returns),
+        "annualized_return": metrics.annualized_return(returns),
+        "annualized_volatility": metrics.annualized_volatility(returns),
+        "max_drawdown": metrics.max_drawdown(returns),
+        "sharpe": metrics.sharpe_ratio(returns, settings.risk_free_rate),
+        "sortino": metrics.sortino_ratio(returns, settings.risk_free_rate),
+        "benchmark": settings.risk_benchmark_ticker,
+        "beta": None if benchmark_returns is None else metrics.beta(returns, benchmark_returns),
+        "dates": return_dates.tolist(),
+        "log_returns": to_list(returns),
+        "rolling_volatility": {"window": window, "dates": return_dates[window - 1:].tolist(), "values": to_list(rolling)}
+    }
+
+
+async def read_closes(session: AsyncSession, tickers: list[str], start: date, end: date) -> DataFrame:
+    if price_store.ready:
+        return await price_store.closes(session, tickers, start, end)
+    return await load_closes(session, tickers, start, end)
+
+
+def cached(key: Hashable, version: Hashable) -> Optional[dict]:
+    entry = risk_cache.get(key)
+    return entry[1] if entry is not None and entry[0] == version else None
+
+
+def default_range(start: Optional[date], end: Optional[date]) -> tuple[date, date]:
+    end = end or date.today()
+    start = start or end - timedelta(days=settings.risk_lookback_days)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    return start, end
+
+
+async def company_risk(session: AsyncSession, company_ticker: str, start: Optional[date], end: Optional[date], window: int) -> dict:
+    start, end = default_range(start, end)
+    key = ("company", company_ticker, start, end, window)
+    version = tuple((await response_cache.versions(session, ["prices"])).values())
+    if (result := cached(key, version)) is not None:
+        return result
+    benchmark = settings.risk_benchmark_ticker
+    closes = await read_closes(session, list({company_ticker, benchmark}), start, end)
+    dates = business_days(start, end)
+    no_trades = DataFrame({"date": [], "company_ticker": [], "quantity": []})
+    tickers, _, prices = flows_and_prices(no_trades, closes, dates)
+    if company_ticker not in tickers:
+        raise HTTPException(status_code=404, detail="Price not found")
+    returns = metrics.log_returns(prices)
+    benchmark_returns = returns[:, tickers.get_loc(benchmark)] if benchmark in tickers else None
+    result = {"company_ticker": company_ticker, **risk_metrics(dates, returns[:, tickers.get_loc(company_ticker)], benchmark_returns, window)}
+    risk_cache.set(key, (version, result))
+    return result
+
+
+async def portfolio_risk(
+    session: AsyncSession, portfolio_id: int, start: Optional[date], end: Optional[date], window: int, base: Optional[CurrencyEnum]
+) -> dict:
+    end = end or date.today()
+    key = ("portfolio", portfolio_id, start, end, window, base)
+    version = tuple((await response_cache.versions(session, ["positions", "prices", "fx_rates"])).values())
+    if (result := cached(key, version)) is not None:
+        return result
+    trades = await load_trades(session, portfolio_id)
+    if trades.empty:
+        raise HTTPException(status_code=404, detail="Positions not found for the given portfolio ID")
+    start, end = default_range(start or max(trades["date"].min(), end - timedelta(days=settings.risk_lookback_days)), end)
+    benchmark = settings.risk_benchmark_ticker
+    closes = await read_closes(session, list(set(trades["company_ticker"]) | {benchmark}), start, end)
+    if base is not None:
+        closes = convert_closes(closes, await fx_rates.get(session), base, strict=True)
+    else:
+        require_single_currency(closes[closes["company_ticker"] != benchmark])
+    dates = business_days(start, end)
+    tickers, flows, prices = flows_and_prices(trades, closes, dates)
+    holdings = np.cumsum(flows, axis=0)
+    values = np.nansum(holdings * prices, axis=1)
+    traded = np.nansum(flows * prices, axis=1)
+    returns = metrics.flow_adjusted_returns(values, traded)
+    ticker_returns = metrics.log_returns(prices)
+    benchmark_returns = ticker_returns[:, tickers.get_loc(benchmark)] if benchmark in tickers else None
+    held = ~np.isclose(holdings[-1], 0)
+    correlation = metrics.correlation_matrix(ticker_returns[:, held])
+    result = {
+        "portfolio_id": portfolio_id,
+        "base": base,
+        **risk_metrics(dates, returns, benchmark_returns, window),
+        "correlation": {"tickers": tickers[held].tolist(), "matrix": [to_list(row) for row in correlation]}
+    }
+    risk_cache.set(key, (version, result))
+    return result
@@ -0,0 +1,123 @@
+from datetime import date
+from enum import Enum as pyEnum
+from typing import Optional
+from pydantic import Field
+from src.config import settings
+from src.schemas import CustomModel, FrequencyEnum
+from src.positions.schemas import PositionSchema
+from src.prices.models import CurrencyEnum
+
+class RollingVolatilitySchema(CustomModel):
+    """
+    Schema for the rolling annualized volatility, as parallel arrays.
+    """
+    window: int = Field(..., description="Number of daily returns of each window")
+    dates: list[date] = Field(..., description="Last day of each window")
+    values: list[Optional[float]] = Field(..., description="Annualized volatility of each window")
+
+class RiskMetricsSchema(CustomModel):
+    """
+    Schema for the risk metrics of a series of daily closes or values.
+    """
+    start: date = Field(..., description="First day of the series")
+    end: date = Field(..., description="Last day of the series")
+    observations: int = Field(..., description="Number of daily returns")
+    annualized_return: Optional[float] = Field(None, description="Mean daily log return times 252")
+    annualized_volatility: Optional[float] = Field(None, description="Standard deviation of the daily log returns times sqrt(252)")
+    max_drawdown: Optional[float] = Field(None, description="Largest fall from a peak, as a negative fraction")
+    sharpe: Optional[float] = Field(None, description="Annualized Sharpe ratio over the risk free rate")
+    sortino: Optional[float] = Field(None, description="Annualized Sortino ratio over the risk free rate")
+    benchmark: str = Field(..., description="Ticker of the benchmark")
+    beta: Optional[float] = Field(None, description="Beta against the benchmark, None without benchmark prices")
+    dates: list[date] = Field(..., description="Day of each daily return")
+    log_returns: list[Optional[float]] = Field(..., description="Daily log returns")
+    rolling_volatility: RollingVolatilitySchema
+
+class CompanyRiskSchema(RiskMetricsSchema):
+    """
+    Schema for the risk metrics of a company.
+    """
+    company_ticker: str = Field(..., description="Ticker of the company")
+
+class CorrelationSchema(CustomModel):
+    """
+    Schema for the correlation matrix of the daily returns of the holdings.
+    """
+    tickers: list[str] = Field(..., description="Tickers of the rows and of the columns")
+    matrix: list[list[Optional[float]]] = Field(..., description="Correlation of each pair, None with too few common days")
+
+class PortfolioRiskSchema(RiskMetricsSchema):
+    """
+    Schema for the risk metrics of a portfolio, computed on its value net of trades.
+    """
+    portfolio_id: int = Field(..., description="ID of the portfolio")
+    base: Optional[CurrencyEnum] = Field(None, description="Currency the values are converted to, None when they are not converted")
+    correlation: CorrelationSchema
+
+class StrategyEnum(str, pyEnum):
+    periodic = "periodic"
+    threshold = "threshold"
+
+class BacktestParametersSchema(CustomModel):
+    """
+    Schema for the parameters of an equal weight rebalancing strategy.
+    """
+    strategy: StrategyEnum = Field(..., description="periodic rebalances on the first day of every period, threshold when a weight drifts too far")
+    freq: FrequencyEnum = Field(FrequencyEnum.monthly, description="Rebalance frequency of the periodic strategy")
+    threshold: float = Field(0.05, description="Drift of a weight from equal weight triggering a rebalance, threshold strategy only", gt=0, lt=1)
+    cost_bps: float = Field(0, description="Cost of the trades in basis points of the value traded", ge=0, le=1000)
+
+class BacktestRangeSchema(CustomModel):
+    """
+    Schema for the history and the capital of a backtest.
+    """
+    start: Optional[date] = Field(None, description="First day, defaults to backtest_lookback_days days before end")
+    end: Optional[date] = Field(None, description="Last day, defaults to today")
+    capital: float = Field(100_000, description="Initial capital", gt=0)
+    base: Optional[CurrencyEnum] = Field(None, description="Currency the closes are converted to, None to use them as they are when they are all in one currency")
+
+class BacktestSchema(BacktestRangeSchema, BacktestParametersSchema):
+    """
+    Schema for a backtest of a strategy over the tickers of a portfolio.
+    """
+
+class BacktestSweepSchema(BacktestRangeSchema):
+    """
+    Schema for the backtests of several parameter sets over the same history.
+    """
+    parameters: list[BacktestParametersSchema] = Field(..., min_length=1, max_length=settings.backtest_max_sweep)
+
+class BacktestSummarySchema(CustomModel):
+    """
+    Schema for the performance of a backtest.
+    """
+    parameters: BacktestParametersSchema
+    final_equity: float = Field(..., description="Equity on the last day")
+    total_return: float = Field(..., description="Final equity over the capital, minus one")
+    annualized_return: Optional[float] = Field(None, description="Mean daily log return times 252")
+    annualized_volatility: Optional[float] = Field(None, description="Standard deviation of the daily log returns times sqrt(252)")
+    max_drawdown: Optional[float] = Field(None, description="Largest fall from a peak, as a negative fraction")
+    sharpe: Optional[float] = Field(None, description="Annualized Sharpe ratio over the risk free rate")
+    rebalances: int = Field(..., description="Number of rebalances")
+    turnover: float = Field(..., description="Value traded")
+    costs: float = Field(..., description="Costs paid")
+
+class BacktestResultSchema(BacktestSummarySchema):
+    """
+    Schema for a backtest with its equity curve and its trades.
+    """
+    portfolio_id: int = Field(..., description="ID of the portfolio")
+    base: Optional[CurrencyEnum] = Field(None, description="Currency the values are converted to, None when they are not converted")
+    dates: list[date] = Field(..., description="Business days of the backtest")
+    equity: list[float] = Field(..., description="Equity of each day")
+    trades: list[PositionSchema] = Field(..., description="Trades of the rebalances, as positions of the portfolio")
+
+class BacktestSweepResultSchema(CustomModel):
+    """
+    Schema for the backtests of a sweep, by decreasing Sharpe ratio.
+    """
+    portfolio_id: int = Field(..., description="ID of the portfolio")
+    base: Optional[CurrencyEnum] = Field(None, description="Currency the values are converted to, None when they are not converted")
+    start: date = Field(..., description="First day of the backtests")
+    end: date = Field(..., description="Last day of the backtests")
+    results: list[BacktestSummarySchema]
@@ -1,23 +1,67 @@
+from asyncio import create_task
+from datetime import date
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from uvicorn import run
+from src.config import settings
+from src.database import async_session_maker, engines_stats
+from src.schemas import PoolStatsSchema
 from src.companies.routers import router as companies_router
 from src.portfolios.routers import router as portfolios_router
 from src.positions.routers import router as positions_router
 from src.prices.routers import router as prices_router
+from src.holdings.routers import router as holdings_router
+from src.jobs.routers import router as jobs_router
+from src.fx.routers import router as fx_router
 from src.companies.models import Company
 from src.portfolios.models import Portfolio
 from src.positions.models import Position
 from src.prices.models import Price
+from src.holdings.models import Holding
+from src.jobs.models import Job
+from src.fx.models import FxRate
+from src.jobs.queue import job_queue
+from src.prices.refresh import schedule_price_refresh
+from src.prices.cache import latest_prices
+from src.prices.partitions import price_partitions
+from src.analytics.backtest import shutdown_pool
 
-app = FastAPI(title='Portfolio_monitor_api', version='0.1.0')
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    tasks = []
+    if settings.price_refresh_at is not None:
+        tasks.append(create_task(schedule_price_refresh(settings.price_refresh_at)))
+    await job_queue.start()
+    # the partitions of the coming year exist before its first refresh
+    today = date.today()
+    await price_partitions.ensure([today.year, today.year + 1])
+    async with async_session_maker() as session:
+        await latest_prices.warm(session)
+    yield
+    await job_queue.stop()
+    shutdown_pool()
+    for task in tasks:
+        task.cancel()
+
+app = FastAPI(title='Portfolio_monitor_api', version='0.1.0', lifespan=lifespan)
 app.include_router(companies_router)
 app.include_router(portfolios_router)
 app.include_router(positions_router)
 app.include_router(prices_router)
+app.include_router(holdings_router)
+app.include_router(jobs_router)
+app.include_router(fx_router)
 
 @app.get("/")
 async def root():
     return {"message": "Hello World"}
 
+@app.get("/db/pool", response_model=list[PoolStatsSchema])
+async def get_pool_stats():
+    """
+    Get the connection pool metrics of the database engines.
+    """
+    return engines_stats()
+
 if __name__ == '__main__':
     run(app, port='8000', host='127.0.0.1')
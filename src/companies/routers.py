@@ -1,13 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import select, delete
+from asyncio import gather
+from datetime import date
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy import select, delete, insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
-from yfinance import Ticker
-from src.database import get_async_session
-from src.util import get_or_404, get_responses
+from src.database import get_async_session, get_read_session
+from src.prices.cache import latest_prices
+from src.response_cache import response_cache
+from src.prices.store import ALL_YEARS
+from src.analytics.risk import company_risk
+from src.analytics.schemas import CompanyRiskSchema
+from src.config import settings
+from src.util import get_or_404, update_or_404, get_responses, get_page, after_cursor, stream_rows, schema_columns, dump_rows
+from src.schemas import ListFormatEnum
 from src.companies.models import Company
-from src.companies.schemas import CompanySchema, CompanyUpdateSchema
-from src.yfinance_cache import session as yfSession
+from src.companies.schemas import CompanySchema, CompanyUpdateSchema, CompanyBulkResultSchema, BulkStatusEnum
+from src.market_data.gateway import gateway
+from src.jobs.queue import job_queue, Progress
+from src.jobs.schemas import JobSchema
 
 router = APIRouter(
     prefix="/companies",
@@ -16,74 +27,174 @@ router = APIRouter(
 
 responses = get_responses(Company)
 
-@router.get("/", response_model=list[CompanySchema])
-async def get_companies(session: AsyncSession = Depends(get_async_session)):
+@router.get("/", response_model=list[CompanySchema], responses={k: responses[k] for k in [200, 400, 422]})
+async def get_companies(
+    request: Request,
+    sector: Optional[str] = None,
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor header of the previous page"),
+    limit: int = Query(100, gt=0, le=1000),
+    format: ListFormatEnum = ListFormatEnum.json,
+    fast: bool = Query(False, description="Serialize the rows directly with orjson, skipping the response model validation"),
+    session: AsyncSession = Depends(get_read_session)
+):
     """
-    Get all companies.
+    Get companies ordered by ticker, one page at a time.
+    With the ndjson and csv formats all the matching companies are streamed instead.
+    JSON pages are cached until a company changes and carry an ETag.
     """
-    result = await session.scalars(select(Company))
-    companies = result.fetchall()
-    return companies
+    keys = [Company.ticker]
+    filters = [] if sector is None else [Company.sector == sector]
+    if format != ListFormatEnum.json:
+        query = select(Company.ticker, Company.name, Company.sector).where(*filters)
+        return stream_rows(after_cursor(query, keys, cursor), format)
+    if fast:
+        columns = schema_columns(Company, CompanySchema)
+
+        async def build(response: Response) -> bytes:
+            return dump_rows(await get_page(session, select(*columns).where(*filters), keys, cursor, limit, response), columns)
+
+        return await response_cache.respond(request, session, ["companies"], None, build)
+    return await response_cache.respond(
+        request, session, ["companies"], list[CompanySchema],
+        lambda response: get_page(session, select(Company).where(*filters), keys, cursor, limit, response)
+    )
+
+async def lookup_company(company: CompanySchema) -> dict | None:
+    """
+    Look up the company name and sector through the market data gateway, None if the ticker is unknown.
+    """
+    info = await gateway.get_info(company.ticker)
+    if 'shortName' not in info.keys():
+        return None
+    data = company.model_dump()
+    data['name'] = info['shortName']
+    if 'sector' in info.keys():
+        data['sector'] = info['sector']
+    return data
 
 async def check_company(company: CompanySchema, session: AsyncSession) -> Company:
-    new_company = Company(**company.model_dump())
-    result = await session.execute(select(Company).where(Company.ticker == new_company.ticker))
+    result = await session.execute(select(Company).where(Company.ticker == company.ticker))
     existing_company = result.scalar_one_or_none()
     if existing_company:
         raise HTTPException(status_code=400, detail="Company with this ticker already exists")
-    ticker = Ticker(new_company.ticker, session=yfSession)
-    try:
-        new_company.name = ticker.info['shortName']
-    except KeyError:
-        raise HTTPException(status_code=400, detail=f"No Company with this ticker ({new_company.ticker}) was found")
-    if 'sector' in ticker.info.keys():
-        new_company.sector = ticker.info['sector']
-    return new_company
+    data = await lookup_company(company)
+    if data is None:
+        raise HTTPException(status_code=400, detail=f"No Company with this ticker ({company.ticker}) was found")
+    return Company(**data)
+
+async def create_companies(companies: list[CompanySchema], session: AsyncSession) -> list[CompanyBulkResultSchema]:
+    """
+    Check all the tickers with one query, look up the missing ones concurrently and insert them
+    in one statement. The caller is responsible for committing the session.
+    """
+    companies = list({company.ticker: company for company in companies}.values())
+    tickers = [company.ticker for company in companies]
+    result = await session.scalars(select(Company.ticker).where(Company.ticker.in_(tickers)))
+    existing_tickers = set(result.all())
+    missing = [company for company in companies if company.ticker not in existing_tickers]
+    lookups = await gather(*(lookup_company(company) for company in missing), return_exceptions=True)
+    results = {
+        ticker: CompanyBulkResultSchema(ticker=ticker, status=BulkStatusEnum.exists, detail="Company with this ticker already exists")
+        for ticker in existing_tickers
+    }
+    new_companies = []
+    for company, data in zip(missing, lookups):
+        if isinstance(data, Exception) or data is None:
+            detail = f"No Company with this ticker ({company.ticker}) was found"
+            if isinstance(data, Exception):
+                detail = f"Lookup of the ticker ({company.ticker}) failed: {data}"
+            results[company.ticker] = CompanyBulkResultSchema(ticker=company.ticker, status=BulkStatusEnum.not_found, detail=detail)
+            continue
+        new_companies.append(data)
+        results[company.ticker] = CompanyBulkResultSchema(ticker=company.ticker, status=BulkStatusEnum.created, company=CompanySchema(**data))
+    if new_companies:
+        await session.execute(insert(Company), new_companies)
+    return [results[ticker] for ticker in tickers]
 
 @router.post("/add", response_model=CompanySchema, status_code=201, responses={k: responses[k] for k in [201, 400, 422]})
 async def add_company(company: CompanySchema, session: AsyncSession = Depends(get_async_session)):
     """
     Add a new company.
     """
-    new_company = await check_company(company, session)
-    session.add(new_company)
+    checked = await check_company(company, session)
+    new_company = await session.scalar(
+        insert(Company).values(ticker=checked.ticker, name=checked.name, sector=checked.sector).returning(Company)
+    )
     await session.commit()
-    await session.refresh(new_company)
+    await response_cache.bump("companies")
     return new_company
 
-@router.post("/add_bulk", response_model=list[CompanySchema], status_code=201, responses={k: responses[k] for k in [201, 400, 422]})
-async def add_companies(companies: list[CompanySchema], session: AsyncSession = Depends(get_async_session)):
+@router.post("/add_bulk", response_model=list[CompanyBulkResultSchema], status_code=201, responses={k: responses[k] for k in [200, 201, 400, 422]})
+async def add_companies(companies: list[CompanySchema], response: Response, session: AsyncSession = Depends(get_async_session)):
     """
-    Add a bulk of new companies.
+    Add a bulk of new companies, reporting the outcome of each ticker separately.
+    Answers 201 when at least one company was created, 200 otherwise.
     """
-    new_companies = [await check_company(company, session) for company in companies]
-    session.add_all(new_companies)
-    await session.commit()
-    for new_company in new_companies:
-        await session.refresh(new_company)
-    return new_companies
+    results = await create_companies(companies, session)
+    if not any(result.status == BulkStatusEnum.created for result in results):
+        response.status_code = 200
+        return results
+    try:
+        await session.commit()
+    except IntegrityError:
+        raise HTTPException(status_code=400, detail="Companies could not be added")
+    await response_cache.bump("companies")
+    return results
+
+@router.post("/add_bulk/async", response_model=JobSchema, status_code=202, responses={k: responses[k] for k in [422]})
+async def add_companies_async(companies: list[CompanySchema]):
+    """
+    Add a bulk of new companies in a background job, committing every 100 companies.
+    The progress and the result of each ticker are available at /jobs/{job_id}.
+    """
+    async def run(session: AsyncSession, progress: Progress) -> dict:
+        results = []
+        for i in range(0, len(companies), 100):
+            results += await create_companies(companies[i:i + 100], session)
+            await session.commit()
+            await response_cache.bump("companies")
+            await progress(len(results), [f"{result.ticker}: {result.detail}" for result in results if result.status == BulkStatusEnum.not_found])
+        return {"results": [result.model_dump(mode="json") for result in results]}
+
+    return await job_queue.submit("companies_bulk_add", run)
 
 @router.get("/{company_ticker}", response_model=CompanySchema, responses={k: responses[k] for k in [200, 404, 422]})
-async def get_company(company_ticker: str, session: AsyncSession = Depends(get_async_session)):
+async def get_company(company_ticker: str, session: AsyncSession = Depends(get_read_session)):
     """
     Get a company by Ticker.
     """
     return await get_or_404(Company, session, company_ticker)
 
+@router.get("/{company_ticker}/risk", response_model=CompanyRiskSchema, responses={k: responses[k] for k in [200, 400, 404, 422]})
+async def get_company_risk(
+    company_ticker: str,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    window: int = Query(settings.risk_window, description="Daily returns of each rolling volatility window", ge=2, le=1000),
+    session: AsyncSession = Depends(get_read_session)
+):
+    """
+    Get the returns, volatility, drawdown, Sharpe and Sortino ratios and beta of a company.
+    Defaults to the last risk_lookback_days days.
+    """
+    await get_or_404(Company, session, company_ticker)
+    return await company_risk(session, company_ticker, start, end, window)
+
 @router.put("/{company_ticker}", response_model=CompanySchema, responses={k: responses[k] for k in [200, 400, 404, 422]})
 async def update_company(company_ticker: str, company: CompanyUpdateSchema, session: AsyncSession = Depends(get_async_session)):
     """
     Update a company by Ticker.
     """
-    result = await get_or_404(Company, session, company_ticker)
-    for key, value in company.model_dump().items():
-        if value is not None:
-            setattr(result, key, value)
+    values = {key: value for key, value in company.model_dump().items() if value is not None}
     try:
+        result = await update_or_404(Company, session, company_ticker, values)
         await session.commit()
     except IntegrityError:
         raise HTTPException(status_code=400, detail="Company could not be updated")
-    await session.refresh(result)
+    # the prices and the positions follow the ticker when it changes
+    latest_prices.invalidate([company_ticker])
+    # the prices of every year follow the ticker
+    await response_cache.bump("companies", "positions", "prices", ALL_YEARS)
     return result
 
 @router.delete("/{company_ticker}", response_model=CompanySchema, responses={k: responses[k] for k in [200, 404, 422]})
@@ -94,6 +205,9 @@ async def delete_company(company_ticker: str, session: AsyncSession = Depends(ge
     result = await get_or_404(Company, session, company_ticker)
     await session.delete(result)
     await session.commit()
+    latest_prices.invalidate([company_ticker])
+    # the prices of every year follow the ticker
+    await response_cache.bump("companies", "positions", "prices", ALL_YEARS)
     return result
 
 @router.delete("/delete_all/", responses={k: responses[k] for k in [200, 422]})
@@ -103,4 +217,7 @@ async def delete_all_companies(session: AsyncSession = Depends(get_async_session
     """
     await session.execute(delete(Company))
     await session.commit()
+    latest_prices.invalidate()
+    # the prices of every year follow the ticker
+    await response_cache.bump("companies", "positions", "prices", ALL_YEARS)
     return {'detail': 'done'}
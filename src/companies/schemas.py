@@ -1,3 +1,4 @@
+from enum import Enum as pyEnum
 from pydantic import Field
 from typing import Optional
 from src.schemas import CustomModel
@@ -18,3 +19,17 @@ class CompanyUpdateSchema(CustomModel):
     ticker: Optional[str] = Field(None, description="Ticker symbol of the company", max_length=20)
     name: Optional[str] = Field(None, description="Name of the company", max_length=50)
     sector: Optional[str] = Field(None, description="Sector of the company", max_length=50)
+
+class BulkStatusEnum(str, pyEnum):
+    created = "created"
+    exists = "exists"
+    not_found = "not_found"
+
+class CompanyBulkResultSchema(CustomModel):
+    """
+    Schema for the result of a single ticker in a bulk company creation.
+    """
+    ticker: str = Field(..., description="Ticker symbol of the company", max_length=20)
+    status: BulkStatusEnum = Field(..., description="Outcome of the creation for this ticker")
+    detail: Optional[str] = Field(None, description="Reason why the company was not created")
+    company: Optional[CompanySchema] = Field(None, description="The created company")
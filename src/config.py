@@ -1,5 +1,7 @@
-from os.path import join, dirname, abspath
+from os.path import join, dirname, abspath, expanduser
 from pydantic_settings import BaseSettings, SettingsConfigDict
+from datetime import date, time
+from typing import Optional
 from pydantic import SecretStr
 
 current_dir = dirname(abspath(__file__))
@@ -17,5 +19,46 @@ class Settings(BaseSettings):
     db_name: str
     db_user: str
     db_password: SecretStr
+    db_echo: bool = False  # log every statement, only for debugging
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    db_pool_timeout: float = 30.0  # seconds to wait for a connection before failing
+    db_pool_recycle: int = 1800  # seconds after which a connection is replaced
+    db_pool_pre_ping: bool = True
+    db_statement_cache_size: int = 100  # prepared statements cached by asyncpg on each connection
+    db_replica_host: Optional[str] = None  # read replica used by the GET routes, disabled when not set
+    db_replica_port: Optional[int] = None
+    # Market data settings
+    market_data_provider: str = "yfinance"
+    market_data_workers: int = 8
+    market_data_rate: int = 10
+    market_data_period: float = 1.0
+    market_data_cache_path: str = join(expanduser("~"), ".cache", "portfolio_monitor", "yfinance.cache")  # SQLite cache of the yfinance requests
+    # Prices settings
+    price_history_start: date = date(2000, 1, 1)
+    price_ingest_chunk_size: int = 50000
+    price_refresh_at: Optional[time] = None  # time of the daily refresh, disabled when not set
+    price_cache_size: int = 10000  # tickers whose latest close is kept in memory
+    price_store_path: Optional[str] = None  # directory of the local columnar mirror of the prices, disabled when not set
+    # Response cache settings
+    response_cache_backend: str = "memory"
+    response_cache_versions: str = "database"  # "memory" is only correct with a single worker and no CLI writes
+    response_cache_size: int = 1000  # responses kept before the least recently used ones are evicted
+    # Analytics settings
+    risk_benchmark_ticker: str = "SPY"
+    risk_free_rate: float = 0.0  # annual
+    risk_lookback_days: int = 365  # default length of the series
+    risk_window: int = 63  # daily returns of each rolling volatility window
+    risk_cache_size: int = 256
+    lot_cache_size: int = 64  # portfolios whose matched lots are kept for incremental recomputation
+    # Backtest settings
+    backtest_lookback_days: int = 3650  # default length of a backtest
+    backtest_workers: Optional[int] = None  # processes of the sweeps, one per CPU when not set
+    backtest_max_sweep: int = 1000  # parameter sets of a sweep
+    # Jobs settings
+    job_workers: int = 2
+    job_max_queued: int = 100
+    job_heartbeat_seconds: float = 15  # interval of the heartbeats of the jobs of a process
+    job_owner_timeout_seconds: float = 90  # jobs without heartbeat for this long are failed
 
 settings = Settings()
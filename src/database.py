@@ -1,20 +1,100 @@
-from typing import AsyncGenerator
+from time import perf_counter
+from typing import AsyncGenerator, Optional
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.orm import DeclarativeBase
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession, async_sessionmaker
 from src.config import settings
 
-DATABASE_URL = f"postgresql+asyncpg://{settings.db_user}:{settings.db_password.get_secret_value()}@{settings.db_host}:{settings.db_port}/{settings.db_name}"
-engine = create_async_engine(DATABASE_URL, echo=True)
+class MeteredPool(AsyncAdaptedQueuePool):
+    """
+    Queue pool that also records how long the checkouts wait for a connection.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _do_get(self):
+        started = perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            waited = perf_counter() - started
+            self.checkouts += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+def database_url(host: str, port: int) -> str:
+    return f"postgresql+asyncpg://{settings.db_user}:{settings.db_password.get_secret_value()}@{host}:{port}/{settings.db_name}"
+
+def create_engine(url: str) -> AsyncEngine:
+    return create_async_engine(
+        url,
+        echo=settings.db_echo,
+        poolclass=MeteredPool,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_recycle=settings.db_pool_recycle,
+        pool_pre_ping=settings.db_pool_pre_ping,
+        connect_args={"statement_cache_size": settings.db_statement_cache_size}
+    )
+
+DATABASE_URL = database_url(settings.db_host, settings.db_port)
+engine = create_engine(DATABASE_URL)
 async_session_maker = async_sessionmaker(
     bind=engine,
     expire_on_commit=False,
     class_=AsyncSession
 )
 
+# without a replica the reads go to the primary
+replica_engine: Optional[AsyncEngine] = None
+if settings.db_replica_host is not None:
+    replica_engine = create_engine(database_url(settings.db_replica_host, settings.db_replica_port or settings.db_port))
+read_session_maker = async_session_maker if replica_engine is None else async_sessionmaker(
+    bind=replica_engine,
+    expire_on_commit=False,
+    class_=AsyncSession
+)
+
 class Base(DeclarativeBase):
     pass
 
 async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
     async with async_session_maker() as session:
         yield session
-        
\ No newline at end of file
+
+async def get_read_session() -> AsyncGenerator[AsyncSession, None]:
+    """
+    Session for the routes that only read, bound to the read replica when one is configured.
+    """
+    async with read_session_maker() as session:
+        yield session
+
+def pool_stats(name: str, engine: AsyncEngine) -> dict:
+    pool: MeteredPool = engine.pool
+    return {
+        "engine": name,
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": max(pool.overflow(), 0),
+        "max_overflow": settings.db_max_overflow,
+        "checkouts": pool.checkouts,
+        "timeouts": pool.timeouts,
+        "average_wait_seconds": pool.wait_seconds / pool.checkouts if pool.checkouts else 0,
+        "max_wait_seconds": pool.max_wait_seconds
+    }
+
+def engines_stats() -> list[dict]:
+    stats = [pool_stats("primary", engine)]
+    if replica_engine is not None:
+        stats.append(pool_stats("replica", replica_engine))
+    return stats
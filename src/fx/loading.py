@@ -0,0 +1,129 @@
+"""
+FX rate loading: daily USD rates of every currency are downloaded from the market data
+provider (as the <currency>USD=X tickers) or read from a CSV/Parquet file with currency,
+market_date and usd_rate columns, and upserted into the fx_rates table.
+
+    python -m src.fx.loading --start 2005-01-01
+    python -m src.fx.loading --file rates.csv
+"""
+from argparse import ArgumentParser
+from asyncio import run
+from datetime import date
+from typing import Optional
+from pandas import DataFrame, to_datetime, to_numeric
+from sqlalchemy import select, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.config import settings
+from src.database import async_session_maker
+from src.fx.models import FxRate
+from src.fx.rates import fx_rates
+from src.fx.schemas import FxLoadReportSchema
+from src.market_data.gateway import gateway
+from src.prices.ingestion import file_chunks, split_chunk
+from src.prices.models import CurrencyEnum
+from src.response_cache import response_cache
+from src.util import iterate_in_thread
+
+RATE_COLUMNS = ["currency", "market_date", "usd_rate"]
+FOREIGN_CURRENCIES = [currency for currency in CurrencyEnum if currency != CurrencyEnum.USD]
+
+
+def fx_ticker(currency: CurrencyEnum) -> str:
+    return f"{currency.value}USD=X"
+
+
+def normalize_rates(df: DataFrame) -> DataFrame:
+    """
+    Coerce a chunk to the fx_rates columns, dropping the rows that cannot be stored.
+    """
+    missing = set(RATE_COLUMNS) - set(df.columns)
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(sorted(missing))}")
+    df = df[RATE_COLUMNS].copy()
+    df["currency"] = df["currency"].astype(str).str.strip().str.upper().where(lambda currency: currency.isin([c.value for c in CurrencyEnum]))
+    df["market_date"] = to_datetime(df["market_date"], errors="coerce").dt.date
+    df["usd_rate"] = to_numeric(df["usd_rate"], errors="coerce")
+    df = df.dropna()
+    df = df[df["usd_rate"] > 0]
+    return df.drop_duplicates(subset=["currency", "market_date"], keep="last")
+
+
+async def write_rates(session: AsyncSession, df: DataFrame) -> int:
+    """
+    Upsert a chunk of rates, returns the number of rows written.
+    """
+    if df.empty:
+        return 0
+    statement = insert(FxRate)
+    await session.execute(
+        statement.on_conflict_do_update(index_elements=[FxRate.currency, FxRate.market_date], set_={"usd_rate": statement.excluded.usd_rate}),
+        df.to_dict("records")
+    )
+    return len(df)
+
+
+async def load_rates(session: AsyncSession, chunks, report: FxLoadReportSchema) -> FxLoadReportSchema:
+    async for chunk in chunks:
+        for part in split_chunk(normalize_rates(chunk), settings.price_ingest_chunk_size):
+            report.rows_written += await write_rates(session, part)
+            await session.commit()
+    fx_rates.invalidate()
+    await response_cache.bump("fx_rates")
+    return report
+
+
+async def provider_rates(currencies: list[CurrencyEnum], start: date, end: date, errors: list[str]):
+    history = await gateway.get_history([fx_ticker(currency) for currency in currencies], start, end)
+    found = set(history["company_ticker"])
+    errors.extend(f"{currency.value}: no rates were found" for currency in currencies if fx_ticker(currency) not in found)
+    currency_by_ticker = {fx_ticker(currency): currency.value for currency in currencies}
+    yield DataFrame({
+        "currency": history["company_ticker"].map(currency_by_ticker),
+        "market_date": history["market_date"],
+        "usd_rate": history["close"]
+    })
+
+
+async def load_rates_from_provider(
+    session: AsyncSession,
+    currencies: Optional[list[CurrencyEnum]] = None,
+    start: Optional[date] = None,
+    end: Optional[date] = None
+) -> FxLoadReportSchema:
+    """
+    Download the rates of the currencies (default: all but USD) between start and end.
+    Without start, the download resumes from the last stored date.
+    """
+    currencies = [currency for currency in currencies or FOREIGN_CURRENCIES if currency != CurrencyEnum.USD]
+    report = FxLoadReportSchema()
+    if not currencies:
+        return report
+    if start is None:
+        result = await session.execute(select(FxRate.currency, func.max(FxRate.market_date)).group_by(FxRate.currency))
+        last_dates = dict(result.all())
+        start = min(last_dates.get(currency) or settings.price_history_start for currency in currencies)
+    return await load_rates(session, provider_rates(currencies, start, end or date.today(), report.errors), report)
+
+
+async def load_rates_from_file(session: AsyncSession, path: str) -> FxLoadReportSchema:
+    chunks = iterate_in_thread(file_chunks(path, settings.price_ingest_chunk_size))
+    return await load_rates(session, chunks, FxLoadReportSchema())
+
+
+async def main(file: Optional[str], start: Optional[date], end: Optional[date]):
+    async with async_session_maker() as session:
+        if file:
+            report = await load_rates_from_file(session, file)
+        else:
+            report = await load_rates_from_provider(session, start=start, end=end)
+    print(report.model_dump_json(indent=2))
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Load daily FX rates into the fx_rates table")
+    parser.add_argument("--file", help="CSV or Parquet file with currency, market_date and usd_rate columns")
+    parser.add_argument("--start", type=date.fromisoformat)
+    parser.add_argument("--end", type=date.fromisoformat)
+    args = parser.parse_args()
+    run(main(args.file, args.start, args.end))
@@ -0,0 +1,12 @@
+from datetime import date
+from sqlalchemy import Enum
+from sqlalchemy.orm import Mapped, mapped_column
+from src.database import Base
+from src.prices.models import CurrencyEnum
+
+class FxRate(Base):
+    __tablename__ = "fx_rates"
+
+    currency: Mapped[CurrencyEnum] = mapped_column(Enum(CurrencyEnum, name='currencyenum'), primary_key=True)
+    market_date: Mapped[date] = mapped_column(primary_key=True)
+    usd_rate: Mapped[float] = mapped_column(nullable=False)  # value of one unit of currency in USD
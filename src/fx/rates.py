@@ -0,0 +1,81 @@
+"""
+In-memory FX rates: the daily USD value of every currency is kept as a date x currency
+matrix, so whole arrays of amounts are converted to a base currency with one lookup.
+"""
+from typing import Optional
+import numpy as np
+from pandas import DataFrame, Series
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.fx.models import FxRate
+from src.prices.models import CurrencyEnum
+from src.response_cache import response_cache
+from src.util import to_days, forward_fill
+
+CURRENCIES = list(CurrencyEnum)
+CURRENCY_INDEX = {currency.value: i for i, currency in enumerate(CURRENCIES)}
+
+
+class RateMatrix:
+    """
+    USD value of every currency on every date with at least one rate, forward filled so that
+    the rate of a day is the last one known on that day. USD is always 1.
+    """
+    def __init__(self, rates: DataFrame):
+        days = to_days(rates["market_date"])
+        self.dates, rows = np.unique(days, return_inverse=True)
+        self.rates = np.full((len(self.dates), len(CURRENCIES)), np.nan)
+        self.rates[rows, rates["currency"].map(CURRENCY_INDEX).to_numpy(int)] = rates["usd_rate"].to_numpy(float)
+        self.rates = forward_fill(self.rates)
+        self.rates[:, CURRENCY_INDEX[CurrencyEnum.USD.value]] = 1.0
+
+    def factors(self, currencies: Series, dates: Series, base: CurrencyEnum) -> np.ndarray:
+        """
+        Factors converting amounts in the given currencies on the given dates to base.
+        NaN where the currency is unknown or has no rate on or before the date.
+        """
+        columns = Series(currencies).map(lambda currency: CURRENCY_INDEX.get(getattr(currency, "value", currency))).to_numpy(float)
+        days = to_days(Series(dates))
+        rows = np.searchsorted(self.dates, days, side="right") - 1
+        valid = ~np.isnan(columns) & ~np.isnat(days) & (rows >= 0)
+        factors = np.full(len(columns), np.nan)
+        valid_rows, valid_columns = rows[valid], columns[valid].astype(int)
+        factors[valid] = self.rates[valid_rows, valid_columns] / self.rates[valid_rows, CURRENCY_INDEX[base.value]]
+        # amounts already in base need no rate
+        factors[columns == CURRENCY_INDEX[base.value]] = 1.0
+        return factors
+
+    def convert(self, amounts: Series, currencies: Series, dates: Series, base: CurrencyEnum) -> np.ndarray:
+        return np.asarray(amounts, dtype=float) * self.factors(currencies, dates, base)
+
+
+class FxRateCache:
+    """
+    Rate matrix loaded from the fx_rates table on first use. Every get checks the count and the
+    last date of the rates and their shared version, and reloads the matrix when they changed,
+    so rates written by another process or by the loading CLI are seen on the next request.
+    """
+    def __init__(self):
+        self.matrix: Optional[RateMatrix] = None
+        self.signature: Optional[tuple] = None
+
+    async def current_signature(self, session: AsyncSession) -> tuple:
+        count, last_date = (await session.execute(select(func.count(), func.max(FxRate.market_date)))).one()
+        # upserts of existing rates change neither the count nor the last date
+        versions = await response_cache.versions(session, ["fx_rates"])
+        return count, last_date, versions["fx_rates"]
+
+    async def get(self, session: AsyncSession) -> RateMatrix:
+        signature = await self.current_signature(session)
+        if self.matrix is None or signature != self.signature:
+            result = await session.execute(select(FxRate.currency, FxRate.market_date, FxRate.usd_rate))
+            rates = DataFrame(result.all(), columns=["currency", "market_date", "usd_rate"])
+            rates["currency"] = rates["currency"].map(lambda currency: currency.value)
+            self.matrix, self.signature = RateMatrix(rates), signature
+        return self.matrix
+
+    def invalidate(self):
+        self.matrix = None
+
+
+fx_rates = FxRateCache()
@@ -0,0 +1,45 @@
+from datetime import date
+from typing import Optional
+from fastapi import APIRouter, Depends
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.database import get_async_session, get_read_session
+from src.util import get_responses
+from src.fx.models import FxRate
+from src.fx.schemas import FxRateSchema, FxLoadSchema, FxLoadReportSchema
+from src.fx.loading import load_rates_from_provider
+from src.prices.models import CurrencyEnum
+
+router = APIRouter(
+    prefix="/fx",
+    tags=["fx"]
+)
+
+responses = get_responses(FxRate)
+
+@router.get("/", response_model=list[FxRateSchema], responses={k: responses[k] for k in [200, 422]})
+async def get_rates(
+    currency: Optional[CurrencyEnum] = None,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    session: AsyncSession = Depends(get_read_session)
+):
+    """
+    Get the USD rates, optionally filtered by currency and date range.
+    """
+    query = select(FxRate).order_by(FxRate.currency, FxRate.market_date)
+    if currency is not None:
+        query = query.where(FxRate.currency == currency)
+    if start is not None:
+        query = query.where(FxRate.market_date >= start)
+    if end is not None:
+        query = query.where(FxRate.market_date <= end)
+    result = await session.scalars(query)
+    return result.fetchall()
+
+@router.post("/load", response_model=FxLoadReportSchema, status_code=201, responses={k: responses[k] for k in [201, 422]})
+async def load_rates(load: FxLoadSchema, session: AsyncSession = Depends(get_async_session)):
+    """
+    Load the daily rates of the currencies from the market data provider.
+    """
+    return await load_rates_from_provider(session, load.currencies, load.start, load.end)
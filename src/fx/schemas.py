@@ -0,0 +1,28 @@
+from datetime import date
+from typing import Optional
+from pydantic import Field
+from src.schemas import CustomModel
+from src.prices.models import CurrencyEnum
+
+class FxRateSchema(CustomModel):
+    """
+    Schema for the USD rate of a currency on a date.
+    """
+    currency: CurrencyEnum
+    market_date: date = Field(..., description="Date of the rate")
+    usd_rate: float = Field(..., description="Value of one unit of the currency in USD", gt=0)
+
+class FxLoadSchema(CustomModel):
+    """
+    Schema for a request to load rates from the market data provider.
+    """
+    currencies: Optional[list[CurrencyEnum]] = Field(None, description="Currencies to load, defaults to all of them")
+    start: Optional[date] = Field(None, description="First date to load, defaults to the day after the last stored rate")
+    end: Optional[date] = Field(None, description="Last date to load, defaults to today")
+
+class FxLoadReportSchema(CustomModel):
+    """
+    Schema for the report of a rates load.
+    """
+    rows_written: int = Field(0, description="Rates inserted or updated")
+    errors: list[str] = Field([], description="Currencies that could not be loaded")
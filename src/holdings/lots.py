@@ -0,0 +1,258 @@
+"""
+Lot matching of the buy and sell positions of a portfolio with the FIFO, LIFO and average cost
+methods. Every ticker keeps its transactions in date order with the lot state after each of
+them, so an edit only replays the transactions from the first changed one.
+"""
+from array import array
+from typing import Optional
+import numpy as np
+from pandas import DataFrame
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.config import settings
+from src.holdings.schemas import LotMethodEnum
+from src.positions.models import Position, TypeEnum
+from src.response_cache import MemoryBackend, response_cache
+
+EPSILON = 1e-9
+
+
+class LotLedger:
+    """
+    Transactions of one ticker and the lots they open and close, kept in flat arrays:
+    - FIFO: the lots are the buys in order, the state is the index of the oldest open lot
+      and the quantity already sold from it.
+    - LIFO: the open lots form a persistent stack whose nodes are appended and never modified,
+      the state is the node on top of the stack and the number of nodes.
+    - average: the state is the quantity held and its cost.
+    """
+    def __init__(self, method: LotMethodEnum):
+        self.method = method
+        self.days = np.empty(0, "datetime64[D]")
+        self.buys = np.empty(0, bool)
+        self.quantities = np.empty(0)
+        self.prices = np.empty(0)
+        # one entry per transaction
+        self.realized = array("d")
+        self.unmatched = array("d")
+        self.state_index = array("d" if method == LotMethodEnum.average else "q")
+        self.state_amount = array("q" if method == LotMethodEnum.lifo else "d")
+        # LIFO stack nodes
+        self.node_quantity = array("d")
+        self.node_price = array("d")
+        self.node_parent = array("q")
+
+    def update(self, days: np.ndarray, buys: np.ndarray, quantities: np.ndarray, prices: np.ndarray) -> int:
+        """
+        Replace the transactions, sorted by date, and replay them from the first one that changed.
+        Returns the number of transactions replayed.
+        """
+        n = min(len(days), len(self.days))
+        changed = np.flatnonzero(
+            (days[:n] != self.days[:n]) | (buys[:n] != self.buys[:n])
+            | (quantities[:n] != self.quantities[:n]) | (prices[:n] != self.prices[:n])
+        )
+        start = int(changed[0]) if changed.size else n
+        self.days, self.buys, self.quantities, self.prices = days, buys, quantities, prices
+        for values in (self.realized, self.unmatched, self.state_index, self.state_amount):
+            del values[start:]
+        {LotMethodEnum.fifo: self.replay_fifo, LotMethodEnum.lifo: self.replay_lifo, LotMethodEnum.average: self.replay_average}[self.method](start)
+        return len(days) - start
+
+    def transactions(self, start: int):
+        return zip(self.buys[start:].tolist(), self.quantities[start:].tolist(), self.prices[start:].tolist())
+
+    def replay_fifo(self, start: int):
+        lot_quantity, lot_price = self.quantities[self.buys].tolist(), self.prices[self.buys].tolist()
+        lots = int(np.count_nonzero(self.buys[:start]))
+        head, consumed = (self.state_index[start - 1], self.state_amount[start - 1]) if start else (0, 0.0)
+        for buy, quantity, price in self.transactions(start):
+            pnl = 0.0
+            if buy:
+                lots += 1
+                quantity = 0.0
+            while quantity > EPSILON and head < lots:
+                available = lot_quantity[head] - consumed
+                if quantity < available - EPSILON:
+                    pnl += quantity * (price - lot_price[head])
+                    consumed += quantity
+                    quantity = 0.0
+                else:
+                    pnl += available * (price - lot_price[head])
+                    quantity -= available
+                    head += 1
+                    consumed = 0.0
+            self.realized.append(pnl)
+            self.unmatched.append(max(quantity, 0.0))
+            self.state_index.append(head)
+            self.state_amount.append(consumed)
+
+    def replay_lifo(self, start: int):
+        top, nodes = (self.state_index[start - 1], self.state_amount[start - 1]) if start else (-1, 0)
+        node_quantity, node_price, node_parent = self.node_quantity, self.node_price, self.node_parent
+        for values in (node_quantity, node_price, node_parent):
+            del values[nodes:]
+        for buy, quantity, price in self.transactions(start):
+            pnl = 0.0
+            if buy:
+                node_quantity.append(quantity)
+                node_price.append(price)
+                node_parent.append(top)
+                top = len(node_quantity) - 1
+                quantity = 0.0
+            while quantity > EPSILON and top >= 0:
+                available = node_quantity[top]
+                if quantity < available - EPSILON:
+                    pnl += quantity * (price - node_price[top])
+                    # the partially sold lot is pushed again, the previous states still see the old node
+                    node_quantity.append(available - quantity)
+                    node_price.append(node_price[top])
+                    node_parent.append(node_parent[top])
+                    top = len(node_quantity) - 1
+                    quantity = 0.0
+                else:
+                    pnl += available * (price - node_price[top])
+                    quantity -= available
+                    top = node_parent[top]
+            self.realized.append(pnl)
+            self.unmatched.append(max(quantity, 0.0))
+            self.state_index.append(top)
+            self.state_amount.append(len(node_quantity))
+
+    def replay_average(self, start: int):
+        held, cost = (self.state_index[start - 1], self.state_amount[start - 1]) if start else (0.0, 0.0)
+        for buy, quantity, price in self.transactions(start):
+            pnl, unmatched = 0.0, 0.0
+            if buy:
+                held += quantity
+                cost += quantity * price
+            else:
+                # same rule as the holdings table: without a quantity held the sell is at cost
+                average_cost = cost / held if held > 0 else price
+                pnl = quantity * (price - average_cost)
+                unmatched = max(quantity - max(held, 0.0), 0.0)
+                cost -= quantity * average_cost
+                held -= quantity
+            self.realized.append(pnl)
+            self.unmatched.append(unmatched)
+            self.state_index.append(held)
+            self.state_amount.append(cost)
+
+    def open_lots(self) -> tuple[float, float]:
+        """
+        Quantity and cost of the lots still open after the last transaction.
+        """
+        if not len(self.days):
+            return 0.0, 0.0
+        if self.method == LotMethodEnum.average:
+            return self.state_index[-1], self.state_amount[-1]
+        if self.method == LotMethodEnum.fifo:
+            quantities, prices = self.quantities[self.buys], self.prices[self.buys]
+            head = self.state_index[-1]
+            open_quantities = quantities[head:].copy()
+            if open_quantities.size:
+                open_quantities[0] -= self.state_amount[-1]
+            return float(open_quantities.sum()), float(open_quantities @ prices[head:])
+        quantity, cost, top = 0.0, 0.0, self.state_index[-1]
+        while top >= 0:
+            quantity += self.node_quantity[top]
+            cost += self.node_quantity[top] * self.node_price[top]
+            top = self.node_parent[top]
+        return quantity, cost
+
+
+def split_transactions(transactions: DataFrame) -> dict[str, tuple[np.ndarray, ...]]:
+    """
+    Split (company_ticker, date, type, quantity, price) rows sorted by ticker and date into the
+    (days, buys, quantities, prices) arrays of every ticker.
+    """
+    tickers = transactions["company_ticker"].to_numpy()
+    days = transactions["date"].to_numpy().astype("datetime64[D]")
+    buys = (transactions["type"] == TypeEnum.buy).to_numpy()
+    quantities = transactions["quantity"].to_numpy(float)
+    prices = transactions["price"].to_numpy(float)
+    bounds = np.flatnonzero(np.r_[True, tickers[1:] != tickers[:-1], True]) if len(tickers) else np.array([0])
+    return {
+        tickers[start]: (days[start:end], buys[start:end], quantities[start:end], prices[start:end])
+        for start, end in zip(bounds[:-1], bounds[1:])
+    }
+
+
+def match_lots(transactions: DataFrame, method: LotMethodEnum, ledgers: Optional[dict[str, LotLedger]] = None) -> dict[str, LotLedger]:
+    """
+    Match the lots of every ticker, updating the given ledgers in place from their first changed transaction.
+    """
+    ledgers = {} if ledgers is None else ledgers
+    by_ticker = split_transactions(transactions)
+    for ticker in ledgers.keys() - by_ticker.keys():
+        del ledgers[ticker]
+    for ticker, arrays in by_ticker.items():
+        if ticker not in ledgers:
+            ledgers[ticker] = LotLedger(method)
+        ledgers[ticker].update(*arrays)
+    return ledgers
+
+
+def realized_by_ticker(ledgers: dict[str, LotLedger]) -> DataFrame:
+    rows = []
+    for ticker, ledger in sorted(ledgers.items()):
+        open_quantity, open_cost_basis = ledger.open_lots()
+        rows.append((ticker, float(np.sum(ledger.realized)), open_quantity, open_cost_basis, float(np.sum(ledger.unmatched))))
+    return DataFrame(rows, columns=["company_ticker", "realized_pnl", "open_quantity", "open_cost_basis", "unmatched_quantity"])
+
+
+def realized_by_year(ledgers: dict[str, LotLedger]) -> DataFrame:
+    columns = ["year", "company_ticker", "realized_pnl"]
+    if not ledgers:
+        return DataFrame(columns=columns)
+    sells = DataFrame({
+        "year": np.concatenate([ledger.days[~ledger.buys] for ledger in ledgers.values()]).astype("datetime64[Y]").astype(int) + 1970,
+        "company_ticker": np.repeat(list(ledgers.keys()), [np.count_nonzero(~ledger.buys) for ledger in ledgers.values()]),
+        "realized_pnl": np.concatenate([np.frombuffer(ledger.realized)[~ledger.buys] for ledger in ledgers.values() if len(ledger.realized)] or [np.empty(0)])
+    })
+    return sells.groupby(["year", "company_ticker"], as_index=False)["realized_pnl"].sum()[columns]
+
+
+async def load_transactions(session: AsyncSession, portfolio_id: int) -> DataFrame:
+    result = await session.execute(
+        select(Position.company_ticker, Position.date, Position.type, Position.quantity, Position.price)
+        .where(Position.portfolio_id == portfolio_id)
+        .order_by(Position.company_ticker, Position.date, Position.id)
+    )
+    return DataFrame(result.all(), columns=["company_ticker", "date", "type", "quantity", "price"])
+
+
+async def positions_signature(session: AsyncSession, portfolio_id: int) -> tuple:
+    """
+    Count and highest ID of the positions of a portfolio, read from the database so that
+    positions added or deleted outside of the app are noticed.
+    """
+    result = await session.execute(
+        select(func.count(), func.max(Position.id)).where(Position.portfolio_id == portfolio_id)
+    )
+    return tuple(result.one())
+
+
+class LotBooks:
+    """
+    Matched lots of the most recently used portfolios. The positions are reloaded when the
+    shared positions version or the signature of the positions of the portfolio changes, and
+    every ledger replays only the transactions after its first change.
+    """
+    def __init__(self, max_size: int):
+        self.books = MemoryBackend(max_size)
+
+    async def get(self, session: AsyncSession, portfolio_id: int, method: LotMethodEnum) -> dict[str, LotLedger]:
+        key = (portfolio_id, method)
+        versions = await response_cache.versions(session, ["positions"])
+        version = (versions["positions"], *await positions_signature(session, portfolio_id))
+        entry = self.books.get(key)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+        transactions = await load_transactions(session, portfolio_id)
+        ledgers = match_lots(transactions, method, None if entry is None else entry[1])
+        self.books.set(key, (version, ledgers))
+        return ledgers
+
+
+lot_books = LotBooks(settings.lot_cache_size)
@@ -0,0 +1,14 @@
+from datetime import date as pydate
+from sqlalchemy import ForeignKey
+from sqlalchemy.orm import Mapped, mapped_column
+from src.database import Base
+
+class Holding(Base):
+    __tablename__ = "holdings"
+
+    portfolio_id: Mapped[int] = mapped_column(ForeignKey("portfolios.id", ondelete="CASCADE", onupdate="CASCADE"), primary_key=True)
+    company_ticker: Mapped[str] = mapped_column(ForeignKey("companies.ticker", ondelete="CASCADE", onupdate="CASCADE"), primary_key=True)
+    quantity: Mapped[float] = mapped_column(nullable=False)
+    cost_basis: Mapped[float] = mapped_column(nullable=False)
+    realized_pnl: Mapped[float] = mapped_column(nullable=False)
+    last_date: Mapped[pydate] = mapped_column(nullable=False)
@@ -0,0 +1,73 @@
+"""
+Recompute the holdings table from the positions and report the drift of the stored rows.
+
+    python -m src.holdings.rebuild --check
+"""
+from argparse import ArgumentParser
+from asyncio import run
+from math import isclose
+from sqlalchemy import select, delete, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.database import async_session_maker
+from src.holdings.models import Holding
+from src.holdings.tracking import replay, positions_query
+from src.response_cache import response_cache
+import src.portfolios.models
+import src.companies.models
+import src.prices.models
+
+FIELDS = ["quantity", "cost_basis", "realized_pnl", "last_date"]
+
+
+def drift(stored: Holding | None, computed: Holding | None) -> list[str]:
+    if stored is None or computed is None:
+        return ["missing" if stored is None else "stale"]
+    fields = []
+    for field in FIELDS:
+        stored_value, computed_value = getattr(stored, field), getattr(computed, field)
+        if isinstance(stored_value, float):
+            if not isclose(stored_value, computed_value, rel_tol=1e-9, abs_tol=1e-6):
+                fields.append(field)
+        elif stored_value != computed_value:
+            fields.append(field)
+    return fields
+
+
+async def rebuild_holdings(session: AsyncSession, check_only: bool = False) -> dict[tuple[int, str], list[str]]:
+    """
+    Compare the stored holdings with the ones replayed from the positions and, unless check_only,
+    replace them. Returns the drifting fields of each (portfolio_id, company_ticker) pair.
+    """
+    result = await session.stream(positions_query())
+    computed = replay([row async for row in result])
+    stored = {(holding.portfolio_id, holding.company_ticker): holding for holding in await session.scalars(select(Holding))}
+    drifts = {}
+    for pair in stored.keys() | computed.keys():
+        fields = drift(stored.get(pair), computed.get(pair))
+        if fields:
+            drifts[pair] = fields
+    if not check_only:
+        await session.execute(delete(Holding))
+        if computed:
+            await session.execute(insert(Holding), [
+                {"portfolio_id": holding.portfolio_id, "company_ticker": holding.company_ticker, **{field: getattr(holding, field) for field in FIELDS}}
+                for holding in computed.values()
+            ])
+        await session.commit()
+        await response_cache.bump("holdings")
+    return drifts
+
+
+async def main(check_only: bool):
+    async with async_session_maker() as session:
+        drifts = await rebuild_holdings(session, check_only)
+    for (portfolio_id, company_ticker), fields in sorted(drifts.items()):
+        print(f"portfolio {portfolio_id} {company_ticker}: {', '.join(fields)}")
+    print(f"{len(drifts)} drifting holdings{'' if check_only else ' rebuilt'}")
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Rebuild the holdings table from the positions")
+    parser.add_argument("--check", action="store_true", help="only report the drift, do not write")
+    args = parser.parse_args()
+    run(main(args.check))
@@ -0,0 +1,46 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.database import get_read_session
+from src.util import get_or_404, get_responses
+from src.holdings.models import Holding
+from src.holdings.schemas import HoldingSchema, LotMethodEnum, RealizedPnlSchema
+from src.holdings.lots import lot_books, realized_by_ticker, realized_by_year
+from src.portfolios.models import Portfolio
+
+router = APIRouter(
+    prefix="/holdings",
+    tags=["holdings"]
+)
+
+responses = get_responses(Holding)
+
+@router.get("/portfolio/{portfolio_id}", response_model=list[HoldingSchema], responses={k: responses[k] for k in [200, 404, 422]})
+async def get_holdings_of_a_portfolio(portfolio_id: int, session: AsyncSession = Depends(get_read_session)):
+    """
+    Get the current holdings of a portfolio.
+    """
+    await get_or_404(Portfolio, session, portfolio_id)
+    result = await session.scalars(select(Holding).where(Holding.portfolio_id == portfolio_id))
+    return result.fetchall()
+
+@router.get("/portfolio/{portfolio_id}/realized", response_model=RealizedPnlSchema, responses={k: responses[k] for k in [200, 404, 422]})
+async def get_realized_pnl_of_a_portfolio(
+    portfolio_id: int,
+    method: LotMethodEnum = Query(LotMethodEnum.fifo, description="Lot matching method"),
+    session: AsyncSession = Depends(get_read_session)
+):
+    """
+    Get the P&L realized by the sells of a portfolio, per ticker and per year, matching them
+    with the buy lots in FIFO, LIFO or average cost order.
+    """
+    await get_or_404(Portfolio, session, portfolio_id)
+    ledgers = await lot_books.get(session, portfolio_id, method)
+    tickers = realized_by_ticker(ledgers)
+    return {
+        "portfolio_id": portfolio_id,
+        "method": method,
+        "realized_pnl": float(tickers["realized_pnl"].sum()),
+        "tickers": tickers.to_dict("records"),
+        "years": realized_by_year(ledgers).to_dict("records")
+    }
@@ -0,0 +1,48 @@
+from datetime import date as pydate
+from enum import Enum as pyEnum
+from pydantic import Field
+from src.schemas import CustomModel
+
+class HoldingSchema(CustomModel):
+    """
+    Schema for holding data.
+    """
+    portfolio_id: int = Field(..., description="ID of the portfolio")
+    company_ticker: str = Field(..., description="Ticker of the company", max_length=20)
+    quantity: float = Field(..., description="Net quantity held")
+    cost_basis: float = Field(..., description="Cost of the quantity held, at average cost")
+    realized_pnl: float = Field(..., description="P&L realized by the sells")
+    last_date: pydate = Field(..., description="Date of the last position")
+
+class LotMethodEnum(str, pyEnum):
+    fifo = "fifo"
+    lifo = "lifo"
+    average = "average"
+
+class RealizedTickerSchema(CustomModel):
+    """
+    Schema for the realized P&L and the open lots of a ticker.
+    """
+    company_ticker: str = Field(..., description="Ticker of the company", max_length=20)
+    realized_pnl: float = Field(..., description="P&L realized by the sells")
+    open_quantity: float = Field(..., description="Quantity of the open lots")
+    open_cost_basis: float = Field(..., description="Cost of the open lots")
+    unmatched_quantity: float = Field(..., description="Quantity sold without an open lot to match, realizing no P&L")
+
+class RealizedYearSchema(CustomModel):
+    """
+    Schema for the P&L realized on a ticker during a year.
+    """
+    year: int = Field(..., description="Year of the sells")
+    company_ticker: str = Field(..., description="Ticker of the company", max_length=20)
+    realized_pnl: float = Field(..., description="P&L realized by the sells of the year")
+
+class RealizedPnlSchema(CustomModel):
+    """
+    Schema for the realized P&L of a portfolio with a lot matching method.
+    """
+    portfolio_id: int = Field(..., description="ID of the portfolio")
+    method: LotMethodEnum = Field(..., description="Lot matching method")
+    realized_pnl: float = Field(..., description="Total realized P&L")
+    tickers: list[RealizedTickerSchema]
+    years: list[RealizedYearSchema]
@@ -0,0 +1,141 @@
+from datetime import date
+from sqlalchemy import select, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.holdings.models import Holding
+from src.positions.models import Position, TypeEnum
+
+Pair = tuple[int, str]
+# pairs per statement, under the bind parameter limit of asyncpg
+LOCK_BATCH = 5000
+
+
+def batches(pairs: list[Pair]) -> list[list[Pair]]:
+    return [pairs[i:i + LOCK_BATCH] for i in range(0, len(pairs), LOCK_BATCH)]
+
+
+def apply_transaction(holding: Holding, type: TypeEnum, quantity: float, price: float):
+    """
+    Apply a buy or a sell to a holding with the average cost method.
+    """
+    if type == TypeEnum.buy:
+        holding.quantity += quantity
+        holding.cost_basis += quantity * price
+        return
+    average_cost = holding.cost_basis / holding.quantity if holding.quantity > 0 else price
+    holding.realized_pnl += quantity * (price - average_cost)
+    holding.cost_basis -= quantity * average_cost
+    holding.quantity -= quantity
+
+
+def new_holding(portfolio_id: int, company_ticker: str, last_date: date) -> Holding:
+    return Holding(
+        portfolio_id=portfolio_id,
+        company_ticker=company_ticker,
+        quantity=0.0,
+        cost_basis=0.0,
+        realized_pnl=0.0,
+        last_date=last_date
+    )
+
+
+def replay(rows) -> dict[Pair, Holding]:
+    """
+    Holdings of (portfolio_id, company_ticker, date, type, quantity, price) rows sorted by pair and date.
+    """
+    holdings = {}
+    for portfolio_id, company_ticker, position_date, type, quantity, price in rows:
+        holding = holdings.get((portfolio_id, company_ticker))
+        if holding is None:
+            holding = holdings[(portfolio_id, company_ticker)] = new_holding(portfolio_id, company_ticker, position_date)
+        apply_transaction(holding, type, quantity, price)
+        holding.last_date = position_date
+    return holdings
+
+
+def positions_query(pairs: list[Pair] | None = None):
+    query = select(
+        Position.portfolio_id, Position.company_ticker, Position.date, Position.type, Position.quantity, Position.price
+    ).order_by(Position.portfolio_id, Position.company_ticker, Position.date, Position.id)
+    if pairs is not None:
+        query = query.where(tuple_(Position.portfolio_id, Position.company_ticker).in_(pairs))
+    return query
+
+
+async def lock_holdings(session: AsyncSession, first_dates: dict[Pair, date]) -> dict[Pair, Holding]:
+    """
+    Lock the holdings of the pairs until the end of the transaction, in pair order so that
+    concurrent writers do not deadlock. The missing holdings are first inserted empty, dated
+    with the date of their pair, so that concurrent writers of a new pair wait on its row
+    instead of failing on its primary key.
+    """
+    holdings = {}
+    for batch in batches(sorted(first_dates)):
+        await session.execute(
+            insert(Holding).values([
+                {"portfolio_id": portfolio_id, "company_ticker": company_ticker, "quantity": 0.0, "cost_basis": 0.0,
+                 "realized_pnl": 0.0, "last_date": first_dates[(portfolio_id, company_ticker)]}
+                for portfolio_id, company_ticker in batch
+            ]).on_conflict_do_nothing(index_elements=[Holding.portfolio_id, Holding.company_ticker])
+        )
+        result = await session.scalars(
+            select(Holding)
+            .where(tuple_(Holding.portfolio_id, Holding.company_ticker).in_(batch))
+            .order_by(Holding.portfolio_id, Holding.company_ticker)
+            .with_for_update()
+            # the values committed by the writers waited for, not the ones loaded before the lock
+            .execution_options(populate_existing=True)
+        )
+        holdings.update(((holding.portfolio_id, holding.company_ticker), holding) for holding in result)
+    return holdings
+
+
+async def recompute_holdings(session: AsyncSession, pairs: set[Pair]):
+    """
+    Recompute the holdings of the given (portfolio_id, company_ticker) pairs from their positions.
+    """
+    if not pairs:
+        return
+    stored = await lock_holdings(session, dict.fromkeys(pairs, date.min))
+    rows = []
+    for batch in batches(sorted(pairs)):
+        rows += (await session.execute(positions_query(batch))).all()
+    computed = replay(rows)
+    for pair in pairs:
+        # every pair has a locked holding, inserted empty when it was missing
+        holding, replayed = stored[pair], computed.get(pair)
+        if replayed is None:
+            await session.delete(holding)
+        else:
+            holding.quantity = replayed.quantity
+            holding.cost_basis = replayed.cost_basis
+            holding.realized_pnl = replayed.realized_pnl
+            holding.last_date = replayed.last_date
+
+
+async def apply_positions(session: AsyncSession, positions: list[Position]):
+    """
+    Update the holdings with new positions in the session transaction.
+    Positions dated after the last position of their holding are applied incrementally,
+    holdings receiving back dated positions are recomputed. The holdings stay locked until
+    the transaction ends.
+    """
+    if not positions:
+        return
+    positions = sorted(positions, key=lambda position: position.date)
+    first_dates = {}
+    for position in positions:
+        first_dates.setdefault((position.portfolio_id, position.company_ticker), position.date)
+    holdings = await lock_holdings(session, first_dates)
+    to_recompute = set()
+    for position in positions:
+        pair = (position.portfolio_id, position.company_ticker)
+        if pair in to_recompute:
+            continue
+        holding = holdings[pair]
+        if position.date < holding.last_date:
+            to_recompute.add(pair)
+            continue
+        apply_transaction(holding, position.type, position.quantity, position.price)
+        holding.last_date = position.date
+    await recompute_holdings(session, to_recompute)
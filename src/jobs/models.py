@@ -0,0 +1,28 @@
+from datetime import datetime
+from enum import Enum as pyEnum
+from typing import Optional
+from sqlalchemy import String, Enum, JSON, DateTime, func
+from sqlalchemy.orm import Mapped, mapped_column
+from src.database import Base
+
+class JobStatusEnum(str, pyEnum):
+    queued = "queued"
+    running = "running"
+    done = "done"
+    failed = "failed"
+
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    kind: Mapped[str] = mapped_column(String(30), nullable=False)
+    status: Mapped[JobStatusEnum] = mapped_column(Enum(JobStatusEnum, name="jobstatusenum"), nullable=False, default=JobStatusEnum.queued)
+    processed_rows: Mapped[int] = mapped_column(nullable=False, default=0)
+    errors: Mapped[list] = mapped_column(JSON, nullable=False, default=list)
+    result: Mapped[Optional[dict]] = mapped_column(JSON, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    started_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    # process running the job and the last time it reported being alive
+    owner: Mapped[Optional[str]] = mapped_column(String(100), nullable=True)
+    heartbeat_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
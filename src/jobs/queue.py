@@ -0,0 +1,166 @@
+import os
+from asyncio import Queue, QueueFull, Task, create_task, sleep
+from datetime import datetime, timedelta, timezone
+from logging import getLogger
+from socket import gethostname
+from typing import Awaitable, Callable, Optional
+from uuid import uuid4
+from fastapi import HTTPException
+from sqlalchemy import func, or_, update, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.config import settings
+from src.database import async_session_maker
+from src.jobs.models import Job, JobStatusEnum
+
+logger = getLogger(__name__)
+
+Progress = Callable[[int, list[str]], Awaitable[None]]
+JobRunner = Callable[[AsyncSession, Progress], Awaitable[dict]]
+Cleanup = Optional[Callable[[], None]]
+ACTIVE = [JobStatusEnum.queued, JobStatusEnum.running]
+
+
+async def update_job(job_id: int, owner: str, *where, **values) -> bool:
+    """
+    Update a job of the given owner, only when it also matches the extra conditions.
+    Returns whether the job was updated.
+    """
+    async with async_session_maker() as session:
+        result = await session.execute(update(Job).where(Job.id == job_id, Job.owner == owner, *where).values(**values))
+        await session.commit()
+    return result.rowcount > 0
+
+
+class JobQueue:
+    """
+    In-process job queue: submitted jobs are stored in the jobs table and run by a fixed
+    number of worker tasks, each with its own session, so large imports never run more than
+    `workers` at a time.
+    Every job is owned by the process that queued it, which sends heartbeats for its jobs.
+    Several processes can share the table: a process only fails the jobs whose owner stopped
+    sending heartbeats, and an owner does not overwrite a job failed that way.
+    The cleanup of a job, such as removing its spooled file, runs once the job is done with,
+    whether it ran, was failed before it started, was rejected or was still queued at stop.
+    """
+    def __init__(self, workers: int, max_queued: int):
+        self.workers = workers
+        self.queue: Queue[tuple[int, JobRunner, Cleanup]] = Queue(maxsize=max_queued)
+        self.tasks: list[Task] = []
+        self.owner: Optional[str] = None
+
+    async def start(self):
+        # set in the worker process, the token tells apart the processes reusing a pid
+        self.owner = f"{gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+        # jobs of processes that stopped will never complete
+        await self.fail_orphaned()
+        self.tasks = [create_task(self.work()) for _ in range(self.workers)] + [create_task(self.heartbeat())]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        self.tasks = []
+        while not self.queue.empty():
+            _, _, cleanup = self.queue.get_nowait()
+            self.clean(cleanup)
+
+    @staticmethod
+    def clean(cleanup: Cleanup):
+        if cleanup is None:
+            return
+        try:
+            cleanup()
+        except Exception:
+            logger.exception("Job cleanup failed")
+
+    async def heartbeat(self):
+        while True:
+            await sleep(settings.job_heartbeat_seconds)
+            try:
+                async with async_session_maker() as session:
+                    await session.execute(
+                        update(Job).where(Job.owner == self.owner, Job.status.in_(ACTIVE)).values(heartbeat_at=func.now())
+                    )
+                    await session.commit()
+                await self.fail_orphaned()
+            except Exception:
+                logger.exception("Job heartbeat failed")
+
+    async def fail_orphaned(self):
+        """
+        Fail the queued and running jobs of the other owners without a recent heartbeat.
+        """
+        async with async_session_maker() as session:
+            await session.execute(
+                update(Job)
+                .where(
+                    Job.status.in_(ACTIVE),
+                    or_(Job.owner.is_(None), Job.owner != self.owner),
+                    or_(Job.heartbeat_at.is_(None), Job.heartbeat_at < func.now() - timedelta(seconds=settings.job_owner_timeout_seconds))
+                )
+                .values(status=JobStatusEnum.failed, errors=["Interrupted by a restart"], finished_at=datetime.now(timezone.utc))
+            )
+            await session.commit()
+
+    async def submit(self, kind: str, runner: JobRunner, cleanup: Cleanup = None) -> Job:
+        """
+        Store a new job and queue it. Raises a 503 error when too many jobs are waiting,
+        after running the cleanup.
+        """
+        try:
+            if self.queue.full():
+                raise HTTPException(status_code=503, detail="Too many jobs are waiting, retry later")
+            async with async_session_maker() as session:
+                job = await session.scalar(insert(Job).values(
+                    kind=kind, status=JobStatusEnum.queued, processed_rows=0, errors=[], owner=self.owner, heartbeat_at=func.now()
+                ).returning(Job))
+                await session.commit()
+        except BaseException:
+            self.clean(cleanup)
+            raise
+        try:
+            self.queue.put_nowait((job.id, runner, cleanup))
+        except QueueFull:
+            self.clean(cleanup)
+            await update_job(job.id, self.owner, status=JobStatusEnum.failed, errors=["The queue was full"], finished_at=datetime.now(timezone.utc))
+            raise HTTPException(status_code=503, detail="Too many jobs are waiting, retry later")
+        return job
+
+    async def work(self):
+        while True:
+            job_id, runner, cleanup = await self.queue.get()
+            try:
+                await self.run(job_id, runner)
+            finally:
+                self.clean(cleanup)
+                self.queue.task_done()
+
+    async def run(self, job_id: int, runner: JobRunner):
+        async def progress(processed_rows: int, errors: list[str]):
+            await update_job(job_id, self.owner, Job.status == JobStatusEnum.running, processed_rows=processed_rows, errors=errors)
+
+        started = await update_job(
+            job_id, self.owner, Job.status == JobStatusEnum.queued,
+            status=JobStatusEnum.running, started_at=datetime.now(timezone.utc)
+        )
+        if not started:
+            logger.warning("Job %s was failed before it started", job_id)
+            return
+        try:
+            async with async_session_maker() as session:
+                result = await runner(session, progress)
+        except Exception as e:
+            logger.exception("Job %s failed", job_id)
+            finished = await update_job(
+                job_id, self.owner, Job.status == JobStatusEnum.running,
+                status=JobStatusEnum.failed, result={"detail": str(e)}, finished_at=datetime.now(timezone.utc)
+            )
+        else:
+            finished = await update_job(
+                job_id, self.owner, Job.status == JobStatusEnum.running,
+                status=JobStatusEnum.done, result=result, finished_at=datetime.now(timezone.utc)
+            )
+        if not finished:
+            logger.warning("Job %s was failed by another process before it finished", job_id)
+
+
+job_queue = JobQueue(settings.job_workers, settings.job_max_queued)
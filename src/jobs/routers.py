@@ -0,0 +1,37 @@
+from typing import Optional
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.database import get_async_session
+from src.util import get_or_404, get_responses
+from src.jobs.models import Job, JobStatusEnum
+from src.jobs.schemas import JobSchema
+
+router = APIRouter(
+    prefix="/jobs",
+    tags=["jobs"]
+)
+
+responses = get_responses(Job)
+
+@router.get("/", response_model=list[JobSchema])
+async def get_jobs(
+    status: Optional[JobStatusEnum] = None,
+    limit: int = Query(50, gt=0, le=500),
+    session: AsyncSession = Depends(get_async_session)
+):
+    """
+    Get the most recent jobs, optionally filtered by status.
+    """
+    query = select(Job).order_by(Job.id.desc()).limit(limit)
+    if status is not None:
+        query = query.where(Job.status == status)
+    result = await session.scalars(query)
+    return result.fetchall()
+
+@router.get("/{job_id}", response_model=JobSchema, responses={k: responses[k] for k in [200, 404, 422]})
+async def get_job(job_id: int, session: AsyncSession = Depends(get_async_session)):
+    """
+    Get a job by ID, with its progress.
+    """
+    return await get_or_404(Job, session, job_id)
@@ -0,0 +1,27 @@
+from datetime import datetime, timezone
+from typing import Optional
+from pydantic import Field, computed_field
+from src.schemas import CustomModel
+from src.jobs.models import JobStatusEnum
+
+class JobSchema(CustomModel):
+    """
+    Schema for job data.
+    """
+    id: int = Field(..., description="ID of the job")
+    kind: str = Field(..., description="Kind of work done by the job")
+    status: JobStatusEnum = Field(..., description="Status of the job")
+    processed_rows: int = Field(..., description="Rows processed so far")
+    errors: list[str] = Field(..., description="Errors met so far")
+    result: Optional[dict] = Field(None, description="Result of the job once done")
+    created_at: datetime = Field(..., description="Submission time")
+    started_at: Optional[datetime] = Field(None, description="Start time")
+    finished_at: Optional[datetime] = Field(None, description="End time")
+
+    @computed_field(description="Rows processed per second since the start")
+    @property
+    def rows_per_second(self) -> Optional[float]:
+        if self.started_at is None:
+            return None
+        seconds = ((self.finished_at or datetime.now(timezone.utc)) - self.started_at).total_seconds()
+        return self.processed_rows / seconds if seconds > 0 else None
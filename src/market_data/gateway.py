@@ -0,0 +1,110 @@
+from asyncio import AbstractEventLoop, Lock, Task, create_task, get_running_loop, shield, sleep
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from time import monotonic
+from typing import Callable, Hashable, Optional
+from pandas import DataFrame
+from src.config import settings
+from src.market_data.providers import MarketDataProvider, get_provider
+
+
+class RateLimiter:
+    """
+    Async token bucket allowing `rate` calls every `period` seconds.
+    The lock is created in the running loop, the CLIs run several loops one after the other.
+    """
+    def __init__(self, rate: int, period: float):
+        self.rate = rate
+        self.period = period
+        self._tokens = float(rate)
+        self._updated = monotonic()
+        self._lock: Optional[Lock] = None
+        self._loop: Optional[AbstractEventLoop] = None
+
+    def lock(self) -> Lock:
+        loop = get_running_loop()
+        if self._loop is not loop:
+            self._lock, self._loop = Lock(), loop
+        return self._lock
+
+    async def acquire(self):
+        async with self.lock():
+            while True:
+                now = monotonic()
+                self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate / self.period)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await sleep((1 - self._tokens) * self.period / self.rate)
+
+
+class MarketDataGateway:
+    """
+    Async front of a blocking MarketDataProvider.
+    Provider calls run in a bounded thread pool, share one rate limit budget and identical
+    concurrent requests are coalesced into a single upstream call.
+    """
+    def __init__(self, provider: MarketDataProvider, max_workers: int, rate: int, period: float):
+        self.provider = provider
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="market_data")
+        self.limiter = RateLimiter(rate, period)
+        self._inflight: dict[Hashable, Task] = {}
+        self._loop: Optional[AbstractEventLoop] = None
+        self.requests = 0
+        self.coalesced = 0
+        self.upstream_calls = 0
+
+    async def _fetch(self, func: Callable, *args):
+        await self.limiter.acquire()
+        self.upstream_calls += 1
+        loop = get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def _call(self, key: Hashable, func: Callable, *args):
+        self.requests += 1
+        loop = get_running_loop()
+        if self._loop is not loop:
+            # the calls in flight belong to a loop that is gone
+            self._inflight, self._loop = {}, loop
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = create_task(self._fetch(func, *args))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # shield so that a cancelled caller does not cancel the call shared with the others
+        return await shield(task)
+
+    async def get_info(self, ticker: str) -> dict:
+        """
+        Get the info dictionary of a ticker, a copy of the one shared by the coalesced callers.
+        """
+        return dict(await self._call(("info", ticker), self.provider.get_info, ticker))
+
+    async def get_history(self, tickers: list[str], start: date, end: date) -> DataFrame:
+        """
+        Get the daily closes of a batch of tickers with a single upstream call.
+        Every caller gets its own copy of the frame shared by the coalesced callers.
+        """
+        tickers = sorted(set(tickers))
+        history = await self._call(("history", tuple(tickers), start, end), self.provider.get_history, tickers, start, end)
+        return history.copy()
+
+    def stats(self) -> dict:
+        return {
+            "provider": self.provider.name,
+            "requests": self.requests,
+            "upstream_calls": self.upstream_calls,
+            "coalesced": self.coalesced,
+            "inflight": len(self._inflight)
+        }
+
+
+gateway = MarketDataGateway(
+    get_provider(settings.market_data_provider),
+    max_workers=settings.market_data_workers,
+    rate=settings.market_data_rate,
+    period=settings.market_data_period
+)
@@ -0,0 +1,99 @@
+from datetime import date, timedelta
+from threading import Lock
+from time import sleep
+from zlib import crc32
+import numpy as np
+from pandas import DataFrame, bdate_range, concat as pd_concat
+from yfinance import Ticker, download
+from src.yfinance_cache import session as yfSession
+
+
+class MarketDataProvider:
+    """
+    Blocking interface of a market data source. The gateway runs these methods in its executor.
+    """
+    name = "base"
+
+    def get_info(self, ticker: str) -> dict:
+        raise NotImplementedError
+
+    def get_history(self, tickers: list[str], start: date, end: date) -> DataFrame:
+        """
+        Daily closes of the tickers between start and end (both included) in long format,
+        with the columns company_ticker, market_date and close.
+        """
+        raise NotImplementedError
+
+
+class YFinanceProvider(MarketDataProvider):
+    """
+    Provider backed by yfinance through the cached session.
+    """
+    name = "yfinance"
+
+    def get_info(self, ticker: str) -> dict:
+        return Ticker(ticker, session=yfSession).info
+
+    def get_history(self, tickers: list[str], start: date, end: date) -> DataFrame:
+        # a single download call fetches all the tickers, the end date is exclusive for yfinance
+        df = download(tickers, start=start, end=end + timedelta(days=1), session=yfSession, auto_adjust=False, progress=False)
+        if df is None or df.empty:
+            return DataFrame(columns=["company_ticker", "market_date", "close"])
+        history = df["Close"].stack(future_stack=True).dropna().reset_index()
+        history.columns = ["market_date", "company_ticker", "close"]
+        history["market_date"] = history["market_date"].dt.date
+        return history[["company_ticker", "market_date", "close"]]
+
+
+class FakeProvider(MarketDataProvider):
+    """
+    Offline provider returning deterministic data after a fixed latency, used to benchmark the gateway.
+    Tickers starting with "X" are treated as unknown.
+    """
+    name = "fake"
+
+    def __init__(self, latency: float = 0.05):
+        self.latency = latency
+        self.calls = 0
+        self._lock = Lock()
+
+    def get_info(self, ticker: str) -> dict:
+        with self._lock:
+            self.calls += 1
+        sleep(self.latency)
+        if ticker.startswith("X"):
+            return {}
+        sectors = ["Technology", "Healthcare", "Financial Services", "Energy", "Industrials"]
+        return {
+            "shortName": f"{ticker} Inc.",
+            "sector": sectors[crc32(ticker.encode()) % len(sectors)],
+            "currency": "USD"
+        }
+
+    def get_history(self, tickers: list[str], start: date, end: date) -> DataFrame:
+        with self._lock:
+            self.calls += 1
+        sleep(self.latency)
+        index = bdate_range(start, end)
+        # days since the epoch, so the same day always gets the same close whatever the requested range
+        days = index.values.astype("datetime64[D]").astype(np.int64)
+        frames = []
+        for ticker in tickers:
+            if ticker.startswith("X"):
+                continue
+            seed = crc32(ticker.encode())
+            close = (20 + seed % 200) * np.exp(0.0002 * days / 365 * (seed % 7) + 0.2 * np.sin(days / (30 + seed % 60)))
+            frames.append(DataFrame({"company_ticker": ticker, "market_date": index.date, "close": close.round(4)}))
+        if not frames:
+            return DataFrame(columns=["company_ticker", "market_date", "close"])
+        return pd_concat(frames, ignore_index=True)
+
+
+def get_provider(name: str) -> MarketDataProvider:
+    providers = {
+        YFinanceProvider.name: YFinanceProvider,
+        FakeProvider.name: FakeProvider
+    }
+    if name not in providers:
+        raise ValueError(f"Unknown market data provider: {name}")
+    return providers[name]()
@@ -1,10 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import select
+from datetime import date
+import numpy as np
+import orjson
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy import select, insert
 from sqlalchemy.ext.asyncio import AsyncSession
-from src.database import get_async_session
-from src.util import get_or_404, get_responses
+from src.database import get_async_session, get_read_session
+from src.util import get_or_404, update_or_404, get_responses, json_response, encode_cursor, decode_cursor
 from src.portfolios.models import Portfolio
-from src.portfolios.schemas import PortfolioSchema, PortfolioReadSchema
+from src.portfolios.schemas import PortfolioSchema, PortfolioReadSchema, PortfolioValuationSchema, PortfolioHistorySchema, PortfolioSummaryValuationSchema
+from src.portfolios.valuation import load_holdings, load_base_costs, compute_valuation, valuation_totals, to_records, load_trades, load_closes, history, convert_holdings, convert_closes, require_single_currency, load_batch_values, batch_valuation, page_by_value
+from src.schemas import FrequencyEnum
+from src.prices.models import CurrencyEnum
+from src.fx.rates import fx_rates
+from src.response_cache import response_cache
+from src.analytics.risk import portfolio_risk
+from src.analytics.schemas import PortfolioRiskSchema, BacktestSchema, BacktestResultSchema, BacktestSweepSchema, BacktestSweepResultSchema
+from src.analytics.backtest import Parameters, load_matrix, summarize, trade_list, sweep, backtest_in_pool
+from src.config import settings
 
 router = APIRouter(
     prefix="/portfolios",
@@ -14,47 +27,164 @@ router = APIRouter(
 responses = get_responses(Portfolio)
 
 @router.get("/", response_model=list[PortfolioReadSchema])
-async def get_portfolios(session: AsyncSession = Depends(get_async_session)):
+async def get_portfolios(request: Request, session: AsyncSession = Depends(get_read_session)):
     """
-    Get all portfolios.
+    Get all portfolios. The response is cached until a portfolio changes and carries an ETag.
     """
-    result = await session.scalars(select(Portfolio))
-    portfolios = result.fetchall()
-    return portfolios
+    async def build(response: Response) -> list[Portfolio]:
+        result = await session.scalars(select(Portfolio))
+        return result.fetchall()
+
+    return await response_cache.respond(request, session, ["portfolios"], list[PortfolioReadSchema], build)
 
 @router.post("/add", response_model=PortfolioReadSchema, status_code=201, responses={k: responses[k] for k in [201, 400, 422]})
 async def add_portfolio(portfolio: PortfolioSchema, session: AsyncSession = Depends(get_async_session)):
     """
     Add a new portfolio.
     """
-    new_portfolio = Portfolio(**portfolio.model_dump())
-    result = await session.execute(select(Portfolio).where(Portfolio.id == new_portfolio.id))
-    existing_portfolio = result.scalar_one_or_none()
-    if existing_portfolio:
-        raise HTTPException(status_code=400, detail="Portfolio with this id already exists")
-    session.add(new_portfolio)
+    new_portfolio = await session.scalar(insert(Portfolio).values(**portfolio.model_dump()).returning(Portfolio))
     await session.commit()
-    await session.refresh(new_portfolio)
+    await response_cache.bump("portfolios")
     return new_portfolio
 
+@router.get("/valuation", response_model=list[PortfolioSummaryValuationSchema], responses={k: responses[k] for k in [200, 400, 422]})
+async def get_portfolios_valuation(
+    response: Response,
+    base: CurrencyEnum = Query(CurrencyEnum.USD, description="Currency the values are converted to, so that they can be compared"),
+    descending: bool = Query(True, description="Sort by decreasing market value"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor header of the previous page"),
+    limit: int = Query(100, gt=0, le=1000),
+    session: AsyncSession = Depends(get_read_session)
+):
+    """
+    Get the market value and day change of every portfolio, converted to base (default: USD),
+    sorted by market value one page at a time. The holdings of all the portfolios are valued
+    together with a single grouped query, the ones without a rate to base are counted in unconverted_holdings.
+    """
+    after = tuple(decode_cursor(cursor, [float, int])) if cursor else None
+    portfolios, values = await load_batch_values(session)
+    page, last = page_by_value(batch_valuation(portfolios, values, await fx_rates.get(session), base), descending, after, limit)
+    if last is not None:
+        response.headers["X-Next-Cursor"] = encode_cursor(list(last))
+    return to_records(page)
+
 @router.get("/{portfolio_id}", response_model=PortfolioReadSchema, responses={k: responses[k] for k in [200, 404, 422]})
-async def get_portfolio(portfolio_id: int, session: AsyncSession = Depends(get_async_session)):
+async def get_portfolio(portfolio_id: int, session: AsyncSession = Depends(get_read_session)):
     """
     Get a portfolio by ID.
     """
     return await get_or_404(Portfolio, session, portfolio_id)
 
+@router.get("/{portfolio_id}/valuation", response_model=PortfolioValuationSchema, responses={k: responses[k] for k in [200, 404, 422]})
+async def get_portfolio_valuation(portfolio_id: int, base: Optional[CurrencyEnum] = None, session: AsyncSession = Depends(get_read_session)):
+    """
+    Get the current holdings of a portfolio with their market value, cost basis and unrealized P&L,
+    converted to base when given: the closes at the rate of their date, the costs at the rate of each trade date.
+    """
+    await get_or_404(Portfolio, session, portfolio_id)
+    holdings = await load_holdings(session, portfolio_id)
+    if base is not None:
+        rates = await fx_rates.get(session)
+        holdings = convert_holdings(holdings, await load_base_costs(session, portfolio_id, rates, base), rates, base)
+    valuation = compute_valuation(holdings)
+    return {"portfolio_id": portfolio_id, "base": base, **valuation_totals(valuation), "holdings": to_records(valuation)}
+
+@router.get("/{portfolio_id}/history", response_model=PortfolioHistorySchema, responses={k: responses[k] for k in [200, 400, 404, 422]})
+async def get_portfolio_history(
+    portfolio_id: int,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    freq: FrequencyEnum = FrequencyEnum.daily,
+    base: Optional[CurrencyEnum] = None,
+    fast: bool = Query(False, description="Serialize the arrays directly with orjson, skipping the response model validation"),
+    session: AsyncSession = Depends(get_read_session)
+):
+    """
+    Get the value of a portfolio over time, from start (default: first position) to end (default: today),
+    converted to base when given. A base is required when the closes are in more than one currency.
+    """
+    await get_or_404(Portfolio, session, portfolio_id)
+    trades = await load_trades(session, portfolio_id)
+    if trades.empty:
+        return {"portfolio_id": portfolio_id, "freq": freq, "base": base, "dates": [], "values": []}
+    start = start or trades["date"].min()
+    end = end or date.today()
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    closes = await load_closes(session, trades["company_ticker"].unique().tolist(), start, end)
+    if base is not None:
+        closes = convert_closes(closes, await fx_rates.get(session), base, strict=True)
+    else:
+        require_single_currency(closes)
+    values = history(trades, closes, start, end, freq)
+    if fast:
+        dates = np.datetime_as_string(values.index.values.astype("datetime64[D]")).tolist()
+        content = {"portfolio_id": portfolio_id, "freq": freq, "base": base, "dates": dates, "values": values.to_numpy()}
+        return json_response(orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY))
+    return {"portfolio_id": portfolio_id, "freq": freq, "base": base, "dates": values.index.date.tolist(), "values": values.tolist()}
+
+@router.get("/{portfolio_id}/risk", response_model=PortfolioRiskSchema, responses={k: responses[k] for k in [200, 400, 404, 422]})
+async def get_portfolio_risk(
+    portfolio_id: int,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    window: int = Query(settings.risk_window, description="Daily returns of each rolling volatility window", ge=2, le=1000),
+    base: Optional[CurrencyEnum] = None,
+    session: AsyncSession = Depends(get_read_session)
+):
+    """
+    Get the returns, volatility, drawdown, Sharpe and Sortino ratios and beta of a portfolio, net of its trades,
+    with the correlation matrix of its holdings, with the closes converted to base when given, which is required when they are in more than one currency.
+    Defaults to the last risk_lookback_days days.
+    """
+    await get_or_404(Portfolio, session, portfolio_id)
+    return await portfolio_risk(session, portfolio_id, start, end, window, base)
+
+@router.post("/{portfolio_id}/backtest", response_model=BacktestResultSchema, responses={k: responses[k] for k in [200, 400, 404, 422]})
+async def backtest_portfolio(portfolio_id: int, backtest: BacktestSchema, session: AsyncSession = Depends(get_read_session)):
+    """
+    Replay an equal weight rebalancing strategy over the closes of the tickers of a portfolio.
+    Returns the equity of every business day and the trades of the rebalances.
+    """
+    await get_or_404(Portfolio, session, portfolio_id)
+    matrix = await load_matrix(session, portfolio_id, backtest.start, backtest.end, backtest.base)
+    parameters = Parameters(backtest.strategy, backtest.freq, backtest.threshold, backtest.cost_bps)
+    result = await backtest_in_pool(matrix, parameters, backtest.capital)
+    return {
+        **summarize(result, parameters, backtest.capital),
+        "portfolio_id": portfolio_id,
+        "base": backtest.base,
+        "dates": matrix.dates.tolist(),
+        "equity": result.equity.tolist(),
+        "trades": trade_list(result, matrix, portfolio_id)
+    }
+
+@router.post("/{portfolio_id}/backtest/sweep", response_model=BacktestSweepResultSchema, responses={k: responses[k] for k in [200, 400, 404, 422]})
+async def sweep_portfolio_backtests(portfolio_id: int, backtests: BacktestSweepSchema, session: AsyncSession = Depends(get_read_session)):
+    """
+    Run the backtests of several parameter sets over the same history, in parallel processes.
+    Returns their performance by decreasing Sharpe ratio.
+    """
+    await get_or_404(Portfolio, session, portfolio_id)
+    matrix = await load_matrix(session, portfolio_id, backtests.start, backtests.end, backtests.base)
+    parameters = [Parameters(item.strategy, item.freq, item.threshold, item.cost_bps) for item in backtests.parameters]
+    return {
+        "portfolio_id": portfolio_id,
+        "base": backtests.base,
+        "start": matrix.dates[0].item(),
+        "end": matrix.dates[-1].item(),
+        "results": await sweep(matrix, parameters, backtests.capital)
+    }
+
 @router.put("/{portfolio_id}", response_model=PortfolioReadSchema, responses={k: responses[k] for k in [200, 404, 422]})
-async def update_portfolio(portfolio_id: str, portfolio: PortfolioSchema, session: AsyncSession = Depends(get_async_session)):
+async def update_portfolio(portfolio_id: int, portfolio: PortfolioSchema, session: AsyncSession = Depends(get_async_session)):
     """
     Update a portfolio by ID.
     """
-    result = await get_or_404(Portfolio, session, portfolio_id)
-    for key, value in portfolio.model_dump().items():
-        if value is not None:
-            setattr(result, key, value)
+    values = {key: value for key, value in portfolio.model_dump().items() if value is not None}
+    result = await update_or_404(Portfolio, session, portfolio_id, values)
     await session.commit()
-    await session.refresh(result)
+    await response_cache.bump("portfolios")
     return result
 
 @router.delete("/{portfolio_id}", response_model=PortfolioReadSchema, responses={k: responses[k] for k in [200, 404, 422]})
@@ -65,4 +195,5 @@ async def delete_portfolio(portfolio_id: str, session: AsyncSession = Depends(ge
     result = await get_or_404(Portfolio, session, portfolio_id)
     await session.delete(result)
     await session.commit()
+    await response_cache.bump("portfolios", "positions")
     return result
@@ -1,5 +1,8 @@
+from datetime import date
+from typing import Optional
 from pydantic import Field
-from src.schemas import CustomModel
+from src.schemas import CustomModel, FrequencyEnum
+from src.prices.models import CurrencyEnum
 
 
 class PortfolioSchema(CustomModel):
@@ -12,4 +15,67 @@ class PortfolioReadSchema(PortfolioSchema):
     """
     Schema for reading portfolio data.
     """
-    id: int = Field(..., description="ID of the portfolio")
\ No newline at end of file
+    id: int = Field(..., description="ID of the portfolio")
+
+class HoldingValuationSchema(CustomModel):
+    """
+    Schema for the valuation of a single holding of a portfolio.
+    """
+    company_ticker: str = Field(..., description="Ticker of the company", max_length=20)
+    quantity: float = Field(..., description="Net quantity held")
+    average_cost: Optional[float] = Field(None, description="Average price paid per unit")
+    cost_basis: Optional[float] = Field(None, description="Cost of the quantity held, at average cost. In base, each trade is converted from its currency at the rate of its date")
+    close: Optional[float] = Field(None, description="Latest close price")
+    market_date: Optional[date] = Field(None, description="Date of the latest close price")
+    currency: Optional[CurrencyEnum] = Field(None, description="Currency of the amounts")
+    market_value: Optional[float] = Field(None, description="Value of the quantity held at the latest close")
+    unrealized_pnl: Optional[float] = Field(None, description="Market value minus cost basis")
+    realized_pnl: Optional[float] = Field(None, description="P&L realized by the sells. In base, each trade is converted from its currency at the rate of its date")
+
+class CurrencyTotalsSchema(CustomModel):
+    """
+    Schema for the totals of the holdings of a portfolio in one currency.
+    """
+    currency: Optional[CurrencyEnum] = Field(None, description="Currency of the totals, None for the holdings without prices")
+    market_value: float = Field(..., description="Market value of the priced holdings")
+    cost_basis: float = Field(..., description="Cost basis of the holdings")
+    unrealized_pnl: float = Field(..., description="Unrealized P&L of the priced holdings")
+    realized_pnl: float = Field(..., description="Realized P&L")
+
+class PortfolioValuationSchema(CustomModel):
+    """
+    Schema for the valuation of a portfolio.
+    """
+    portfolio_id: int = Field(..., description="ID of the portfolio")
+    base: Optional[CurrencyEnum] = Field(None, description="Currency the totals are converted to, None when they are not converted")
+    market_value: Optional[float] = Field(None, description="Total market value of the priced holdings, None when they are in more than one currency")
+    cost_basis: Optional[float] = Field(None, description="Total cost basis of the holdings, None when they are in more than one currency")
+    unrealized_pnl: Optional[float] = Field(None, description="Total unrealized P&L of the priced holdings, None when they are in more than one currency")
+    realized_pnl: Optional[float] = Field(None, description="Total realized P&L, None when the holdings are in more than one currency")
+    currencies: list[CurrencyTotalsSchema] = Field(..., description="Totals of the holdings of each currency")
+    holdings: list[HoldingValuationSchema] = Field(..., description="Valuation of each holding")
+
+class PortfolioHistorySchema(CustomModel):
+    """
+    Schema for the value history of a portfolio, as parallel arrays.
+    """
+    portfolio_id: int = Field(..., description="ID of the portfolio")
+    freq: FrequencyEnum = Field(..., description="Sampling frequency of the series")
+    base: Optional[CurrencyEnum] = Field(None, description="Currency the values are converted to, None when they are not converted")
+    dates: list[date] = Field(..., description="Last day of each period")
+    values: list[float] = Field(..., description="Value of the portfolio on each date")
+
+class PortfolioSummaryValuationSchema(CustomModel):
+    """
+    Schema for the current value and day change of a portfolio, in the valuation of every portfolio.
+    """
+    portfolio_id: int = Field(..., description="ID of the portfolio")
+    name: str = Field(..., description="Name of the portfolio", max_length=30)
+    base: CurrencyEnum = Field(..., description="Currency the values are converted to")
+    market_value: float = Field(..., description="Market value of the priced holdings at their latest close")
+    previous_value: float = Field(..., description="Market value of the same holdings at the close before the latest")
+    day_change: float = Field(..., description="Market value minus previous value")
+    day_change_pct: Optional[float] = Field(None, description="Day change as a fraction of the previous value")
+    holdings: int = Field(..., description="Number of priced open holdings converted to base")
+    unconverted_holdings: int = Field(..., description="Number of priced open holdings left out of the values, without a rate to base on their close dates")
+    market_date: Optional[date] = Field(None, description="Date of the most recent latest close of the converted holdings")
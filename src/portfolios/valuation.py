@@ -0,0 +1,321 @@
+from datetime import date
+from typing import Optional
+import numpy as np
+from pandas import DataFrame, Index, Series, date_range, concat, factorize, isna
+from fastapi import HTTPException
+from sqlalchemy import select, case, func, union_all, true
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.holdings.models import Holding
+from src.holdings.tracking import replay
+from src.portfolios.models import Portfolio
+from src.positions.models import Position, TypeEnum
+from src.fx.rates import RateMatrix
+from src.prices.models import Price, CurrencyEnum
+from src.prices.cache import latest_prices
+from src.schemas import FrequencyEnum
+from src.util import to_days, forward_fill
+
+HOLDING_COLUMNS = ["company_ticker", "quantity", "cost_basis", "realized_pnl", "close", "market_date", "currency"]
+BATCH_COLUMNS = ["portfolio_id", "currency", "market_date", "previous_date", "holdings", "market_value", "previous_value"]
+
+
+async def load_holdings(session: AsyncSession, portfolio_id: int) -> DataFrame:
+    """
+    Holdings of a portfolio with the latest price of each ticker, taken from the latest price cache.
+    """
+    result = await session.execute(
+        select(Holding.company_ticker, Holding.quantity, Holding.cost_basis, Holding.realized_pnl)
+        .where(Holding.portfolio_id == portfolio_id)
+    )
+    holdings = DataFrame(result.all(), columns=HOLDING_COLUMNS[:4])
+    latest = await latest_prices.get_many(session, holdings["company_ticker"])
+    holdings["close"] = holdings["company_ticker"].map(lambda ticker: latest[ticker] and latest[ticker].close)
+    holdings["market_date"] = holdings["company_ticker"].map(lambda ticker: latest[ticker] and latest[ticker].market_date)
+    holdings["currency"] = holdings["company_ticker"].map(lambda ticker: latest[ticker] and latest[ticker].currency)
+    return holdings
+
+
+async def load_base_costs(session: AsyncSession, portfolio_id: int, rates: RateMatrix, base: CurrencyEnum) -> DataFrame:
+    """
+    Cost basis and realized P&L of each ticker of a portfolio in base, replaying its positions
+    with their prices converted from their own currency at the rate of their trade date.
+    NaN for the tickers with a position that cannot be converted.
+    """
+    result = await session.execute(
+        select(Position.company_ticker, Position.date, Position.type, Position.quantity, Position.price, Position.currency)
+        .where(Position.portfolio_id == portfolio_id)
+        .order_by(Position.company_ticker, Position.date, Position.id)
+    )
+    positions = DataFrame(result.all(), columns=["company_ticker", "date", "type", "quantity", "price", "currency"])
+    prices = rates.convert(positions["price"], positions["currency"], positions["date"], base)
+    rows = zip(
+        [portfolio_id] * len(positions), positions["company_ticker"], positions["date"], positions["type"], positions["quantity"], prices
+    )
+    costs = [(ticker, holding.cost_basis, holding.realized_pnl) for (_, ticker), holding in replay(rows).items()]
+    return DataFrame(costs, columns=["company_ticker", "cost_basis", "realized_pnl"])
+
+
+def convert_holdings(holdings: DataFrame, costs: DataFrame, rates: RateMatrix, base: CurrencyEnum) -> DataFrame:
+    """
+    Convert the holdings to base: the closes at the rate of the date of the latest close, the
+    cost basis and realized P&L are taken from the costs in base of load_base_costs. Holdings
+    without prices have no converted close.
+    """
+    holdings = holdings.copy()
+    factors = rates.factors(holdings["currency"], holdings["market_date"], base)
+    holdings["close"] = holdings["close"].to_numpy(dtype=float) * factors
+    costs = costs.set_index("company_ticker")
+    for column in ["cost_basis", "realized_pnl"]:
+        holdings[column] = holdings["company_ticker"].map(costs[column]).to_numpy(dtype=float)
+    holdings["currency"] = np.where(np.isnan(factors), None, base)
+    return holdings
+
+
+def compute_valuation(holdings: DataFrame) -> DataFrame:
+    """
+    Market value, average cost and unrealized P&L of the holdings. Closed holdings are kept
+    for their realized P&L.
+    """
+    holdings = holdings.copy()
+    quantity = holdings["quantity"].to_numpy(dtype=float)
+    cost_basis = holdings["cost_basis"].to_numpy(dtype=float)
+    close = holdings["close"].to_numpy(dtype=float)
+    open_quantity = np.where(np.isclose(quantity, 0), np.nan, quantity)
+    holdings["quantity"] = quantity
+    holdings["average_cost"] = cost_basis / open_quantity
+    holdings["close"] = close
+    holdings["market_value"] = quantity * close
+    holdings["unrealized_pnl"] = holdings["market_value"] - cost_basis
+    return holdings
+
+
+async def load_trades(session: AsyncSession, portfolio_id: int) -> DataFrame:
+    """
+    Positions of a portfolio as (date, company_ticker, signed quantity) rows.
+    """
+    signed = case((Position.type == TypeEnum.buy, Position.quantity), else_=-Position.quantity)
+    result = await session.execute(
+        select(Position.date, Position.company_ticker, signed).where(Position.portfolio_id == portfolio_id)
+    )
+    return DataFrame(result.all(), columns=["date", "company_ticker", "quantity"])
+
+
+async def load_closes(session: AsyncSession, tickers: list[str], start: date, end: date) -> DataFrame:
+    """
+    Closes of the tickers between start and end, plus the last close before start of each
+    ticker so that the series can be forward filled from the first day.
+    """
+    in_range = (
+        select(Price.market_date, Price.company_ticker, Price.close, Price.currency)
+        .where(Price.company_ticker.in_(tickers), Price.market_date.between(start, end))
+    )
+    before = (
+        select(Price.market_date, Price.company_ticker, Price.close, Price.currency)
+        .where(Price.company_ticker.in_(tickers), Price.market_date < start)
+        .distinct(Price.company_ticker)
+        .order_by(Price.company_ticker, Price.market_date.desc())
+    )
+    result = await session.execute(union_all(in_range, before.subquery().select()))
+    return DataFrame(result.all(), columns=["market_date", "company_ticker", "close", "currency"])
+
+
+def convert_closes(closes: DataFrame, rates: RateMatrix, base: CurrencyEnum, strict: bool = False) -> DataFrame:
+    """
+    Convert every close to base at the rate of its own market date. The closes without rate
+    become NaN, or raise a 400 error when strict.
+    """
+    closes = closes.copy()
+    converted = rates.convert(closes["close"], closes["currency"], closes["market_date"], base)
+    missing = np.isnan(converted) & ~np.isnan(closes["close"].to_numpy(dtype=float))
+    if strict and missing.any():
+        currencies = sorted({getattr(currency, "value", currency) for currency in closes["currency"][missing]}, key=str)
+        first = min(closes["market_date"][missing])
+        raise HTTPException(status_code=400, detail=f"No FX rate to convert {', '.join(map(str, currencies))} to {base.value} on {first}")
+    closes["close"] = converted
+    return closes
+
+
+def require_single_currency(closes: DataFrame):
+    """
+    Raise a 400 error when the closes are in more than one currency, their values cannot be added up.
+    """
+    if closes["currency"].map(lambda currency: getattr(currency, "value", currency)).nunique() > 1:
+        raise HTTPException(status_code=400, detail="The closes are in more than one currency, a base is required")
+
+
+def flows_and_prices(trades: DataFrame, closes: DataFrame, dates: np.ndarray) -> tuple[Index, np.ndarray, np.ndarray]:
+    """
+    Date x ticker matrices of the quantities traded and of the forward filled closes over the
+    sorted datetime64[D] array of dates, with the tickers of their columns.
+    Trades before the first date are traded on the first date.
+    """
+    ticker_index, tickers = factorize(concat([trades["company_ticker"], closes["company_ticker"]], ignore_index=True))
+    trade_columns, close_columns = ticker_index[:len(trades)], ticker_index[len(trades):]
+    shape = (len(dates), len(tickers))
+
+    trade_rows = np.searchsorted(dates, to_days(trades["date"]), side="left")
+    in_range = trade_rows < len(dates)
+    flows = np.zeros(shape)
+    np.add.at(flows, (trade_rows[in_range], trade_columns[in_range]), trades["quantity"].to_numpy(float)[in_range])
+
+    market_dates = to_days(closes["market_date"])
+    close_values = closes["close"].to_numpy(float)
+    prices = np.full(shape, np.nan)
+    before = market_dates < dates[0] if len(dates) else np.zeros(len(closes), bool)
+    if before.any():
+        # only the most recent close before the first date of each ticker goes on the first row
+        order = np.lexsort((market_dates[before], close_columns[before]))
+        columns = close_columns[before][order]
+        last = np.r_[columns[1:] != columns[:-1], True]
+        prices[0, columns[last]] = close_values[before][order][last]
+    in_range = ~before & (market_dates <= dates[-1]) if len(dates) else before
+    prices[np.searchsorted(dates, market_dates[in_range]), close_columns[in_range]] = close_values[in_range]
+    return tickers, flows, forward_fill(prices)
+
+
+def value_series(trades: DataFrame, closes: DataFrame, dates: np.ndarray) -> np.ndarray:
+    """
+    Daily value of a portfolio over the sorted datetime64[D] array of dates, computed as
+    the row sums of the elementwise product of the date x ticker holdings and closes matrices.
+    """
+    _, flows, prices = flows_and_prices(trades, closes, dates)
+    return np.nansum(np.cumsum(flows, axis=0) * prices, axis=1)
+
+
+def history(trades: DataFrame, closes: DataFrame, start: date, end: date, freq: FrequencyEnum) -> Series:
+    """
+    Value of a portfolio between start and end, sampled at the end of each period of freq.
+    """
+    dates = date_range(start, end, freq="D")
+    values = Series(value_series(trades, closes, dates.values.astype("datetime64[D]")), index=dates)
+    if freq != FrequencyEnum.daily:
+        values = values.resample(freq.to_pandas()).last()
+    return values
+
+
+def batch_values_query():
+    """
+    Value of the open holdings of every portfolio at the latest close and at the close before it,
+    summed per portfolio, currency and dates in one grouped query. The last two closes are read
+    once per held ticker, tickers with a single close did not change on the day.
+    """
+    held = select(Holding.company_ticker).where(Holding.quantity != 0).distinct().cte("held")
+    last_two = (
+        select(
+            Price.market_date, Price.close, Price.currency,
+            func.row_number().over(order_by=Price.market_date.desc()).label("rank")
+        )
+        .where(Price.company_ticker == held.c.company_ticker)
+        .order_by(Price.market_date.desc())
+        .limit(2)
+        .lateral("last_two")
+    )
+    closes = select(held.c.company_ticker, last_two).select_from(held.join(last_two, true())).cte("closes")
+    latest, previous = closes.alias("latest"), closes.alias("previous")
+    previous_date = func.coalesce(previous.c.market_date, latest.c.market_date)
+    return (
+        select(
+            Holding.portfolio_id, latest.c.currency, latest.c.market_date, previous_date.label("previous_date"),
+            func.count().label("holdings"),
+            func.sum(Holding.quantity * latest.c.close).label("market_value"),
+            func.sum(Holding.quantity * func.coalesce(previous.c.close, latest.c.close)).label("previous_value")
+        )
+        .join(latest, (latest.c.company_ticker == Holding.company_ticker) & (latest.c.rank == 1))
+        .outerjoin(previous, (previous.c.company_ticker == Holding.company_ticker) & (previous.c.rank == 2))
+        .where(Holding.quantity != 0)
+        .group_by(Holding.portfolio_id, latest.c.currency, latest.c.market_date, previous_date)
+    )
+
+
+async def load_batch_values(session: AsyncSession) -> tuple[DataFrame, DataFrame]:
+    """
+    Every portfolio, and the values of their priced holdings grouped by currency and dates.
+    """
+    portfolios = DataFrame((await session.execute(select(Portfolio.id, Portfolio.name))).all(), columns=["portfolio_id", "name"])
+    values = DataFrame((await session.execute(batch_values_query())).all(), columns=BATCH_COLUMNS)
+    return portfolios, values
+
+
+def batch_valuation(portfolios: DataFrame, values: DataFrame, rates: RateMatrix, base: CurrencyEnum) -> DataFrame:
+    """
+    Market value, previous value and day change of every portfolio in base, the portfolios without
+    priced holdings are worth 0. The values are converted at the rate of the date of their close,
+    so that the portfolios holding several currencies can be summed and sorted. The holdings
+    without a rate on either date are left out of the values and counted in unconverted_holdings.
+    """
+    values = values.copy()
+    market_factors = rates.factors(values["currency"], values["market_date"], base)
+    previous_factors = rates.factors(values["currency"], values["previous_date"], base)
+    converted = ~np.isnan(market_factors) & ~np.isnan(previous_factors)
+    holdings = values["holdings"].to_numpy(dtype=np.int64)
+    values["market_value"] = np.where(converted, values["market_value"].to_numpy(dtype=float) * market_factors, 0.0)
+    values["previous_value"] = np.where(converted, values["previous_value"].to_numpy(dtype=float) * previous_factors, 0.0)
+    values["holdings"] = np.where(converted, holdings, 0)
+    values["unconverted_holdings"] = np.where(converted, 0, holdings)
+    values["market_date"] = np.where(converted, to_days(values["market_date"]), np.datetime64("NaT"))
+    grouped = values.groupby("portfolio_id").agg(
+        market_value=("market_value", "sum"),
+        previous_value=("previous_value", "sum"),
+        holdings=("holdings", "sum"),
+        unconverted_holdings=("unconverted_holdings", "sum"),
+        market_date=("market_date", "max")
+    )
+    valuation = portfolios.join(grouped, on="portfolio_id")
+    valuation[["market_value", "previous_value"]] = valuation[["market_value", "previous_value"]].fillna(0.0)
+    for column in ["holdings", "unconverted_holdings"]:
+        valuation[column] = valuation[column].fillna(0).astype(int)
+    valuation["market_date"] = valuation["market_date"].dt.date
+    valuation["day_change"] = valuation["market_value"] - valuation["previous_value"]
+    previous = valuation["previous_value"].to_numpy(dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        valuation["day_change_pct"] = np.where(previous != 0, valuation["day_change"].to_numpy(dtype=float) / previous, np.nan)
+    valuation["base"] = base
+    return valuation
+
+
+def page_by_value(valuation: DataFrame, descending: bool, after: Optional[tuple[float, int]], limit: int) -> tuple[DataFrame, Optional[tuple[float, int]]]:
+    """
+    Page of the valuation sorted by market value, then by portfolio ID, starting after the
+    (market value, portfolio ID) key of the last row of the previous page.
+    Returns the page and the key of its last row when more rows follow.
+    """
+    value = valuation["market_value"].to_numpy(dtype=float)
+    portfolio_id = valuation["portfolio_id"].to_numpy(dtype=np.int64)
+    if after is not None:
+        last_value, last_id = after
+        beyond = value < last_value if descending else value > last_value
+        remaining = beyond | ((value == last_value) & (portfolio_id > last_id))
+        valuation, value, portfolio_id = valuation[remaining], value[remaining], portfolio_id[remaining]
+    order = np.lexsort((portfolio_id, -value if descending else value))
+    page = valuation.iloc[order[:limit]]
+    if len(order) <= limit:
+        return page, None
+    return page, (float(page["market_value"].iloc[-1]), int(page["portfolio_id"].iloc[-1]))
+
+
+TOTAL_COLUMNS = ["market_value", "cost_basis", "unrealized_pnl", "realized_pnl"]
+
+
+def valuation_totals(valuation: DataFrame) -> dict:
+    """
+    Totals of the valuation per currency of the holdings, None for the holdings without prices,
+    and overall totals, which are None when the priced holdings are in more than one currency.
+    """
+    currencies = valuation["currency"].map(lambda currency: getattr(currency, "value", currency))
+    grouped = valuation[TOTAL_COLUMNS].astype(float).groupby(currencies, dropna=False).sum()
+    by_currency = [
+        {"currency": None if isna(currency) else currency, **{column: float(row[column]) for column in TOTAL_COLUMNS}}
+        for currency, row in grouped.iterrows()
+    ]
+    if currencies.dropna().nunique() > 1:
+        totals = dict.fromkeys(TOTAL_COLUMNS)
+    else:
+        totals = {column: float(grouped[column].sum()) for column in TOTAL_COLUMNS}
+    return {**totals, "currencies": by_currency}
+
+
+def to_records(df: DataFrame) -> list[dict]:
+    """
+    DataFrame rows as dictionaries, with None instead of NaN.
+    """
+    return df.astype(object).where(df.notna(), None).to_dict("records")
@@ -0,0 +1,125 @@
+from typing import Awaitable, BinaryIO, Callable, Optional
+import numpy as np
+from pandas import DataFrame, read_csv, to_datetime, to_numeric
+from pandas.errors import ParserError
+from sqlalchemy import insert
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.companies.routers import create_companies
+from src.companies.schemas import CompanySchema, BulkStatusEnum
+from src.holdings.tracking import apply_positions
+from src.positions.models import Position, TypeEnum
+from src.positions.schemas import PositionImportReportSchema, PositionImportErrorSchema
+from src.response_cache import response_cache
+from src.util import iterate_in_thread, map_currencies
+
+CSV_COLUMNS = ["ticker", "quantity", "date", "price", "currency", "type"]
+TYPES = {position_type.value: position_type for position_type in TypeEnum}
+MAX_REPORTED_ERRORS = 1000
+
+
+def validate_chunk(chunk: DataFrame, portfolio_id: int) -> tuple[DataFrame, DataFrame]:
+    """
+    Coerce a chunk of the CSV to the positions columns.
+    Returns the valid positions and, for the invalid rows, the comma separated invalid columns.
+    """
+    missing = set(CSV_COLUMNS) - set(chunk.columns)
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(sorted(missing))}")
+    positions = DataFrame({
+        "portfolio_id": portfolio_id,
+        "company_ticker": chunk["ticker"].str.strip(),
+        "quantity": to_numeric(chunk["quantity"], errors="coerce"),
+        "date": to_datetime(chunk["date"], errors="coerce", format="ISO8601").dt.date,
+        "price": to_numeric(chunk["price"], errors="coerce"),
+        "currency": map_currencies(chunk["currency"]),
+        "type": chunk["type"].str.strip().map(TYPES)
+    }, index=chunk.index)
+    invalid = DataFrame({
+        "ticker": ~positions["company_ticker"].str.len().between(1, 20),
+        "quantity": ~(positions["quantity"] > 0),
+        "date": positions["date"].isna(),
+        "price": positions["price"].isna(),
+        "currency": positions["currency"].isna(),
+        "type": positions["type"].isna()
+    })
+    rejected = invalid.any(axis=1).to_numpy()
+    columns = np.array(invalid.columns)
+    details = DataFrame({
+        "detail": [f"Invalid {', '.join(columns[row])}" for row in invalid.to_numpy()[rejected]]
+    }, index=chunk.index[rejected])
+    return positions[~rejected], details
+
+
+def add_errors(report: PositionImportReportSchema, details: DataFrame):
+    """
+    Count the rejected rows and report them with their line in the file (header is line 1).
+    """
+    report.rows_rejected += len(details)
+    room = MAX_REPORTED_ERRORS - len(report.errors)
+    for index, detail in details["detail"].iloc[:max(room, 0)].items():
+        report.errors.append(PositionImportErrorSchema(line=index + 2, detail=detail))
+
+
+async def resolve_tickers(session: AsyncSession, tickers: list[str], known: set[str]) -> list[str]:
+    """
+    Resolve the tickers not seen yet with one existence query, creating the missing companies
+    in the session transaction. Adds the existing tickers to known and returns the created ones.
+    """
+    unseen = [ticker for ticker in tickers if ticker not in known]
+    created = []
+    if unseen:
+        results = await create_companies([CompanySchema(ticker=ticker) for ticker in unseen], session)
+        for result in results:
+            if result.status != BulkStatusEnum.not_found:
+                known.add(result.ticker)
+            if result.status == BulkStatusEnum.created:
+                created.append(result.ticker)
+    return created
+
+
+async def import_positions(
+    file: BinaryIO,
+    portfolio_id: int,
+    session: AsyncSession,
+    batch_size: int,
+    progress: Optional[Callable[[PositionImportReportSchema], Awaitable[None]]] = None
+) -> PositionImportReportSchema:
+    """
+    Stream a CSV of positions into the given portfolio, batch_size rows at a time.
+    Every batch is validated with vectorized operations, its new tickers are resolved at once
+    and its valid rows are inserted with one statement and committed with the holdings update.
+    Invalid rows are reported with their line number and do not stop the import.
+    """
+    report = PositionImportReportSchema()
+    known = set()
+    try:
+        chunks = read_csv(file, chunksize=batch_size, dtype=str, skipinitialspace=True)
+        async for chunk in iterate_in_thread(chunks):
+            report.rows_read += len(chunk)
+            positions, details = validate_chunk(chunk, portfolio_id)
+            created = await resolve_tickers(session, positions["company_ticker"].unique().tolist(), known)
+            unknown = ~positions["company_ticker"].isin(known)
+            if unknown.any():
+                add_errors(report, DataFrame({"detail": "Unknown ticker " + positions.loc[unknown, "company_ticker"]}))
+                positions = positions[~unknown]
+            add_errors(report, details)
+            try:
+                if not positions.empty:
+                    await session.execute(insert(Position), positions.to_dict("records"))
+                    await apply_positions(session, list(positions.itertuples(index=False)))
+                await session.commit()
+                await response_cache.bump("positions", "companies")
+                report.rows_imported += len(positions)
+                report.companies_created.extend(created)
+            except DBAPIError as e:
+                await session.rollback()
+                known.difference_update(created)
+                add_errors(report, DataFrame({"detail": f"Batch could not be inserted: {e.orig}"}, index=positions.index))
+            if progress is not None:
+                await progress(report)
+    except (ParserError, UnicodeDecodeError) as e:
+        if report.rows_read == 0:
+            raise ValueError("The uploaded file could not be parsed as a CSV") from e
+        report.errors.append(PositionImportErrorSchema(line=report.rows_read + 2, detail=f"The file could not be parsed any further: {e}"))
+    return report
@@ -1,17 +1,26 @@
+from datetime import date
 from io import StringIO
+from os import remove
+from typing import Optional
 from pandas import read_csv
 from pydantic import ValidationError
-from fastapi import APIRouter, Depends, HTTPException, UploadFile
-from sqlalchemy import select, delete
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, Query, Request, Response
+from sqlalchemy import select, delete, insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
-from src.database import get_async_session
-from src.util import get_or_404, get_responses
+from src.database import get_async_session, get_read_session
+from src.util import get_or_404, get_responses, spool_upload, get_page, after_cursor, stream_rows, schema_columns, dump_rows, json_response
+from src.schemas import ListFormatEnum
 from src.positions.models import Position
-from src.positions.schemas import PositionSchema, PositionUpdateSchema
+from src.positions.schemas import PositionSchema, PositionUpdateSchema, PositionImportReportSchema
+from src.positions.importing import import_positions, resolve_tickers
+from src.portfolios.models import Portfolio
+from src.jobs.queue import job_queue, Progress
+from src.jobs.schemas import JobSchema
 from src.prices.models import CurrencyEnum
-from src.companies.routers import get_company, add_company
-from src.companies.schemas import CompanySchema
+from src.holdings.models import Holding
+from src.holdings.tracking import apply_positions, recompute_holdings
+from src.response_cache import response_cache
 
 router = APIRouter(
     prefix="/positions",
@@ -20,55 +29,91 @@ router = APIRouter(
 
 responses = get_responses(Position)
 
-@router.get("/", response_model=list[PositionSchema])
-async def get_positions(session: AsyncSession = Depends(get_async_session)):
+@router.get("/", response_model=list[PositionSchema], responses={k: responses[k] for k in [200, 400, 422]})
+async def get_positions(
+    response: Response,
+    company_ticker: Optional[str] = None,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor header of the previous page"),
+    limit: int = Query(100, gt=0, le=1000),
+    format: ListFormatEnum = ListFormatEnum.json,
+    fast: bool = Query(False, description="Serialize the rows directly with orjson, skipping the response model validation"),
+    session: AsyncSession = Depends(get_read_session)
+):
     """
-    Get all positions.
+    Get positions ordered by ID, one page at a time.
+    With the ndjson and csv formats all the matching positions are streamed instead.
     """
-    result = await session.scalars(select(Position))
-    positions = result.fetchall()
-    return positions
+    keys = [Position.id]
+    filters = []
+    if company_ticker is not None:
+        filters.append(Position.company_ticker == company_ticker)
+    if start is not None:
+        filters.append(Position.date >= start)
+    if end is not None:
+        filters.append(Position.date <= end)
+    if format != ListFormatEnum.json:
+        query = select(
+            Position.id, Position.portfolio_id, Position.company_ticker, Position.quantity,
+            Position.date, Position.price, Position.currency, Position.type
+        ).where(*filters)
+        return stream_rows(after_cursor(query, keys, cursor), format)
+    if fast:
+        # the id is selected last for the cursor, it is not part of the schema
+        columns = schema_columns(Position, PositionSchema)
+        rows = await get_page(session, select(*columns, Position.id).where(*filters), keys, cursor, limit, response)
+        return json_response(dump_rows(rows, columns), response)
+    return await get_page(session, select(Position).where(*filters), keys, cursor, limit, response)
 
-async def check_position(position: PositionSchema, session: AsyncSession):
-    new_position = Position(**position.model_dump())
-    try:
-        await get_company(new_position.company_ticker, session)
-    except HTTPException as exception:
-        if exception.status_code == 404:
-            await add_company(CompanySchema(ticker=new_position.company_ticker), session)
-        else:
-            raise HTTPException(exception.status_code, exception.detail, exception.headers)
-    return new_position
+async def check_positions(positions: list[PositionSchema], session: AsyncSession):
+    """
+    Resolve the distinct tickers of the positions with one query, creating the missing companies
+    in the session transaction. Raises a 400 error when a ticker is unknown to the market data provider.
+    """
+    known = set()
+    await resolve_tickers(session, list(dict.fromkeys(position.company_ticker for position in positions)), known)
+    unknown = sorted({position.company_ticker for position in positions} - known)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"No Company with this ticker ({', '.join(unknown)}) was found")
 
 @router.post("/add", response_model=PositionSchema, status_code=201, responses={k: responses[k] for k in [201, 400, 422]})
 async def add_position(position: PositionSchema, session: AsyncSession = Depends(get_async_session)):
     """
     Add a new position.
     """
-    new_position = await check_position(position, session)
-    session.add(new_position)
+    await check_positions([position], session)
     try:
+        new_position = await session.scalar(insert(Position).values(**position.model_dump()).returning(Position))
+        await apply_positions(session, [new_position])
         await session.commit()
     except IntegrityError as e:
         print(e.detail)
         raise HTTPException(status_code=400, detail="Position could not be added")
-    await session.refresh(new_position)
+    await response_cache.bump("positions", "companies")
     return new_position
 
 @router.post("/add_bulk", response_model=list[PositionSchema], status_code=201, responses={k: responses[k] for k in [201, 400, 422]})
 async def add_positions(positions: list[PositionSchema], session: AsyncSession = Depends(get_async_session)):
     """
-    Add a bulk of new positions.
+    Add a bulk of new positions. The missing companies and the positions are created in a single transaction.
     """
-    new_positions = [await check_position(position, session) for position in positions]
-    session.add_all(new_positions)
+    if not positions:
+        return []
+    await check_positions(positions, session)
     try:
+        # one INSERT ... RETURNING for all the rows, the generated ids come back in the same round trip
+        result = await session.scalars(
+            insert(Position).returning(Position, sort_by_parameter_order=True),
+            [position.model_dump() for position in positions]
+        )
+        new_positions = result.all()
+        await apply_positions(session, new_positions)
         await session.commit()
     except IntegrityError as e:
         print(e)
         raise HTTPException(status_code=400, detail="One or more positions could not be added")
-    for position in new_positions:
-        await session.refresh(position)
+    await response_cache.bump("positions", "companies")
     return new_positions
 
 @router.post("/{portfolio_id}/upload_csv", response_model=list[PositionSchema], status_code=201, responses={k: responses[k] for k in [201, 400, 422]})
@@ -101,23 +146,77 @@ async def import_portfolio_positions(portfolio_id: int, file: UploadFile, sessio
     positions = await add_positions(positions, session)
     return positions
 
+@router.post("/{portfolio_id}/upload_csv/stream", response_model=PositionImportReportSchema, status_code=201, responses={k: responses[k] for k in [201, 400, 404, 422]})
+async def stream_portfolio_positions(
+    portfolio_id: int,
+    file: UploadFile,
+    batch_size: int = Query(1000, description="Rows inserted per batch", gt=0, le=50000),
+    session: AsyncSession = Depends(get_async_session)
+):
+    """
+    Import a csv file of positions into the given portfolio in batches, without loading the whole file.
+    Invalid rows are skipped and listed in the report.
+    """
+    await get_or_404(Portfolio, session, portfolio_id)
+    try:
+        return await import_positions(file.file, portfolio_id, session, batch_size)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/{portfolio_id}/upload_csv/async", response_model=JobSchema, status_code=202, responses={k: responses[k] for k in [404, 422]})
+async def import_portfolio_positions_async(
+    portfolio_id: int,
+    file: UploadFile,
+    batch_size: int = Query(1000, description="Rows inserted per batch", gt=0, le=50000),
+    session: AsyncSession = Depends(get_async_session)
+):
+    """
+    Import a csv file of positions into the given portfolio in a background job.
+    The progress and the final report are available at /jobs/{job_id}.
+    """
+    await get_or_404(Portfolio, session, portfolio_id)
+    path = await spool_upload(file)
+
+    async def run(job_session: AsyncSession, progress: Progress) -> dict:
+        async def report_progress(report: PositionImportReportSchema):
+            await progress(report.rows_read, [f"line {error.line}: {error.detail}" for error in report.errors])
+
+        with open(path, "rb") as spooled:
+            report = await import_positions(spooled, portfolio_id, job_session, batch_size, report_progress)
+        return report.model_dump(mode="json")
+
+    return await job_queue.submit("positions_csv_import", run, lambda: remove(path))
+
 @router.get("/{position_id}", response_model=PositionSchema, responses={k: responses[k] for k in [200, 404, 422]})
-async def get_position(position_id: int, session: AsyncSession = Depends(get_async_session)):
+async def get_position(position_id: int, session: AsyncSession = Depends(get_read_session)):
     """
     Get a position by ID.
     """
     return await get_or_404(Position, session, position_id)
 
 @router.get("/portfolio/{portfolio_id}", response_model=list[PositionSchema], responses={k: responses[k] for k in [200, 404, 422]})
-async def get_positions_of_a_portfolio(portfolio_id: int, session: AsyncSession = Depends(get_async_session)):
+async def get_positions_of_a_portfolio(
+    portfolio_id: int,
+    request: Request,
+    fast: bool = Query(False, description="Serialize the rows directly with orjson, skipping the response model validation"),
+    session: AsyncSession = Depends(get_read_session)
+):
     """
-    Get a list of positions by portfolio ID.
+    Get a list of positions by portfolio ID. The response is cached until a position changes and carries an ETag.
     """
-    result = await session.scalars(select(Position).where(Position.portfolio_id == portfolio_id))
-    positions = result.fetchall()
-    if not positions:
-        raise HTTPException(status_code=404, detail=f"{Position.__name__}s not found for the given portfolio ID")
-    return positions
+    columns = schema_columns(Position, PositionSchema)
+
+    async def build(response: Response) -> list[Position] | bytes:
+        if fast:
+            result = await session.execute(select(*columns).where(Position.portfolio_id == portfolio_id))
+        else:
+            result = await session.scalars(select(Position).where(Position.portfolio_id == portfolio_id))
+        positions = result.fetchall()
+        if not positions:
+            raise HTTPException(status_code=404, detail=f"{Position.__name__}s not found for the given portfolio ID")
+        return dump_rows(positions, columns) if fast else positions
+
+    return await response_cache.respond(request, session, ["positions"], None if fast else list[PositionSchema], build)
 
 @router.put("/{position_id}", response_model=PositionSchema, responses={k: responses[k] for k in [200, 400, 404, 422]})
 async def update_position(position_id: int, position: PositionUpdateSchema, session: AsyncSession = Depends(get_async_session)):
@@ -125,14 +224,17 @@ async def update_position(position_id: int, position: PositionUpdateSchema, sess
     Update a position by ID.
     """
     result = await get_or_404(Position, session, position_id)
+    pairs = {(result.portfolio_id, result.company_ticker)}
     for key, value in position.model_dump().items():
         if value is not None:
             setattr(result, key, value)
-    try: 
+    pairs.add((result.portfolio_id, result.company_ticker))
+    try:
+        await recompute_holdings(session, pairs)
         await session.commit()
     except IntegrityError:
         raise HTTPException(status_code=400, detail="Position could not be updated")
-    await session.refresh(result)
+    await response_cache.bump("positions")
     return result
 
 @router.delete("/{position_id}", response_model=PositionSchema, responses={k: responses[k] for k in [200, 404, 422]})
@@ -142,7 +244,9 @@ async def delete_position(position_id: int, session: AsyncSession = Depends(get_
     """
     result = await get_or_404(Position, session, position_id)
     await session.delete(result)
+    await recompute_holdings(session, {(result.portfolio_id, result.company_ticker)})
     await session.commit()
+    await response_cache.bump("positions")
     return result
 
 @router.delete("/delete_all/", responses={k: responses[k] for k in [200, 422]})
@@ -151,5 +255,7 @@ async def delete_all_positions(session: AsyncSession = Depends(get_async_session
     Delete all positions.
     """
     await session.execute(delete(Position))
+    await session.execute(delete(Holding))
     await session.commit()
+    await response_cache.bump("positions")
     return {'detail': 'done'}
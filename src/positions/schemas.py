@@ -28,4 +28,21 @@ class PositionUpdateSchema(CustomModel):
     price: Optional[float] = Field(..., description="Price of the position")
     currency: Optional[CurrencyEnum] = Field(..., description="Currency of the position")
     type: Optional[TypeEnum] = Field(..., description="Type of the position (buy/sell)")
-    
\ No newline at end of file
+
+class PositionImportErrorSchema(CustomModel):
+    """
+    Schema for a row of a CSV import that could not be imported.
+    """
+    line: int = Field(..., description="Line of the row in the file, the header being line 1")
+    detail: str = Field(..., description="Reason why the row was rejected")
+
+class PositionImportReportSchema(CustomModel):
+    """
+    Schema for the report of a streaming CSV import.
+    """
+    rows_read: int = Field(0, description="Rows read from the file")
+    rows_imported: int = Field(0, description="Positions created")
+    rows_rejected: int = Field(0, description="Rows that could not be imported")
+    companies_created: list[str] = Field([], description="Tickers of the companies created by the import")
+    errors: list[PositionImportErrorSchema] = Field([], description="Rejected rows, the first 1000 at most")
+
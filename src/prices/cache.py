@@ -0,0 +1,142 @@
+from collections import OrderedDict
+from datetime import date
+from typing import Iterable, NamedTuple, Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.config import settings
+from src.prices.models import Price, CurrencyEnum
+from src.response_cache import response_cache
+
+
+class LatestPrice(NamedTuple):
+    market_date: date
+    close: float
+    currency: CurrencyEnum
+
+
+def latest_prices_query(tickers: Optional[list[str]] = None, limit: Optional[int] = None):
+    query = (
+        select(Price.company_ticker, Price.market_date, Price.close, Price.currency)
+        .distinct(Price.company_ticker)
+        .order_by(Price.company_ticker, Price.market_date.desc())
+    )
+    if tickers is not None:
+        query = query.where(Price.company_ticker.in_(tickers))
+    return query.limit(limit)
+
+
+class LatestPriceCache:
+    """
+    Bounded LRU cache of the latest close of each ticker, None for the tickers without prices.
+    The cache lives in the process: the writes made through the API and the ingestion keep it
+    up to date, and it is dropped when the shared prices version changes, so that the writes of
+    the other processes are seen on the next read. Writes made directly on the database are
+    only seen after a bump of that version.
+    """
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.entries: OrderedDict[str, Optional[LatestPrice]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # incremented on every write, loads that overlap a write are not stored
+        self.version = 0
+        # shared prices version the entries were loaded at
+        self.shared: Optional[int] = None
+
+    def put(self, ticker: str, latest: Optional[LatestPrice]):
+        self.entries[ticker] = latest
+        self.entries.move_to_end(ticker)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    async def sync(self, session: AsyncSession):
+        """
+        Drop every entry when the shared prices version changed since they were loaded.
+        """
+        shared = (await response_cache.versions(session, ["prices"]))["prices"]
+        if shared != self.shared:
+            self.invalidate()
+            self.shared = shared
+
+    async def warm(self, session: AsyncSession):
+        """
+        Fill the cache with the latest close of up to max_size tickers with one grouped query.
+        """
+        await self.sync(session)
+        version = self.version
+        result = await session.execute(latest_prices_query(limit=self.max_size))
+        if version == self.version:
+            for ticker, market_date, close, currency in result.tuples():
+                self.put(ticker, LatestPrice(market_date, close, currency))
+
+    async def get_many(self, session: AsyncSession, tickers: Iterable[str]) -> dict[str, Optional[LatestPrice]]:
+        """
+        Latest close of each ticker, the ones not cached are loaded with a single query.
+        """
+        await self.sync(session)
+        found, missing = {}, []
+        for ticker in dict.fromkeys(tickers):
+            if ticker in self.entries:
+                self.hits += 1
+                self.entries.move_to_end(ticker)
+                found[ticker] = self.entries[ticker]
+            else:
+                self.misses += 1
+                missing.append(ticker)
+        if missing:
+            version = self.version
+            result = await session.execute(latest_prices_query(missing))
+            loaded = dict.fromkeys(missing)
+            for ticker, market_date, close, currency in result.tuples():
+                loaded[ticker] = LatestPrice(market_date, close, currency)
+            if version == self.version:
+                for ticker, latest in loaded.items():
+                    self.put(ticker, latest)
+            found.update(loaded)
+        return found
+
+    def written(self, ticker: str, market_date: date, close: float, currency: CurrencyEnum):
+        """
+        Record a committed insert or update of a price, only the tickers already cached are touched.
+        """
+        self.version += 1
+        if ticker in self.entries:
+            latest = self.entries[ticker]
+            if latest is None or market_date >= latest.market_date:
+                self.entries[ticker] = LatestPrice(market_date, close, currency)
+
+    def deleted(self, ticker: str, market_date: date):
+        """
+        Record a committed delete of a price, the previous close is loaded again on the next read.
+        """
+        self.version += 1
+        latest = self.entries.get(ticker)
+        if latest is not None and market_date >= latest.market_date:
+            del self.entries[ticker]
+
+    def invalidate(self, tickers: Optional[Iterable[str]] = None):
+        """
+        Drop the given tickers, or every ticker when none are given.
+        """
+        self.version += 1
+        if tickers is None:
+            self.entries.clear()
+            return
+        for ticker in tickers:
+            self.entries.pop(ticker, None)
+
+    def stats(self) -> dict:
+        requests = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / requests if requests else 0
+        }
+
+
+latest_prices = LatestPriceCache(settings.price_cache_size)
@@ -0,0 +1,212 @@
+"""
+Price history ingestion: pulls daily closes from the market data provider or from a local
+CSV/Parquet file, streams them in chunks and writes them into the prices table with COPY.
+
+    python -m src.prices.ingestion --tickers AAPL MSFT --start 2005-01-01
+    python -m src.prices.ingestion --file prices.parquet
+"""
+from argparse import ArgumentParser
+from asyncio import gather, run
+from datetime import date
+from time import perf_counter
+from typing import AsyncIterator, Awaitable, Callable, Iterator, Optional
+from pandas import DataFrame, read_csv, to_datetime, to_numeric
+from pyarrow.parquet import ParquetFile
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.config import settings
+from src.database import async_session_maker
+from src.market_data.gateway import gateway
+from src.prices.models import CurrencyEnum
+from src.prices.cache import latest_prices
+from src.prices.partitions import price_partitions
+from src.prices.rollups import update_rollups
+from src.prices.store import price_store
+from src.prices.schemas import IngestionReportSchema
+from src.util import iterate_in_thread, map_currencies
+
+PRICE_COLUMNS = ["company_ticker", "market_date", "close", "currency"]
+CURRENCY_CODES = {currency.value for currency in CurrencyEnum}
+
+CREATE_STAGING = text(
+    "CREATE TEMP TABLE IF NOT EXISTS prices_staging "
+    "(company_ticker varchar(20), market_date date, close float8, currency text) ON COMMIT DELETE ROWS"
+)
+ON_CONFLICT = {
+    "nothing": "DO NOTHING",
+    "update": "DO UPDATE SET close = EXCLUDED.close, currency = EXCLUDED.currency"
+}
+
+
+def normalize_prices(df: DataFrame) -> DataFrame:
+    """
+    Coerce a chunk to the prices columns, dropping the rows that cannot be stored.
+    Currencies can be given either as codes or as symbols.
+    """
+    df = df.rename(columns={"ticker": "company_ticker", "date": "market_date"})
+    missing = set(PRICE_COLUMNS) - set(df.columns)
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(sorted(missing))}")
+    df = df[PRICE_COLUMNS].copy()
+    df["market_date"] = to_datetime(df["market_date"], errors="coerce").dt.date
+    df["close"] = to_numeric(df["close"], errors="coerce")
+    df["currency"] = map_currencies(df["currency"]).map(lambda currency: currency.value if currency else None)
+    df = df.dropna()
+    df = df[df["close"] > 0]
+    return df.drop_duplicates(subset=["company_ticker", "market_date"], keep="last")
+
+
+def split_chunk(df: DataFrame, size: int) -> Iterator[DataFrame]:
+    for start in range(0, len(df), size):
+        yield df.iloc[start:start + size]
+
+
+async def provider_chunks(tickers: list[str], start: date, end: date, batch_size: int, errors: list[str]) -> AsyncIterator[DataFrame]:
+    """
+    Fetch the history of the tickers in batches, one provider call per batch.
+    The currency of each ticker is taken from its info.
+    """
+    for i in range(0, len(tickers), batch_size):
+        batch = tickers[i:i + batch_size]
+        try:
+            history, infos = await gather(
+                gateway.get_history(batch, start, end),
+                gather(*(gateway.get_info(ticker) for ticker in batch), return_exceptions=True)
+            )
+        except Exception as e:
+            errors.append(f"{', '.join(batch)}: history could not be downloaded ({e})")
+            continue
+        currencies = {}
+        for ticker, info in zip(batch, infos):
+            currency = None if isinstance(info, Exception) else info.get("currency")
+            if currency not in CURRENCY_CODES:
+                errors.append(f"{ticker}: unknown or unsupported currency ({currency})")
+                continue
+            currencies[ticker] = currency
+        yield history.assign(currency=history["company_ticker"].map(currencies))
+
+
+def file_chunks(path: str, chunk_size: int) -> Iterator[DataFrame]:
+    """
+    Read a CSV or Parquet file in chunks of chunk_size rows.
+    """
+    if path.endswith(".parquet"):
+        for batch in ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        yield from read_csv(path, chunksize=chunk_size)
+
+
+async def write_prices(session: AsyncSession, df: DataFrame, on_conflict: str = "nothing") -> int:
+    """
+    COPY a chunk into a staging table and move it into prices with INSERT ... ON CONFLICT.
+    Rows of unknown companies are skipped and the rollups of the periods written are recomputed.
+    Returns the number of rows written.
+    """
+    if df.empty:
+        return 0
+    await price_partitions.ensure_dates(df["market_date"].unique())
+    # executing through the session first opens the transaction the COPY has to be part of
+    await session.execute(CREATE_STAGING)
+    connection = await session.connection()
+    raw_connection = await connection.get_raw_connection()
+    await raw_connection.driver_connection.copy_records_to_table(
+        "prices_staging",
+        records=df[PRICE_COLUMNS].itertuples(index=False, name=None),
+        columns=PRICE_COLUMNS
+    )
+    result = await session.execute(text(
+        "INSERT INTO prices (company_ticker, market_date, close, currency) "
+        "SELECT s.company_ticker, s.market_date, s.close, s.currency::currencyenum "
+        "FROM prices_staging s JOIN companies c ON c.ticker = s.company_ticker "
+        f"ON CONFLICT (company_ticker, market_date) {ON_CONFLICT[on_conflict]}"
+    ))
+    await session.execute(text("TRUNCATE prices_staging"))
+    if result.rowcount:
+        await update_rollups(session, df["company_ticker"].unique(), df["market_date"].min(), df["market_date"].max())
+    return result.rowcount
+
+
+async def ingest(
+    chunks: AsyncIterator[DataFrame],
+    session: AsyncSession,
+    report: IngestionReportSchema,
+    on_conflict: str = "nothing",
+    progress: Optional[Callable[[IngestionReportSchema], Awaitable[None]]] = None
+) -> IngestionReportSchema:
+    """
+    Write the chunks into the prices table, committing after each one, then sync the years
+    written into the local price store.
+    """
+    started = perf_counter()
+    years = set()
+    async for chunk in chunks:
+        for part in split_chunk(chunk, settings.price_ingest_chunk_size):
+            prices = normalize_prices(part)
+            written = await write_prices(session, prices, on_conflict)
+            await session.commit()
+            latest_prices.invalidate(prices["company_ticker"].unique())
+            await price_store.mark(prices["market_date"].unique())
+            years.update(market_date.year for market_date in prices["market_date"].unique())
+            report.rows_read += len(part)
+            report.rows_written += written
+            report.rows_skipped += len(part) - written
+            report.seconds = perf_counter() - started
+            report.rows_per_second = report.rows_read / report.seconds
+            if progress is not None:
+                await progress(report)
+    try:
+        await price_store.sync(session, years)
+    except Exception as e:
+        report.errors.append(f"The price store could not be synced, retried on the next read ({e})")
+    report.seconds = perf_counter() - started
+    report.rows_per_second = report.rows_read / report.seconds if report.seconds else 0
+    return report
+
+
+async def ingest_from_provider(
+    tickers: list[str],
+    session: AsyncSession,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    batch_size: int = 50,
+    on_conflict: str = "nothing",
+    progress: Optional[Callable[[IngestionReportSchema], Awaitable[None]]] = None
+) -> IngestionReportSchema:
+    report = IngestionReportSchema()
+    chunks = provider_chunks(tickers, start or settings.price_history_start, end or date.today(), batch_size, report.errors)
+    return await ingest(chunks, session, report, on_conflict, progress)
+
+
+async def ingest_from_file(
+    path: str,
+    session: AsyncSession,
+    on_conflict: str = "nothing",
+    progress: Optional[Callable[[IngestionReportSchema], Awaitable[None]]] = None
+) -> IngestionReportSchema:
+    chunks = iterate_in_thread(file_chunks(path, settings.price_ingest_chunk_size))
+    return await ingest(chunks, session, IngestionReportSchema(), on_conflict, progress)
+
+
+async def main(tickers: list[str], file: Optional[str], start: Optional[date], end: Optional[date], batch_size: int):
+    async def print_progress(report: IngestionReportSchema):
+        print(f"{report.rows_read} rows read, {report.rows_written} written, {report.rows_per_second:.0f} rows/s")
+
+    async with async_session_maker() as session:
+        if file:
+            report = await ingest_from_file(file, session, progress=print_progress)
+        else:
+            report = await ingest_from_provider(tickers, session, start, end, batch_size, progress=print_progress)
+    print(report.model_dump_json(indent=2))
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Ingest price history into the prices table")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--tickers", nargs="+", help="Tickers to download from the market data provider")
+    source.add_argument("--file", help="CSV or Parquet file with company_ticker, market_date, close and currency columns")
+    parser.add_argument("--start", type=date.fromisoformat)
+    parser.add_argument("--end", type=date.fromisoformat)
+    parser.add_argument("--batch-size", type=int, default=50)
+    args = parser.parse_args()
+    run(main(args.tickers, args.file, args.start, args.end, args.batch_size))
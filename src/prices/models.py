@@ -1,8 +1,9 @@
-from sqlalchemy import ForeignKey, Enum
+from sqlalchemy import ForeignKey, Enum, Index
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from datetime import date
 from src.database import Base
 from enum import Enum as pyEnum
+from src.schemas import FrequencyEnum
 
 class CurrencyEnum(str, pyEnum):
     USD = "USD"  # US Dollar
@@ -61,9 +62,31 @@ class CurrencyEnum(str, pyEnum):
 
 class Price(Base):
     __tablename__ = "prices"
+    # one partition per year, created by src.prices.partitions; the primary key serves the ticker lookups
+    # and BRIN serves the date ranges, the dates of a partition being mostly inserted in order
+    __table_args__ = (
+        Index("ix_prices_market_date_brin", "market_date", postgresql_using="brin"),
+        {"postgresql_partition_by": "RANGE (market_date)"}
+    )
     
-    company_ticker: Mapped[str] = mapped_column(ForeignKey("companies.ticker", ondelete="CASCADE", onupdate="CASCADE"), primary_key=True, index=True)
+    company_ticker: Mapped[str] = mapped_column(ForeignKey("companies.ticker", ondelete="CASCADE", onupdate="CASCADE"), primary_key=True)
     company: Mapped["Company"] = relationship(back_populates="prices")
-    market_date: Mapped[date] = mapped_column(primary_key=True, index=True)
+    market_date: Mapped[date] = mapped_column(primary_key=True)
     close: Mapped[float] = mapped_column(nullable=False)
     currency: Mapped[CurrencyEnum] = mapped_column(Enum(CurrencyEnum, name='currencyenum'), nullable=False)
+
+class PriceRollup(Base):
+    __tablename__ = "price_rollups"
+    # weekly and monthly aggregates of the daily closes, maintained by src.prices.rollups
+
+    company_ticker: Mapped[str] = mapped_column(ForeignKey("companies.ticker", ondelete="CASCADE", onupdate="CASCADE"), primary_key=True)
+    freq: Mapped[FrequencyEnum] = mapped_column(Enum(FrequencyEnum, name="frequencyenum"), primary_key=True)
+    period_start: Mapped[date] = mapped_column(primary_key=True)
+    last_date: Mapped[date] = mapped_column(nullable=False)
+    open: Mapped[float] = mapped_column(nullable=False)
+    high: Mapped[float] = mapped_column(nullable=False)
+    low: Mapped[float] = mapped_column(nullable=False)
+    close: Mapped[float] = mapped_column(nullable=False)
+    mean: Mapped[float] = mapped_column(nullable=False)
+    days: Mapped[int] = mapped_column(nullable=False)
+    currency: Mapped[CurrencyEnum] = mapped_column(Enum(CurrencyEnum, name='currencyenum'), nullable=False)
@@ -0,0 +1,88 @@
+"""
+Yearly partitions of the prices table. A partition is created before the first write of its
+year; rows of a year without partition land in prices_default and are moved into the
+partition when it is created.
+
+    python -m src.prices.partitions --years 2000 2030
+"""
+from argparse import ArgumentParser
+from asyncio import run
+from datetime import date
+from typing import Iterable
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+from src.database import engine
+
+DEFAULT_PARTITION = "prices_default"
+# serializes the partition changes of concurrent writers
+LOCK_KEY = 7_210_421
+
+
+def partition_name(year: int) -> str:
+    return f"prices_{year}"
+
+
+async def existing_years(connection: AsyncConnection) -> set[int]:
+    result = await connection.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = 'prices'::regclass"
+    ))
+    return {int(name.removeprefix("prices_")) for name in result.scalars() if name.removeprefix("prices_").isdigit()}
+
+
+async def create_partition(connection: AsyncConnection, year: int):
+    """
+    Create the partition of a year, moving its rows out of the default partition.
+    The partition is built detached and then attached, which only blocks the reads and writes
+    of the default partition instead of the whole table.
+    """
+    name, start, end = partition_name(year), date(year, 1, 1), date(year + 1, 1, 1)
+    await connection.execute(text(f"CREATE TABLE {name} (LIKE prices INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    await connection.execute(text(
+        f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE market_date >= :start AND market_date < :end RETURNING *) "
+        f"INSERT INTO {name} SELECT * FROM moved"
+    ), {"start": start, "end": end})
+    await connection.execute(text(f"ALTER TABLE prices ATTACH PARTITION {name} FOR VALUES FROM ('{start}') TO ('{end}')"))
+
+
+class PricePartitions:
+    """
+    Years of the existing partitions, loaded once per process.
+    """
+    def __init__(self):
+        self.years: set[int] | None = None
+
+    async def ensure(self, years: Iterable[int]) -> list[int]:
+        """
+        Create the missing partitions of the years in their own transaction. Returns the years created.
+        """
+        years = set(years)
+        if self.years is not None and years <= self.years:
+            return []
+        async with engine.begin() as connection:
+            await connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": LOCK_KEY})
+            self.years = await existing_years(connection)
+            created = sorted(years - self.years)
+            for year in created:
+                await create_partition(connection, year)
+        self.years |= set(created)
+        return created
+
+    async def ensure_dates(self, dates: Iterable[date]) -> list[int]:
+        return await self.ensure({market_date.year for market_date in dates})
+
+
+price_partitions = PricePartitions()
+
+
+async def main(first: int, last: int):
+    created = await price_partitions.ensure(range(first, last + 1))
+    await engine.dispose()
+    print(f"{len(created)} partitions created{': ' + ', '.join(map(str, created)) if created else ''}")
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Create the yearly partitions of the prices table")
+    parser.add_argument("--years", type=int, nargs=2, metavar=("FIRST", "LAST"), default=[date.today().year, date.today().year + 1])
+    args = parser.parse_args()
+    run(main(*args.years))
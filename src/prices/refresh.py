@@ -0,0 +1,125 @@
+"""
+Incremental price refresh: only the days after the last stored close of each company are
+requested from the provider, tickers sharing the same gap are downloaded together.
+
+    python -m src.prices.refresh
+"""
+from argparse import ArgumentParser
+from asyncio import run, sleep
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from logging import getLogger
+from typing import AsyncIterator, Optional
+from pandas import DataFrame
+from sqlalchemy import select, func, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.config import settings
+from src.database import async_session_maker, engine
+from src.companies.models import Company
+from src.prices.models import Price
+from src.prices.schemas import IngestionReportSchema
+from src.prices.ingestion import ingest, provider_chunks
+from src.fx.loading import load_rates_from_provider
+import src.portfolios.models
+import src.positions.models
+
+logger = getLogger(__name__)
+# advisory lock held by the process running the scheduled refresh
+REFRESH_LOCK_KEY = 7_210_422
+
+
+async def get_last_market_dates(session: AsyncSession) -> dict[str, Optional[date]]:
+    """
+    Last stored market date of every company, None for the companies without prices.
+    """
+    result = await session.execute(
+        select(Company.ticker, func.max(Price.market_date))
+        .outerjoin(Price, Price.company_ticker == Company.ticker)
+        .group_by(Company.ticker)
+    )
+    return dict(result.all())
+
+
+def group_gaps(last_dates: dict[str, Optional[date]], end: date) -> dict[date, list[str]]:
+    """
+    Group the tickers by the first date to fetch. The last stored day is fetched again so that
+    a close stored while the market was still open gets replaced.
+    """
+    gaps = defaultdict(list)
+    for ticker, last_date in last_dates.items():
+        start = last_date or settings.price_history_start
+        if start <= end:
+            gaps[start].append(ticker)
+    return gaps
+
+
+async def refresh_chunks(gaps: dict[date, list[str]], end: date, batch_size: int, errors: list[str]) -> AsyncIterator[DataFrame]:
+    for start, tickers in sorted(gaps.items()):
+        async for chunk in provider_chunks(tickers, start, end, batch_size, errors):
+            yield chunk
+
+
+async def refresh_prices(session: AsyncSession, end: Optional[date] = None, batch_size: int = 50) -> IngestionReportSchema:
+    """
+    Fetch and upsert the missing days of every company.
+    """
+    end = end or date.today()
+    gaps = group_gaps(await get_last_market_dates(session), end)
+    report = IngestionReportSchema()
+    return await ingest(refresh_chunks(gaps, end, batch_size, report.errors), session, report, on_conflict="update")
+
+
+def seconds_until(at: time) -> float:
+    now = datetime.now()
+    next_run = datetime.combine(now.date(), at)
+    if next_run <= now:
+        next_run += timedelta(days=1)
+    return (next_run - now).total_seconds()
+
+
+async def schedule_price_refresh(at: time):
+    """
+    Background task refreshing the prices and the FX rates every day at the given time.
+    Every worker of the app runs it, the one that takes the advisory lock refreshes and the others skip the day.
+    """
+    while True:
+        await sleep(seconds_until(at))
+        try:
+            async with engine.connect() as connection:
+                if not await connection.scalar(text("SELECT pg_try_advisory_lock(:key)"), {"key": REFRESH_LOCK_KEY}):
+                    logger.info("Price refresh skipped, another process is running it")
+                    continue
+                # the lock is held by the connection, not by the transaction
+                await connection.commit()
+                try:
+                    await run_refresh()
+                finally:
+                    await connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": REFRESH_LOCK_KEY})
+                    await connection.commit()
+        except Exception:
+            logger.exception("Price refresh failed")
+
+
+async def run_refresh():
+    async with async_session_maker() as session:
+        report = await refresh_prices(session)
+    logger.info("Prices refreshed: %s rows written in %.1fs", report.rows_written, report.seconds)
+    for error in report.errors:
+        logger.warning("Price refresh: %s", error)
+    async with async_session_maker() as session:
+        fx_report = await load_rates_from_provider(session)
+    logger.info("FX rates refreshed: %s rows written", fx_report.rows_written)
+
+
+async def main(end: Optional[date], batch_size: int):
+    async with async_session_maker() as session:
+        report = await refresh_prices(session, end, batch_size)
+    print(report.model_dump_json(indent=2))
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Fetch the missing days of price history of every company")
+    parser.add_argument("--end", type=date.fromisoformat)
+    parser.add_argument("--batch-size", type=int, default=50)
+    args = parser.parse_args()
+    run(main(args.end, args.batch_size))
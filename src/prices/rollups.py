@@ -0,0 +1,95 @@
+"""
+Weekly and monthly rollups of the daily closes: first, highest, lowest, last and mean close of
+every period. The price writes recompute the periods they touch in their own transaction, so a
+long range at a coarse frequency reads one row per period instead of one per day.
+
+    python -m src.prices.rollups --rebuild
+"""
+from argparse import ArgumentParser
+from asyncio import run
+from datetime import date, timedelta
+from typing import Iterable, Optional
+from sqlalchemy import delete, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.database import async_session_maker, engine
+from src.prices.models import PriceRollup
+from src.schemas import FrequencyEnum
+import src.companies.models
+import src.portfolios.models
+import src.positions.models
+
+ROLLUP_UNITS = {FrequencyEnum.weekly: "week", FrequencyEnum.monthly: "month"}
+
+
+def rollup_for(freq: FrequencyEnum) -> Optional[FrequencyEnum]:
+    """
+    Rollup read for a frequency, None for the daily prices.
+    Weeks do not nest into months, so every frequency has its own rollup.
+    """
+    return freq if freq in ROLLUP_UNITS else None
+
+
+def period_start(freq: FrequencyEnum, day: date) -> date:
+    if freq == FrequencyEnum.weekly:
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def next_period_start(freq: FrequencyEnum, day: date) -> date:
+    start = period_start(freq, day)
+    if freq == FrequencyEnum.weekly:
+        return start + timedelta(days=7)
+    return date(start.year + start.month // 12, start.month % 12 + 1, 1)
+
+
+def insert_rollups(freq: FrequencyEnum, tickers: bool):
+    unit = ROLLUP_UNITS[freq]
+    return text(
+        "INSERT INTO price_rollups (company_ticker, freq, period_start, last_date, open, high, low, close, mean, days, currency) "
+        f"SELECT company_ticker, '{freq.name}'::frequencyenum, date_trunc('{unit}', market_date)::date AS period_start, max(market_date), "
+        "(array_agg(close ORDER BY market_date))[1], max(close), min(close), (array_agg(close ORDER BY market_date DESC))[1], "
+        "avg(close), count(*), (array_agg(currency ORDER BY market_date DESC))[1] "
+        "FROM prices WHERE market_date >= :start AND market_date < :end "
+        f"{'AND company_ticker = ANY(:tickers) ' if tickers else ''}"
+        "GROUP BY company_ticker, period_start"
+    )
+
+
+async def update_rollups(session: AsyncSession, tickers: Iterable[str], start: date, end: date):
+    """
+    Recompute the rollups of the periods of the tickers that overlap start..end, in the session transaction.
+    """
+    tickers = list(dict.fromkeys(tickers))
+    if not tickers:
+        return
+    for freq in ROLLUP_UNITS:
+        first, stop = period_start(freq, start), next_period_start(freq, end)
+        await session.execute(delete(PriceRollup).where(
+            PriceRollup.freq == freq, PriceRollup.company_ticker.in_(tickers),
+            PriceRollup.period_start >= first, PriceRollup.period_start < stop
+        ))
+        await session.execute(insert_rollups(freq, tickers=True), {"tickers": tickers, "start": first, "end": stop})
+
+
+async def rebuild_rollups(session: AsyncSession):
+    """
+    Recompute every rollup, needed after prices are written directly on the database.
+    """
+    await session.execute(delete(PriceRollup))
+    for freq in ROLLUP_UNITS:
+        await session.execute(insert_rollups(freq, tickers=False), {"start": date.min, "end": date.max})
+    await session.commit()
+
+
+async def main():
+    async with async_session_maker() as session:
+        await rebuild_rollups(session)
+    await engine.dispose()
+    print("Rollups rebuilt")
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Rebuild the weekly and monthly price rollups")
+    parser.add_argument("--rebuild", action="store_true", required=True)
+    parser.parse_args()
+    run(main())
@@ -1,12 +1,23 @@
 from datetime import date
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import select
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import select, insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
-from src.database import get_async_session
-from src.util import get_or_404, get_responses
+from src.database import get_async_session, get_read_session
+from src.util import get_or_404, update_or_404, get_responses, get_page, after_cursor, stream_rows, schema_columns, dump_rows, json_response
+from src.schemas import ListFormatEnum, FrequencyEnum
 from src.prices.models import Price
-from src.prices.schemas import PriceSchema, PriceUpdateSchema
+from src.prices.schemas import PriceSchema, PriceUpdateSchema, IngestionSchema, IngestionReportSchema, PriceSeriesSchema, SeriesFormatEnum, PriceCacheStatsSchema
+from src.prices.cache import latest_prices
+from src.prices.partitions import price_partitions
+from src.prices.rollups import update_rollups
+from src.prices.store import price_store
+from src.prices.series import load_series, series_json, series_arrow, ARROW_MEDIA_TYPE
+from src.prices.ingestion import ingest_from_provider
+from src.prices.refresh import refresh_prices
+from src.jobs.queue import job_queue, Progress
+from src.jobs.schemas import JobSchema
 
 router = APIRouter(
     prefix="/prices",
@@ -15,31 +26,143 @@ router = APIRouter(
 
 responses = get_responses(Price)
 
-@router.get("/", response_model=list[PriceSchema])
-async def get_prices(session: AsyncSession = Depends(get_async_session)):
+@router.get("/", response_model=list[PriceSchema], responses={k: responses[k] for k in [200, 400, 422]})
+async def get_prices(
+    response: Response,
+    company_ticker: Optional[str] = None,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor header of the previous page"),
+    limit: int = Query(100, gt=0, le=1000),
+    format: ListFormatEnum = ListFormatEnum.json,
+    fast: bool = Query(False, description="Serialize the rows directly with orjson, skipping the response model validation"),
+    session: AsyncSession = Depends(get_read_session)
+):
     """
-    Get all prices.
+    Get prices ordered by ticker and date, one page at a time.
+    With the ndjson and csv formats all the matching prices are streamed instead.
     """
-    result = await session.scalars(select(Price))
-    prices = result.fetchall()
-    return prices
+    keys = [Price.company_ticker, Price.market_date]
+    filters = []
+    if company_ticker is not None:
+        filters.append(Price.company_ticker == company_ticker)
+    if start is not None:
+        filters.append(Price.market_date >= start)
+    if end is not None:
+        filters.append(Price.market_date <= end)
+    if format != ListFormatEnum.json:
+        query = select(Price.company_ticker, Price.market_date, Price.close, Price.currency).where(*filters)
+        return stream_rows(after_cursor(query, keys, cursor), format)
+    if fast:
+        columns = schema_columns(Price, PriceSchema)
+        rows = await get_page(session, select(*columns).where(*filters), keys, cursor, limit, response)
+        return json_response(dump_rows(rows, columns), response)
+    return await get_page(session, select(Price).where(*filters), keys, cursor, limit, response)
 
 @router.post("/add", response_model=PriceSchema, status_code=201, responses={k: responses[k] for k in [201, 400, 422]})
 async def add_price(price: PriceSchema, session: AsyncSession = Depends(get_async_session)):
     """
     Add a new price.
     """
-    new_price = Price(**price.model_dump())
-    session.add(new_price)
+    await price_partitions.ensure([price.market_date.year])
     try:
+        new_price = await session.scalar(insert(Price).values(**price.model_dump()).returning(Price))
+        await update_rollups(session, [new_price.company_ticker], new_price.market_date, new_price.market_date)
         await session.commit()
     except IntegrityError:
         raise HTTPException(status_code=400, detail="Price could not be added")
-    await session.refresh(new_price)
+    latest_prices.written(new_price.company_ticker, new_price.market_date, new_price.close, new_price.currency)
+    await price_store.mark([new_price.market_date])
     return new_price
 
+@router.post("/ingest", response_model=IngestionReportSchema, status_code=201, responses={k: responses[k] for k in [201, 422]})
+async def ingest_prices(ingestion: IngestionSchema, session: AsyncSession = Depends(get_async_session)):
+    """
+    Ingest the daily price history of a list of tickers from the market data provider.
+    Rows already stored are left untouched and tickers that are not companies are skipped.
+    """
+    return await ingest_from_provider(ingestion.tickers, session, ingestion.start, ingestion.end, ingestion.batch_size)
+
+@router.post("/ingest/async", response_model=JobSchema, status_code=202, responses={k: responses[k] for k in [422]})
+async def ingest_prices_async(ingestion: IngestionSchema):
+    """
+    Ingest the daily price history of a list of tickers in a background job.
+    The progress and the final report are available at /jobs/{job_id}.
+    """
+    async def run(session: AsyncSession, progress: Progress) -> dict:
+        async def report_progress(report: IngestionReportSchema):
+            await progress(report.rows_read, report.errors)
+
+        report = await ingest_from_provider(ingestion.tickers, session, ingestion.start, ingestion.end, ingestion.batch_size, progress=report_progress)
+        return report.model_dump(mode="json")
+
+    return await job_queue.submit("prices_ingest", run)
+
+@router.post("/refresh", response_model=IngestionReportSchema, responses={k: responses[k] for k in [200, 422]})
+async def refresh_all_prices(session: AsyncSession = Depends(get_async_session)):
+    """
+    Fetch the days missing since the last stored price of every company.
+    """
+    return await refresh_prices(session)
+
+@router.get("/cache", response_model=PriceCacheStatsSchema, responses={k: responses[k] for k in [200]})
+async def get_price_cache_stats():
+    """
+    Get the size and the hit/miss counters of the latest price cache.
+    """
+    return latest_prices.stats()
+
+@router.delete("/cache", response_model=PriceCacheStatsSchema, responses={k: responses[k] for k in [200]})
+async def clear_price_cache():
+    """
+    Drop every entry of the latest price cache, needed after prices are written directly on the database.
+    """
+    latest_prices.invalidate()
+    return latest_prices.stats()
+
+@router.get("/range", response_model=list[PriceSeriesSchema], responses={
+    **{k: responses[k] for k in [200, 422]}, 200: {"description": "Price series found", "content": {ARROW_MEDIA_TYPE: {}}}
+})
+async def get_price_series(
+    tickers: list[str] = Query(..., min_length=1, max_length=100),
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    freq: FrequencyEnum = FrequencyEnum.daily,
+    format: SeriesFormatEnum = SeriesFormatEnum.json,
+    session: AsyncSession = Depends(get_read_session)
+):
+    """
+    Get the price history of several companies between start and end as columnar arrays or as an Arrow IPC stream.
+    Weekly and monthly series are read from the rollups, with the first, highest, lowest and mean close of each period.
+    """
+    series = await load_series(session, tickers, start, end, freq)
+    items = [series[ticker] for ticker in dict.fromkeys(tickers) if ticker in series]
+    return series_arrow(items) if format == SeriesFormatEnum.arrow else series_json(items)
+
+@router.get("/{company_ticker}", response_model=PriceSeriesSchema, responses={
+    **{k: responses[k] for k in [200, 404, 422]}, 200: {"description": "Price series found", "content": {ARROW_MEDIA_TYPE: {}}}
+})
+async def get_company_price_series(
+    company_ticker: str,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    freq: FrequencyEnum = FrequencyEnum.daily,
+    format: SeriesFormatEnum = SeriesFormatEnum.json,
+    session: AsyncSession = Depends(get_read_session)
+):
+    """
+    Get the price history of a company between start and end as columnar arrays or as an Arrow IPC stream.
+    Weekly and monthly series are read from the rollups, with the first, highest, lowest and mean close of each period.
+    """
+    series = await load_series(session, [company_ticker], start, end, freq)
+    if company_ticker not in series:
+        raise HTTPException(status_code=404, detail="Price not found")
+    if format == SeriesFormatEnum.arrow:
+        return series_arrow([series[company_ticker]])
+    return series_json(series[company_ticker])
+
 @router.get("/{company_ticker}/{market_date}", response_model=PriceSchema, responses={k: responses[k] for k in [200, 404, 422]})
-async def get_price(company_ticker: str, market_date: date, session: AsyncSession = Depends(get_async_session)):
+async def get_price(company_ticker: str, market_date: date, session: AsyncSession = Depends(get_read_session)):
     """
     Get a price by company ticker and market_date.
     """
@@ -50,15 +173,17 @@ async def update_price(company_ticker: str, market_date: date, price: PriceSchem
     """
     Update a price by company ticker and market_date.
     """
-    result = await get_or_404(Price, session, (company_ticker, market_date))    
-    for key, value in price.model_dump().items():
-        if value is not None:
-            setattr(result, key, value)
-    try: 
+    values = {key: value for key, value in price.model_dump().items() if value is not None}
+    try:
+        result = await update_or_404(Price, session, (company_ticker, market_date), values)
+        await update_rollups(session, [company_ticker], market_date, market_date)
+        await update_rollups(session, [result.company_ticker], result.market_date, result.market_date)
         await session.commit()
     except IntegrityError:
         raise HTTPException(status_code=400, detail="Price could not be updated")
-    await session.refresh(result)
+    latest_prices.deleted(company_ticker, market_date)
+    latest_prices.written(result.company_ticker, result.market_date, result.close, result.currency)
+    await price_store.mark([market_date, result.market_date])
     return result
 
 @router.delete("/{company_ticker}/{market_date}", response_model=PriceSchema, responses={k: responses[k] for k in [200, 404, 422]})
@@ -68,5 +193,9 @@ async def delete_price(company_ticker: str, market_date: date, session: AsyncSes
     """
     result = await get_or_404(Price, session, (company_ticker, market_date))
     await session.delete(result)
+    await session.flush()
+    await update_rollups(session, [company_ticker], market_date, market_date)
     await session.commit()
+    latest_prices.deleted(company_ticker, market_date)
+    await price_store.mark([market_date])
     return result
@@ -1,7 +1,8 @@
 from pydantic import Field
 from typing import Optional
 from datetime import date
-from src.schemas import CustomModel
+from enum import Enum as pyEnum
+from src.schemas import CustomModel, FrequencyEnum
 from src.prices.models import CurrencyEnum
 
 class PriceSchema(CustomModel):
@@ -21,3 +22,52 @@ class PriceUpdateSchema(CustomModel):
     market_date: Optional[date] = Field(None, description="Date of the price")
     close: Optional[float] = Field(None, description="Close price", gt=0)
     currency: Optional[CurrencyEnum]
+
+class SeriesFormatEnum(str, pyEnum):
+    json = "json"
+    arrow = "arrow"
+
+class PriceSeriesSchema(CustomModel):
+    """
+    Schema for the price history of a company as columnar arrays.
+    """
+    company_ticker: str = Field(..., description="Ticker of the company")
+    currency: CurrencyEnum
+    freq: FrequencyEnum = Field(FrequencyEnum.daily, description="Frequency of the series")
+    dates: list[date] = Field(..., description="Market dates in ascending order, the date of the last close of each period for weekly and monthly series")
+    close: list[float] = Field(..., description="Close price of each market date")
+    open: Optional[list[float]] = Field(None, description="First close of each period, weekly and monthly series only")
+    high: Optional[list[float]] = Field(None, description="Highest close of each period, weekly and monthly series only")
+    low: Optional[list[float]] = Field(None, description="Lowest close of each period, weekly and monthly series only")
+    mean: Optional[list[float]] = Field(None, description="Mean close of each period, weekly and monthly series only")
+
+class PriceCacheStatsSchema(CustomModel):
+    """
+    Schema for the statistics of the latest price cache.
+    """
+    size: int = Field(..., description="Tickers currently cached")
+    max_size: int = Field(..., description="Tickers cached before the least recently used ones are evicted")
+    hits: int = Field(..., description="Lookups answered from the cache")
+    misses: int = Field(..., description="Lookups that needed a query")
+    evictions: int = Field(..., description="Tickers evicted to make room")
+    hit_rate: float = Field(..., description="Share of the lookups answered from the cache")
+
+class IngestionSchema(CustomModel):
+    """
+    Schema for a price history ingestion request.
+    """
+    tickers: list[str] = Field(..., description="Tickers to ingest", min_length=1)
+    start: Optional[date] = Field(None, description="First date of the history, defaults to the price_history_start setting")
+    end: Optional[date] = Field(None, description="Last date of the history, defaults to today")
+    batch_size: int = Field(50, description="Number of tickers fetched with a single provider call", gt=0, le=500)
+
+class IngestionReportSchema(CustomModel):
+    """
+    Schema for the report of a price history ingestion.
+    """
+    rows_read: int = Field(0, description="Rows received from the source")
+    rows_written: int = Field(0, description="Rows inserted or updated in the prices table")
+    rows_skipped: int = Field(0, description="Invalid rows, rows of unknown companies and rows already stored")
+    seconds: float = Field(0, description="Duration of the ingestion")
+    rows_per_second: float = Field(0, description="Rows read per second")
+    errors: list[str] = Field([], description="Errors of the tickers that could not be ingested")
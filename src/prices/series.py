@@ -0,0 +1,99 @@
+"""
+Columnar price series: the closes of a date range are read as plain tuples through the
+(company_ticker, market_date) primary key and returned as flat arrays instead of ORM objects.
+Weekly and monthly series are read from the rollups, one row per period.
+"""
+from datetime import date
+from typing import Optional
+import orjson
+import pyarrow as pa
+from fastapi import Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.prices.models import Price, PriceRollup
+from src.prices.rollups import rollup_for
+from src.schemas import FrequencyEnum
+
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+ROLLUP_COLUMNS = ["open", "high", "low", "mean"]
+
+
+async def load_series(
+    session: AsyncSession, tickers: list[str], start: Optional[date], end: Optional[date], freq: FrequencyEnum = FrequencyEnum.daily
+) -> dict[str, dict]:
+    """
+    Load the closes of the tickers between start and end, both included.
+    Returns the currency, dates and closes of every ticker with at least one price.
+    """
+    rollup = rollup_for(freq)
+    if rollup is not None:
+        return await load_rollup_series(session, tickers, start, end, rollup)
+    query = select(Price.company_ticker, Price.market_date, Price.close, Price.currency).where(Price.company_ticker.in_(tickers))
+    if start is not None:
+        query = query.where(Price.market_date >= start)
+    if end is not None:
+        query = query.where(Price.market_date <= end)
+    result = await session.execute(query.order_by(Price.company_ticker, Price.market_date))
+    series = {}
+    for company_ticker, market_date, close, currency in result.tuples():
+        if company_ticker not in series:
+            series[company_ticker] = {"company_ticker": company_ticker, "currency": currency.value, "freq": freq.value, "dates": [], "close": []}
+        series[company_ticker]["dates"].append(market_date)
+        series[company_ticker]["close"].append(close)
+    return series
+
+
+async def load_rollup_series(session: AsyncSession, tickers: list[str], start: Optional[date], end: Optional[date], freq: FrequencyEnum) -> dict[str, dict]:
+    """
+    Load the rollups of the periods whose last close is between start and end. The date of a
+    period is the date of its last close and its currency the currency of that close.
+    """
+    columns = [getattr(PriceRollup, column) for column in ROLLUP_COLUMNS]
+    query = (
+        select(PriceRollup.company_ticker, PriceRollup.last_date, PriceRollup.close, PriceRollup.currency, *columns)
+        .where(PriceRollup.freq == freq, PriceRollup.company_ticker.in_(tickers))
+    )
+    if start is not None:
+        query = query.where(PriceRollup.last_date >= start)
+    if end is not None:
+        query = query.where(PriceRollup.period_start <= end, PriceRollup.last_date <= end)
+    result = await session.execute(query.order_by(PriceRollup.company_ticker, PriceRollup.period_start))
+    series = {}
+    for company_ticker, last_date, close, currency, *values in result.tuples():
+        if company_ticker not in series:
+            series[company_ticker] = {
+                "company_ticker": company_ticker, "currency": currency.value, "freq": freq.value,
+                "dates": [], "close": [], **{column: [] for column in ROLLUP_COLUMNS}
+            }
+        item = series[company_ticker]
+        item["dates"].append(last_date)
+        item["close"].append(close)
+        for column, value in zip(ROLLUP_COLUMNS, values):
+            item[column].append(value)
+    return series
+
+
+def series_json(series: dict | list[dict]) -> Response:
+    # the arrays are already in their final shape, validating them again through the response model would only cost time
+    return Response(orjson.dumps(series), media_type="application/json")
+
+
+def series_arrow(series: list[dict]) -> Response:
+    """
+    Serialize the series as one Arrow IPC stream with a row per close.
+    """
+    indices = pa.array([i for i, item in enumerate(series) for _ in item["dates"]], pa.int32())
+    table = pa.table({
+        "company_ticker": pa.DictionaryArray.from_arrays(indices, pa.array([item["company_ticker"] for item in series], pa.string())),
+        "market_date": pa.array([market_date for item in series for market_date in item["dates"]], pa.date32()),
+        "close": pa.array([close for item in series for close in item["close"]], pa.float64()),
+        "currency": pa.array([item["currency"] for item in series], pa.string()).take(indices).dictionary_encode(),
+        **{
+            column: pa.array([value for item in series for value in item[column]], pa.float64())
+            for column in ROLLUP_COLUMNS if series and column in series[0]
+        }
+    })
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as stream:
+        stream.write_table(table)
+    return Response(sink.getvalue().to_pybytes(), media_type=ARROW_MEDIA_TYPE)
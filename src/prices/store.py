@@ -0,0 +1,290 @@
+"""
+Local columnar mirror of the prices table for the analytics, so that their large scans do not
+load the database. Every year is stored under year=YYYY/ as a zstd Parquet file, for the
+tools reading the dataset, and as an uncompressed Arrow IPC file that is memory mapped:
+its columns are read as NumPy arrays without copy.
+Every price write bumps the shared version of its year in the cache_versions table, and each
+year of the store records the versions it was written at: a read first rewrites the years whose
+versions changed, whichever process or CLI wrote the prices. The ingestion syncs the years it
+wrote when it ends.
+
+    python -m src.prices.store --sync
+    python -m src.prices.store --sync --years 2023 2024
+"""
+import json
+import os
+import threading
+from argparse import ArgumentParser
+from asyncio import run, to_thread
+from datetime import date, datetime, timezone
+from io import BytesIO
+from pathlib import Path
+from typing import Iterable, Optional
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from pandas import DataFrame, concat
+from pyarrow import csv
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.config import settings
+from src.database import async_session_maker, engine
+from src.prices.models import Price
+from src.response_cache import response_cache
+
+SCHEMA = pa.schema([
+    ("company_ticker", pa.dictionary(pa.int32(), pa.string())),
+    ("market_date", pa.date32()),
+    ("close", pa.float64()),
+    ("currency", pa.dictionary(pa.int32(), pa.string()))
+])
+# bumped by the writes that can touch every year, like a change of ticker
+ALL_YEARS = "prices:all"
+COPY_QUERY = (
+    "SELECT company_ticker, market_date, close, currency FROM prices "
+    "WHERE market_date >= $1 AND market_date < $2 ORDER BY company_ticker, market_date"
+)
+
+
+def year_version(year: int) -> str:
+    return f"prices:{year}"
+
+
+def replace_file(path: Path, write):
+    # readers keep the mapping of the previous file until they release it,
+    # processes and threads syncing the same year at once each write their own temporary file
+    temporary = path.with_suffix(f"{path.suffix}.{os.getpid()}.{threading.get_ident()}.tmp")
+    write(temporary)
+    os.replace(temporary, path)
+
+
+class PriceStore:
+    def __init__(self, path: Optional[str]):
+        self.path = Path(path) if path is not None else None
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    @property
+    def ready(self) -> bool:
+        """
+        Whether a full sync was made, before that the analytics read the database.
+        """
+        return self.enabled and (self.path / "manifest.json").exists()
+
+    def year_path(self, year: int) -> Path:
+        return self.path / f"year={year}"
+
+    def years(self) -> list[int]:
+        return sorted(int(path.name.removeprefix("year=")) for path in self.path.glob("year=*") if (path / "prices.arrow").exists())
+
+    async def mark(self, dates: Iterable[date]):
+        """
+        Record committed writes of prices on the dates, their years are synced by the next sync or read
+        of every process. Also bumps the version of the prices.
+        """
+        years = sorted({market_date.year for market_date in dates})
+        await response_cache.bump("prices", *(year_version(year) for year in years))
+
+    async def versions(self, session: AsyncSession, years: Iterable[int]) -> dict[int, list[int]]:
+        """
+        Current versions of the years, read through the session the prices are read from.
+        """
+        years = sorted(set(years))
+        versions = await response_cache.versions(session, [ALL_YEARS, *(year_version(year) for year in years)])
+        return {year: [versions[year_version(year)], versions[ALL_YEARS]] for year in years}
+
+    def written_version(self, year: int) -> Optional[list[int]]:
+        try:
+            return json.loads((self.year_path(year) / "version.json").read_text())
+        except FileNotFoundError:
+            return None
+
+    async def load_year(self, session: AsyncSession, year: int) -> bytes:
+        """
+        Read the prices of a year with COPY as CSV, sorted by ticker and date.
+        """
+        connection = await session.connection()
+        raw_connection = await connection.get_raw_connection()
+        buffer = BytesIO()
+        await raw_connection.driver_connection.copy_from_query(COPY_QUERY, date(year, 1, 1), date(year + 1, 1, 1), output=buffer, format="csv")
+        return buffer.getvalue()
+
+    @staticmethod
+    def parse_year(data: bytes) -> pa.Table:
+        # a year without rows has an empty CSV, which the reader rejects
+        if not data:
+            return SCHEMA.empty_table()
+        table = csv.read_csv(
+            pa.BufferReader(data),
+            read_options=csv.ReadOptions(column_names=SCHEMA.names),
+            convert_options=csv.ConvertOptions(column_types={field.name: field.type.value_type if pa.types.is_dictionary(field.type) else field.type for field in SCHEMA})
+        )
+        return table.cast(SCHEMA).combine_chunks()
+
+    def save_year(self, year: int, data: bytes, version: list[int]):
+        """
+        Parse the CSV of a year and write its files and its version, run in a thread.
+        """
+        self.write_year(year, self.parse_year(data))
+        self.year_path(year).mkdir(parents=True, exist_ok=True)
+        replace_file(self.year_path(year) / "version.json", lambda path: path.write_text(json.dumps(version)))
+
+    def write_year(self, year: int, table: pa.Table):
+        directory = self.year_path(year)
+        if table.num_rows == 0:
+            for name in ["prices.arrow", "prices.parquet"]:
+                (directory / name).unlink(missing_ok=True)
+            return
+        directory.mkdir(parents=True, exist_ok=True)
+
+        def write_arrow(path: Path):
+            with pa.OSFile(str(path), "wb") as sink, pa.ipc.new_file(sink, SCHEMA) as writer:
+                writer.write_table(table, max_chunksize=table.num_rows)
+
+        replace_file(directory / "prices.arrow", write_arrow)
+        replace_file(directory / "prices.parquet", lambda path: pq.write_table(table, path, compression="zstd"))
+
+    async def sync(self, session: AsyncSession, years: Iterable[int], force: bool = False) -> list[int]:
+        """
+        Rewrite the given years whose versions changed since they were written, or all of them with force.
+        Only the COPY runs on the event loop, the parsing and the writes run in a thread.
+        Returns the years written.
+        """
+        if not self.enabled:
+            return []
+        versions = await self.versions(session, years)
+        # the versions are read before the prices, a write in between is synced again by the next read
+        stale = {year: version for year, version in versions.items() if force or self.written_version(year) != version}
+        for year, version in stale.items():
+            await to_thread(self.save_year, year, await self.load_year(session, year), version)
+        return list(stale)
+
+    async def sync_all(self, session: AsyncSession) -> list[int]:
+        """
+        Rewrite every year of the prices table and drop the years it does not have anymore.
+        """
+        first, last = (await session.execute(select(func.min(Price.market_date), func.max(Price.market_date)))).one()
+        years = set(range(first.year, last.year + 1)) if first is not None else set()
+        written = await self.sync(session, years | set(self.years()), force=True)
+        self.path.mkdir(parents=True, exist_ok=True)
+        replace_file(self.path / "manifest.json", lambda path: path.write_text(json.dumps({
+            "synced_at": datetime.now(timezone.utc).isoformat(), "years": sorted(years)
+        })))
+        return written
+
+    def read_year(self, year: int) -> pa.Table:
+        with pa.memory_map(str(self.year_path(year) / "prices.arrow")) as source:
+            return pa.ipc.open_file(source).read_all()
+
+    async def table(self, session: AsyncSession, start: date, end: date, tickers: Optional[list[str]] = None) -> pa.Table:
+        """
+        Memory mapped prices between start and end, of the given tickers or of every ticker.
+        The unfiltered columns of a single year are NumPy views of the mapped file.
+        """
+        await self.sync(session, range(start.year, end.year + 1))
+        tables = [self.read_year(year) for year in self.years() if start.year <= year <= end.year]
+        if not tables:
+            return SCHEMA.empty_table()
+        table = tables[0] if len(tables) == 1 else pa.concat_tables(tables)
+        if start > date(start.year, 1, 1) or end < date(end.year, 12, 31):
+            dates = table["market_date"]
+            table = table.filter(pc.and_(pc.greater_equal(dates, pa.scalar(start, pa.date32())), pc.less_equal(dates, pa.scalar(end, pa.date32()))))
+        if tickers is not None:
+            table = table.filter(pc.is_in(table["company_ticker"], value_set=pa.array(tickers, pa.string())))
+        return table
+
+    async def arrays(self, session: AsyncSession, start: date, end: date, tickers: Optional[list[str]] = None) -> dict[str, np.ndarray]:
+        """
+        Columns of the prices between start and end as NumPy arrays: the names of the tickers and,
+        for every row, the index of its ticker in the names, its datetime64[D] date, its close and
+        its currency. The indexes and the closes of a single unfiltered year are views of the mapped file.
+        """
+        table = (await self.table(session, start, end, tickers)).unify_dictionaries()
+        ticker_chunks = table["company_ticker"].chunks
+        return {
+            "names": np.asarray(ticker_chunks[0].dictionary.to_pylist() if ticker_chunks else [], dtype=object),
+            "codes": column_numpy([chunk.indices for chunk in ticker_chunks], np.int32),
+            "market_date": column_numpy(table["market_date"].chunks, "datetime64[D]"),
+            "close": column_numpy(table["close"].chunks, np.float64),
+            "currency": table["currency"].to_numpy().astype(object) if table.num_rows else np.empty(0, object)
+        }
+
+    async def last_closes(self, session: AsyncSession, tickers: list[str], before_year: int) -> DataFrame:
+        """
+        Last close of each ticker in the years before before_year, read from the latest year backwards
+        until every ticker is found.
+        """
+        years = [year for year in self.years() if year < before_year]
+        await self.sync(session, years)
+        found, missing = [], set(tickers)
+        for year in sorted(set(self.years()) & set(years), reverse=True):
+            table = self.read_year(year)
+            table = table.filter(pc.is_in(table["company_ticker"], value_set=pa.array(sorted(missing), pa.string())))
+            if table.num_rows:
+                # the rows of a year are sorted by ticker and date
+                last = table.to_pandas().drop_duplicates("company_ticker", keep="last")
+                found.append(last)
+                missing -= set(last["company_ticker"])
+            if not missing:
+                break
+        return concat(found, ignore_index=True) if found else DataFrame(columns=SCHEMA.names)
+
+    async def closes(self, session: AsyncSession, tickers: list[str], start: date, end: date) -> DataFrame:
+        """
+        Closes of the tickers between start and end, plus the last close of each ticker before start,
+        with the columns of src.portfolios.valuation.load_closes.
+        """
+        columns = await self.arrays(session, date(start.year - 1, 1, 1), end, tickers)
+        closes = DataFrame({
+            "market_date": columns["market_date"],
+            "company_ticker": columns["names"][columns["codes"]],
+            "close": columns["close"],
+            "currency": columns["currency"]
+        })
+        before = columns["market_date"] < np.datetime64(start, "D")
+        last_before = closes[before].sort_values(["company_ticker", "market_date"], kind="stable").drop_duplicates("company_ticker", keep="last")
+        missing = sorted(set(tickers) - set(last_before["company_ticker"]))
+        parts = [closes[~before], last_before]
+        if missing:
+            # tickers without close in the year before start, like the illiquid or delisted ones
+            earlier = await self.last_closes(session, missing, start.year - 1)
+            if not earlier.empty:
+                parts.append(DataFrame({
+                    "market_date": earlier["market_date"].to_numpy("datetime64[D]"),
+                    "company_ticker": earlier["company_ticker"].astype(object),
+                    "close": earlier["close"].to_numpy(float),
+                    "currency": earlier["currency"].astype(object)
+                }))
+        return concat(parts, ignore_index=True)
+
+
+def column_numpy(chunks: list[pa.Array], dtype) -> np.ndarray:
+    """
+    Chunks of a column as one array, without copy when there is a single chunk without nulls.
+    """
+    if len(chunks) == 1 and chunks[0].null_count == 0 and not pa.types.is_date(chunks[0].type):
+        return chunks[0].to_numpy()
+    return np.concatenate([chunk.to_numpy(zero_copy_only=False) for chunk in chunks]).astype(dtype, copy=False) if chunks else np.empty(0, dtype)
+
+
+price_store = PriceStore(settings.price_store_path)
+
+
+async def main(years: Optional[list[int]]):
+    if not price_store.enabled:
+        raise SystemExit("The price_store_path setting is not set")
+    async with async_session_maker() as session:
+        written = await (price_store.sync(session, years) if years else price_store.sync_all(session))
+    await engine.dispose()
+    print(f"{len(written)} years written to {price_store.path}")
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Mirror the prices table into the local columnar store")
+    parser.add_argument("--sync", action="store_true", required=True)
+    parser.add_argument("--years", type=int, nargs="+", help="years to rewrite, every year by default")
+    args = parser.parse_args()
+    run(main(args.years))
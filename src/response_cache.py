@@ -0,0 +1,233 @@
+"""
+Response cache of the read-heavy GET routes. Every cached response depends on a set of tables
+whose version counters are bumped after every committed write, by the routes and by the CLIs:
+the ETag of a response is derived from the route, its parameters and the versions, so a
+matching If-None-Match gets a 304 after a single lookup of the versions and a cached body is
+served until one of its tables changes.
+The versions are kept in the cache_versions table, shared by every worker and CLI. Writes made
+directly on the database are only seen after a bump:
+
+    python -m src.response_cache --bump prices positions
+"""
+from argparse import ArgumentParser
+from asyncio import run
+from collections import OrderedDict
+from hashlib import sha1
+from secrets import token_hex
+from typing import Any, Awaitable, Callable, NamedTuple, Optional
+from fastapi import Request, Response
+from pydantic import TypeAdapter
+from sqlalchemy import BigInteger, String, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Mapped, mapped_column
+from src.config import settings
+from src.database import Base, async_session_maker, engine
+
+
+class CacheVersion(Base):
+    __tablename__ = "cache_versions"
+
+    table_name: Mapped[str] = mapped_column(String(50), primary_key=True)
+    version: Mapped[int] = mapped_column(BigInteger, nullable=False)
+
+
+class CachedResponse(NamedTuple):
+    etag: str
+    body: bytes
+    headers: dict[str, str]
+
+
+class CacheBackend:
+    """
+    Storage of the cached responses.
+    """
+    name = "base"
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        raise NotImplementedError
+
+    def set(self, key: str, response: CachedResponse):
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {}
+
+
+class MemoryBackend(CacheBackend):
+    """
+    Bounded in-memory LRU.
+    """
+    name = "memory"
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.entries: OrderedDict[str, CachedResponse] = OrderedDict()
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        response = self.entries.get(key)
+        if response is not None:
+            self.entries.move_to_end(key)
+        return response
+
+    def set(self, key: str, response: CachedResponse):
+        self.entries[key] = response
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {"size": len(self.entries), "max_size": self.max_size}
+
+
+class VersionStore:
+    """
+    Version counters of the tables. The epoch is part of the ETags, so that the ETags of
+    counters that restart from zero never match.
+    """
+    name = "base"
+    epoch = ""
+
+    async def get(self, session: AsyncSession, tables: list[str]) -> dict[str, int]:
+        raise NotImplementedError
+
+    async def bump(self, tables: list[str]):
+        raise NotImplementedError
+
+
+class MemoryVersions(VersionStore):
+    """
+    Counters of the process, only correct with a single process writing.
+    """
+    name = "memory"
+
+    def __init__(self):
+        self.versions: dict[str, int] = {}
+        self.epoch = token_hex(4)
+
+    async def get(self, session: AsyncSession, tables: list[str]) -> dict[str, int]:
+        return {table: self.versions.get(table, 0) for table in tables}
+
+    async def bump(self, tables: list[str]):
+        for table in tables:
+            self.versions[table] = self.versions.get(table, 0) + 1
+
+
+class DatabaseVersions(VersionStore):
+    """
+    Counters of the cache_versions table. They are read through the session of the request,
+    so a replica never returns versions newer than the rows it serves, and bumped on the primary
+    in their own transaction, right after the write they follow is committed.
+    """
+    name = "database"
+    epoch = "db"
+
+    async def get(self, session: AsyncSession, tables: list[str]) -> dict[str, int]:
+        result = await session.execute(select(CacheVersion.table_name, CacheVersion.version).where(CacheVersion.table_name.in_(tables)))
+        versions = dict(result.tuples().all())
+        return {table: versions.get(table, 0) for table in tables}
+
+    async def bump(self, tables: list[str]):
+        statement = insert(CacheVersion)
+        async with async_session_maker() as session:
+            # rows locked in table order, concurrent bumps of overlapping tables do not deadlock
+            await session.execute(
+                statement.on_conflict_do_update(index_elements=[CacheVersion.table_name], set_={"version": CacheVersion.version + 1}),
+                [{"table_name": table, "version": 1} for table in sorted(set(tables))]
+            )
+            await session.commit()
+
+
+def get_versions(name: str) -> VersionStore:
+    stores = {MemoryVersions.name: MemoryVersions, DatabaseVersions.name: DatabaseVersions}
+    if name not in stores:
+        raise ValueError(f"Unknown response cache version store: {name}")
+    return stores[name]()
+
+
+def get_backend(name: str) -> CacheBackend:
+    backends = {
+        MemoryBackend.name: lambda: MemoryBackend(settings.response_cache_size)
+    }
+    if name not in backends:
+        raise ValueError(f"Unknown response cache backend: {name}")
+    return backends[name]()
+
+
+class ResponseCache:
+    def __init__(self, backend: CacheBackend, versions: VersionStore):
+        self.backend = backend
+        self.version_store = versions
+        self.hits = 0
+        self.not_modified = 0
+        self.misses = 0
+        self.adapters: dict[Any, TypeAdapter] = {}
+
+    async def bump(self, *tables: str):
+        """
+        Record a committed write on the tables, the responses depending on them become stale.
+        """
+        await self.version_store.bump(list(tables))
+
+    async def versions(self, session: AsyncSession, tables: list[str]) -> dict[str, int]:
+        return await self.version_store.get(session, tables)
+
+    def etag(self, key: str, versions: dict[str, int]) -> str:
+        tags = ",".join(f"{table}:{version}" for table, version in versions.items())
+        return f'"{sha1(f"{self.version_store.epoch}|{key}|{tags}".encode()).hexdigest()[:20]}"'
+
+    def serialize(self, model: Any, content: Any) -> bytes:
+        if model not in self.adapters:
+            self.adapters[model] = TypeAdapter(model)
+        adapter = self.adapters[model]
+        return adapter.dump_json(adapter.validate_python(content, from_attributes=True))
+
+    async def respond(self, request: Request, session: AsyncSession, tables: list[str], model: Any, build: Callable[[Response], Awaitable[Any]]) -> Response:
+        """
+        Answer a GET request from the cache, or build its content, serialize it with model and cache it.
+        Without model, build returns the serialized body. build receives a response whose headers
+        are cached along with the body. The versions are read through the session build reads from.
+        """
+        key = f"{request.url.path}?{'&'.join(sorted(f'{name}={value}' for name, value in request.query_params.multi_items()))}"
+        etag = self.etag(key, await self.versions(session, tables))
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if etag in [tag.strip().removeprefix("W/") for tag in request.headers.get("if-none-match", "").split(",")]:
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        cached = self.backend.get(key)
+        if cached is not None and cached.etag == etag:
+            self.hits += 1
+            return Response(cached.body, media_type="application/json", headers={**cached.headers, **headers})
+        self.misses += 1
+        extra = Response()
+        content = await build(extra)
+        body = content if model is None else self.serialize(model, content)
+        extra_headers = {name: value for name, value in extra.headers.items() if name.lower() not in ("content-length", "content-type")}
+        # a write committed while building changed the versions, the next request builds again
+        self.backend.set(key, CachedResponse(etag, body, extra_headers))
+        return Response(body, media_type="application/json", headers={**extra_headers, **headers})
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "not_modified": self.not_modified,
+            "misses": self.misses,
+            "version_store": self.version_store.name,
+            **self.backend.stats()
+        }
+
+
+response_cache = ResponseCache(get_backend(settings.response_cache_backend), get_versions(settings.response_cache_versions))
+
+
+async def main(tables: list[str]):
+    await response_cache.bump(*tables)
+    await engine.dispose()
+    print(f"Bumped {', '.join(tables)}")
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Bump the cache versions of tables written directly on the database")
+    parser.add_argument("--bump", nargs="+", required=True, metavar="TABLE")
+    args = parser.parse_args()
+    run(main(args.bump))
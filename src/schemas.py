@@ -1,4 +1,33 @@
-from pydantic import BaseModel
+from enum import Enum as pyEnum
+from pydantic import BaseModel, Field
 
 class CustomModel(BaseModel):
-    pass
\ No newline at end of file
+    pass
+
+class FrequencyEnum(str, pyEnum):
+    daily = "D"
+    weekly = "W"
+    monthly = "M"
+
+    def to_pandas(self) -> str:
+        return {"D": "D", "W": "W", "M": "ME"}[self.value]
+
+class ListFormatEnum(str, pyEnum):
+    json = "json"
+    ndjson = "ndjson"
+    csv = "csv"
+
+class PoolStatsSchema(CustomModel):
+    """
+    Schema for the state of the connection pool of a database engine.
+    """
+    engine: str = Field(..., description="primary or replica")
+    size: int = Field(..., description="Connections kept open by the pool")
+    checked_in: int = Field(..., description="Idle connections")
+    checked_out: int = Field(..., description="Connections in use")
+    overflow: int = Field(..., description="Connections opened beyond the pool size")
+    max_overflow: int = Field(..., description="Connections allowed beyond the pool size")
+    checkouts: int = Field(..., description="Connections requested since the start")
+    timeouts: int = Field(..., description="Requests that failed waiting for a connection")
+    average_wait_seconds: float = Field(..., description="Average wait for a connection")
+    max_wait_seconds: float = Field(..., description="Longest wait for a connection")
@@ -1,6 +1,24 @@
-from fastapi import HTTPException
+from asyncio import to_thread
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as Base64Error
+from csv import writer
+from datetime import date
+from enum import Enum
+from json import dumps, loads
+from shutil import copyfileobj
+from tempfile import NamedTemporaryFile
+from typing import AsyncIterator, Iterator, Optional
+from fastapi import HTTPException, UploadFile, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from sqlalchemy import Select, tuple_, literal, inspect, update
 from sqlalchemy.ext.asyncio import AsyncSession
-from src.database import Base
+from sqlalchemy.orm import InstrumentedAttribute
+from src.database import Base, read_session_maker
+from src.prices.models import CurrencyEnum
+from src.schemas import ListFormatEnum
+import numpy as np
+import orjson
 import pandas as pd
 from io import StringIO
 
@@ -13,6 +31,19 @@ async def get_or_404(model, session: AsyncSession, pk):
         raise HTTPException(status_code=404, detail=f"{model.__name__} not found")
     return result
 
+async def update_or_404(model, session: AsyncSession, pk, values: dict):
+    """
+    Helper function to update an object by primary key with a single UPDATE ... RETURNING or raise a 404 error.
+    """
+    if not values:
+        return await get_or_404(model, session, pk)
+    pk = pk if isinstance(pk, tuple) else (pk,)
+    conditions = [column == value for column, value in zip(inspect(model).primary_key, pk)]
+    result = await session.scalar(update(model).where(*conditions).values(**values).returning(model))
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"{model.__name__} not found")
+    return result
+
 def get_responses(model: Base) -> dict:
     """
     Helper function to get the responses for a model.
@@ -34,3 +65,137 @@ def get_responses(model: Base) -> dict:
             "description": "Validation error"
         }
     }
+
+async def iterate_in_thread(iterator: Iterator) -> AsyncIterator:
+    """
+    Helper function to consume a blocking iterator without blocking the event loop.
+    """
+    while (item := await to_thread(next, iterator, None)) is not None:
+        yield item
+
+def map_currencies(currencies: pd.Series) -> pd.Series:
+    """
+    Helper function to map a column of currency codes or symbols to CurrencyEnum, NaN when unknown.
+    """
+    codes = {currency.value for currency in CurrencyEnum}
+    mapping = {}
+    for value in currencies.dropna().unique():
+        value_str = str(value).strip()
+        mapping[value] = CurrencyEnum(value_str) if value_str in codes else CurrencyEnum.symbol_to_currency(value_str)
+    return currencies.map(mapping)
+
+async def spool_upload(file: UploadFile) -> str:
+    """
+    Helper function to copy an upload to a temporary file that outlives the request.
+    The caller is responsible for removing it.
+    """
+    def copy() -> str:
+        with NamedTemporaryFile(delete=False, suffix=".upload") as spooled:
+            copyfileobj(file.file, spooled)
+            return spooled.name
+    return await to_thread(copy)
+
+def encode_cursor(values: list) -> str:
+    """
+    Helper function to encode the key of the last row of a page as an opaque cursor.
+    """
+    return urlsafe_b64encode(dumps(values, default=str).encode()).decode()
+
+def decode_cursor(cursor: str, keys: list[InstrumentedAttribute | type]) -> list:
+    """
+    Helper function to decode a cursor into values of the types of the keys, columns or Python types,
+    or raise a 400 error.
+    """
+    try:
+        values = loads(urlsafe_b64decode(cursor.encode()))
+        if not isinstance(values, list) or len(values) != len(keys):
+            raise ValueError
+        types = [key if isinstance(key, type) else key.type.python_type for key in keys]
+        return [date.fromisoformat(value) if python_type is date else python_type(value) for python_type, value in zip(types, values)]
+    except (ValueError, TypeError, Base64Error):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def after_cursor(query: Select, keys: list[InstrumentedAttribute], cursor: Optional[str]) -> Select:
+    """
+    Helper function to order a query by its keyset and start it after the cursor.
+    """
+    query = query.order_by(*keys)
+    if cursor:
+        values = decode_cursor(cursor, keys)
+        query = query.where(tuple_(*keys) > tuple_(*(literal(value, key.type) for key, value in zip(keys, values))))
+    return query
+
+async def get_page(session: AsyncSession, query: Select, keys: list[InstrumentedAttribute], cursor: Optional[str], limit: int, response: Response) -> list:
+    """
+    Helper function to get a page of a keyset paginated query.
+    The cursor of the next page is returned in the X-Next-Cursor header.
+    """
+    result = await session.execute(after_cursor(query, keys, cursor).limit(limit + 1))
+    # a query of a single model returns its objects, a query of columns returns the rows as tuples
+    entity = len(query.column_descriptions) == 1 and isinstance(query.column_descriptions[0]["expr"], type)
+    rows = result.scalars().fetchall() if entity else result.fetchall()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor([getattr(rows[-1], key.key) for key in keys])
+    return rows
+
+def schema_columns(model: Base, schema: type[BaseModel]) -> list[InstrumentedAttribute]:
+    """
+    Helper function to get the columns of a model that make up a schema, in the order of the schema fields.
+    """
+    return [getattr(model, field) for field in schema.model_fields]
+
+def dump_rows(rows: list, columns: list[InstrumentedAttribute]) -> bytes:
+    """
+    Helper function to serialize rows of tuples as a JSON list of objects with orjson,
+    without building and validating a model per row.
+    """
+    keys = [column.key for column in columns]
+    return orjson.dumps([dict(zip(keys, row)) for row in rows])
+
+def json_response(content: bytes, response: Optional[Response] = None) -> Response:
+    """
+    Helper function to send already serialized JSON, keeping the headers set on the route response.
+    """
+    headers = {} if response is None else {key: value for key, value in response.headers.items() if key.lower() not in ("content-length", "content-type")}
+    return Response(content, media_type="application/json", headers=headers)
+
+def stream_rows(query: Select, format: ListFormatEnum, batch_size: int = 1000) -> StreamingResponse:
+    """
+    Helper function to stream the rows of a query as NDJSON or CSV through a server side cursor.
+    The query runs in its own session because the request session is closed before the response is sent.
+    """
+    columns = [column.key for column in query.selected_columns]
+
+    async def body() -> AsyncIterator[str]:
+        async with read_session_maker() as session:
+            result = await session.stream(query.execution_options(yield_per=batch_size))
+            if format == ListFormatEnum.csv:
+                buffer = StringIO()
+                csv_writer = writer(buffer)
+                csv_writer.writerow(columns)
+                yield buffer.getvalue()
+            async for partition in result.partitions():
+                if format == ListFormatEnum.csv:
+                    buffer = StringIO()
+                    writer(buffer).writerows([value.value if isinstance(value, Enum) else value for value in row] for row in partition)
+                    yield buffer.getvalue()
+                else:
+                    yield "".join(dumps(dict(zip(columns, row)), default=str) + "\n" for row in partition)
+
+    media_type = "text/csv" if format == ListFormatEnum.csv else "application/x-ndjson"
+    return StreamingResponse(body(), media_type=media_type)
+
+def to_days(dates: pd.Series) -> np.ndarray:
+    """
+    Helper function to convert a series of dates to a datetime64[D] array.
+    """
+    return pd.to_datetime(dates).to_numpy("datetime64[D]")
+
+def forward_fill(matrix: np.ndarray) -> np.ndarray:
+    """
+    Helper function to forward fill the NaNs of a 2d array along the first axis.
+    """
+    rows = np.where(np.isnan(matrix), 0, np.arange(matrix.shape[0])[:, None])
+    np.maximum.accumulate(rows, axis=0, out=rows)
+    return matrix[rows, np.arange(matrix.shape[1])]
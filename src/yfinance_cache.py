@@ -1,13 +1,17 @@
+from pathlib import Path
 from requests import Session
 from requests_cache import CacheMixin, SQLiteCache
 from requests_ratelimiter import LimiterMixin, MemoryQueueBucket
 from pyrate_limiter import Duration, RequestRate, Limiter
+from src.config import settings
 
 class CachedLimiterSession(CacheMixin, LimiterMixin, Session):
    pass
 
+Path(settings.market_data_cache_path).parent.mkdir(parents=True, exist_ok=True)
+
 session = CachedLimiterSession(
    limiter=Limiter(RequestRate(10, Duration.SECOND)),  # max 2 requests per 5 seconds
    bucket_class=MemoryQueueBucket,
-   backend=SQLiteCache("yfinance.cache"),
+   backend=SQLiteCache(settings.market_data_cache_path),
 )
\ No newline at end of file
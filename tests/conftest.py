@@ -0,0 +1,8 @@
+import os
+
+# the tests only compute, the settings without default just need a value when there is no .env
+for name, value in {
+    "APP_NAME": "Portfolio monitor", "APP_VERSION": "test", "APP_DESCRIPTION": "test",
+    "DB_HOST": "localhost", "DB_PORT": "5432", "DB_NAME": "test", "DB_USER": "test", "DB_PASSWORD": "test"
+}.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+from benchmarks.backtest_sweep import synthetic_matrix, naive_backtest
+from src.analytics.backtest import Parameters, run_backtest
+from src.analytics.schemas import StrategyEnum
+from src.schemas import FrequencyEnum
+
+CAPITAL = 100_000.0
+PARAMETERS = [
+    Parameters(StrategyEnum.periodic, FrequencyEnum.daily, 0.05, 0.0),
+    Parameters(StrategyEnum.periodic, FrequencyEnum.monthly, 0.05, 10.0),
+    Parameters(StrategyEnum.periodic, FrequencyEnum.weekly, 0.05, 50.0),
+    Parameters(StrategyEnum.threshold, FrequencyEnum.monthly, 0.02, 10.0),
+    Parameters(StrategyEnum.threshold, FrequencyEnum.monthly, 0.2, 0.0)
+]
+
+
+@pytest.fixture(scope="module")
+def matrix():
+    return synthetic_matrix(3, 12)
+
+
+@pytest.mark.parametrize("parameters", PARAMETERS)
+def test_backtest_equals_naive_loop(matrix, parameters):
+    equity = run_backtest(matrix.dates, matrix.prices, parameters, CAPITAL).equity
+    assert np.allclose(equity, naive_backtest(matrix, parameters, CAPITAL))
+
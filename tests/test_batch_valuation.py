@@ -0,0 +1,31 @@
+import pytest
+from benchmarks.batch_valuation import synthetic_values, naive_valuation
+from src.portfolios.valuation import batch_valuation, page_by_value
+from src.prices.models import CurrencyEnum
+
+
+@pytest.fixture(scope="module")
+def data():
+    return synthetic_values(500, 20)
+
+
+@pytest.mark.parametrize("base", [CurrencyEnum.USD, CurrencyEnum.EUR])
+def test_batch_valuation_equals_loop(data, base):
+    names, values, rates = data
+    valuation = batch_valuation(names, values, rates, base).set_index("portfolio_id")
+    for portfolio_id, (day_change, unconverted) in naive_valuation(names, values, rates, base).items():
+        assert valuation["day_change"][portfolio_id] == pytest.approx(day_change)
+        assert valuation["unconverted_holdings"][portfolio_id] == unconverted
+
+
+@pytest.mark.parametrize("descending", [True, False])
+def test_pages_cover_every_portfolio_in_order(data, descending):
+    valuation = batch_valuation(*data, CurrencyEnum.EUR)
+    seen, after = [], None
+    while True:
+        page, after = page_by_value(valuation, descending, after, 37)
+        seen += page["portfolio_id"].tolist()
+        if after is None:
+            break
+    ordered = valuation.sort_values(["market_value", "portfolio_id"], ascending=[not descending, True])
+    assert seen == ordered["portfolio_id"].tolist()
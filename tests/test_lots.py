@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+from benchmarks.lot_matching import synthetic_transactions, naive_realized
+from src.holdings.lots import match_lots, realized_by_ticker
+from src.holdings.schemas import LotMethodEnum
+
+
+@pytest.fixture(scope="module")
+def transactions():
+    return synthetic_transactions(20_000, 20)
+
+
+@pytest.mark.parametrize("method", list(LotMethodEnum))
+def test_match_lots_equals_naive(transactions, method):
+    expected = naive_realized(transactions, method)
+    computed = realized_by_ticker(match_lots(transactions, method)).set_index("company_ticker")["realized_pnl"]
+    assert sorted(computed.index) == sorted(expected)
+    assert np.allclose([computed[ticker] for ticker in expected], list(expected.values()))
+
+
+@pytest.mark.parametrize("method", list(LotMethodEnum))
+def test_incremental_update_equals_full_match(transactions, method):
+    ledgers = match_lots(transactions, method)
+    edited = transactions.copy()
+    last_ticker = edited["company_ticker"].iloc[-1]
+    edited.loc[edited.index[edited["company_ticker"] == last_ticker][-50:], "price"] += 1.0
+    updated = realized_by_ticker(match_lots(edited, method, ledgers)).set_index("company_ticker")["realized_pnl"]
+    recomputed = realized_by_ticker(match_lots(edited, method)).set_index("company_ticker")["realized_pnl"]
+    assert np.allclose(updated, recomputed)